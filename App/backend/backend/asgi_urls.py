@@ -0,0 +1,45 @@
+from django.urls import path
+
+from adcs import views as adcs_views
+from backend import urls
+from cam import views as cam_views
+from com import views as com_views
+from eps import views as eps_views
+from obc import views as obc_views
+
+# URLconf of ASGI requests (see backend.middleware.AsgiUrlconfMiddleware): the
+# command and fetch routes go to the async views, everything else to the
+# synchronous ones of backend/urls.py.
+
+urlpatterns = [
+    path("obc/command", obc_views.obc_view_async, name="obc_view"),
+    path(
+        "obc/gettelem",
+        obc_views.fetch_obc_telemetry_command_data_async,
+        name="fetch_obc_telemetry_command_data",
+    ),
+    path(
+        "obc/getHk",
+        obc_views.fetch_obc_housekeeping_data_async,
+        name="fetch_obc_housekeeping_data",
+    ),
+    path("eps/command", eps_views.eps_view_async, name="eps_view"),
+    path(
+        "eps/aespa",
+        eps_views.fetch_visualization_data_async,
+        name="fetch_visualization_data",
+    ),
+    path("cam/command", cam_views.cam_view_async, name="cam_view"),
+    path("cam/getImages", cam_views.fetch_images_async, name="fetch_images"),
+    path("com/command", com_views.com_view_async, name="com_view"),
+    path("com/getRate", com_views.getRate_async, name="getRate"),
+    path("adcs/command", adcs_views.adcs_view_async, name="adcs_view"),
+    path(
+        "adcs/getOperational",
+        adcs_views.fetch_operational_async,
+        name="getOperational",
+    ),
+    path(
+        "adcs/getHousekeeping", adcs_views.fetch_telemetry_async, name="getHousekeeping"
+    ),
+] + urls.urlpatterns
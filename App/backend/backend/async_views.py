@@ -0,0 +1,95 @@
+import functools
+import logging
+
+from django.http import JsonResponse
+
+import codec
+from backend import relay, storage
+from backend.responses import CodecResponse
+from dashboard import command_queue
+
+# Async views for ASGI deployments, routed by backend/asgi_urls.py.
+#
+# Commands go to the relay over asyncio streams and database calls run on the
+# storage thread pool, so a command waiting for its acknowledgment holds no
+# thread and one process can keep thousands of them in flight. The fetch
+# views only read the database: they run whole on the storage thread pool.
+
+logger = logging.getLogger(__name__)
+
+
+# Async counterpart of the subsystem command views (obc_view, ...) for module
+# module_num. With require_dict, an acknowledgment that is not a document is
+# an error.
+def command_view(module_num, require_dict=False):
+    async def view(request):
+        if request.method != "POST":
+            return JsonResponse({"error": "Unsupported request method."}, status=405)
+
+        try:
+            # Parse the request data
+            request_data = codec.loads(request.body)
+            text_to_send = request_data.get("command", "default command")
+
+            # Validate the input data
+            if not text_to_send:
+                return JsonResponse({"error": "Invalid request data."}, status=400)
+
+            # Out of view: keep the command for the next pass
+            queued = await storage.run(command_queue.defer, module_num, text_to_send)
+            if queued is not None:
+                return CodecResponse(
+                    {"message": "Queued for the next pass", "queued": queued},
+                    status=202,
+                )
+
+            try:
+                acknowledgment_data = await relay.send_command_decoded_async(
+                    module_num, text_to_send
+                )
+                if require_dict and not isinstance(acknowledgment_data, dict):
+                    raise ValueError("Acknowledgment data is not a dictionary")
+            except ValueError as e:
+                if require_dict:
+                    return JsonResponse(
+                        {"error": f"Invalid acknowledgment format: {str(e)}"},
+                        status=500,
+                    )
+                return JsonResponse(
+                    {"error": "Invalid acknowledgment format."}, status=500
+                )
+
+            # Insert the acknowledgment data, tagged with its kind and time, into
+            # MongoDB
+            result = await storage.run(storage.store, module_num, acknowledgment_data)
+
+            # Return the server's acknowledgment to the frontend
+            if result:
+                return JsonResponse({"message": "Data inserted successfully"})
+            else:
+                return JsonResponse({"message": "Error during insertion"})
+
+        except codec.DecodeError as e:
+            logger.error(f"Error parsing request data: {str(e)}")
+            return JsonResponse({"error": "Invalid JSON data."}, status=400)
+        except OSError as e:
+            logger.error(f"Socket error: {str(e)}")
+            return JsonResponse(
+                {"error": "Error connecting to the server."}, status=500
+            )
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            return JsonResponse({"error": "An unexpected error occurred."}, status=500)
+
+    view.csrf_exempt = True
+    return view
+
+
+# Async wrapper running a synchronous (database-only) view on the storage
+# thread pool
+def offloaded(sync_view):
+    @functools.wraps(sync_view)
+    async def view(request):
+        return await storage.run(sync_view, request)
+
+    return view
@@ -0,0 +1,210 @@
+import base64
+import datetime
+import functools
+import hashlib
+
+from bson import ObjectId, json_util
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from backend import ingest, storage
+
+# Bounded reads of stored telemetry for the fetch views.
+#
+# A fetch returns one page of records: the newest ones matching the query
+# string, in chronological order, at most "limit" of them. The query string
+# takes
+#
+#   from    ISO 8601 time, only records at or after it
+#   to      ISO 8601 time, only records before it
+#   limit   page size, FETCH_DEFAULT_LIMIT by default, capped at FETCH_MAX_LIMIT
+#   cursor  the next_cursor of the previous page, to continue with older records
+#   since   the watermark of an earlier response, only records stored after it
+#
+# Records of one kind are read newest first on (ts, _id), a range scan of the
+# (kind, ts) index (backend/ingest.py), so the page is cut where the
+# database stops scanning, and only the projected fields are sent back by the
+# server. next_cursor is None on the last page.
+#
+# since and watermark go by the time records were stored (stored_at), not by
+# their ts, so a record stored late with an old ts still counts as new. The
+# watermark marks the last stored record of the kind, found with a
+# one-document probe of the (kind, stored_at) index before the page is read,
+# for the next poll to ask only for what was stored after it. Processes stamp
+# stored_at a little before their insert lands, so the watermark stays
+# FETCH_WATERMARK_LAG seconds behind the current time: a poll may return a
+# record stored within that lag again, but never skips one.
+#
+# Views decorated with conditional() also answer conditional GETs: the ETag
+# and Last-Modified of a page come from that same probe, so an unchanged page
+# costs the probe and a 304 instead of the query and the body.
+
+
+# Bad query string, answered with a 400
+class QueryError(ValueError):
+    pass
+
+
+# A from/to bound as a UTC datetime, like the stored ts; times without an
+# offset are UTC
+def parse_time(value):
+    try:
+        time = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"Invalid time: {value!r}")
+    return ingest.to_utc(time)
+
+
+def parse_limit(value):
+    if value is None:
+        return settings.FETCH_DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError(f"Invalid limit: {value!r}")
+    if limit < 1:
+        raise QueryError("limit must be at least 1")
+    return min(limit, settings.FETCH_MAX_LIMIT)
+
+
+# cursor: [ts, _id] of the last record of a page; since: [stored_at, _id]
+def encode_cursor(time, object_id):
+    return base64.urlsafe_b64encode(json_util.dumps([time, object_id]).encode())
+
+
+def decode_cursor(value, name="cursor"):
+    try:
+        time, object_id = json_util.loads(base64.urlsafe_b64decode(value.encode()))
+    except Exception:
+        raise QueryError(f"Invalid {name}")
+    return time, object_id
+
+
+# The collection holding the stored replies of the given kind from module
+# module_num, and the filter of the records the query string selects
+def query(request, module_num, kind):
+    params = request.GET
+    collection, selector = storage.telemetry(module_num, kind)
+    conditions = [selector]
+    bounds = {}
+    if params.get("from"):
+        bounds["$gte"] = parse_time(params["from"])
+    if params.get("to"):
+        bounds["$lt"] = parse_time(params["to"])
+    if bounds:
+        conditions.append({"ts": bounds})
+    if params.get("cursor"):
+        time, object_id = decode_cursor(params["cursor"])
+        conditions.append(
+            {
+                "$or": [
+                    {"ts": {"$lt": time}},
+                    {"ts": time, "_id": {"$lt": object_id}},
+                ]
+            }
+        )
+    if params.get("since"):
+        time, object_id = decode_cursor(params["since"], "since")
+        conditions.append(
+            {
+                "$or": [
+                    {"stored_at": {"$gt": time}},
+                    {"stored_at": time, "_id": {"$gt": object_id}},
+                ]
+            }
+        )
+    return collection, {"$and": conditions}
+
+
+# One page of the stored replies of the given kind from module module_num,
+# with only fields (dotted paths) returned. Returns the documents, oldest
+# first, and the next_cursor and watermark of the response.
+def page(request, module_num, kind, fields):
+    limit = parse_limit(request.GET.get("limit"))
+    collection, selected = query(request, module_num, kind)
+    # Probed first: whatever is stored meanwhile is newer than the watermark
+    last = newest(request, module_num, kind)
+
+    projection = dict.fromkeys(["ts", *fields], 1)
+    documents = list(
+        collection.find(selected, projection)
+        .sort([("ts", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1]["ts"], documents[-1]["_id"])
+        next_cursor = next_cursor.decode()
+    documents.reverse()
+    return documents, {
+        "next_cursor": next_cursor,
+        "watermark": watermark(request, last),
+    }
+
+
+# since of the next poll after the last stored record last: that record, or
+# FETCH_WATERMARK_LAG seconds ago when it was stored more recently
+def watermark(request, last):
+    if last is None:
+        return request.GET.get("since") or None
+    horizon = ingest.stored_now() - datetime.timedelta(
+        seconds=settings.FETCH_WATERMARK_LAG
+    )
+    stored_at = last.get("stored_at")
+    if stored_at is None or stored_at > horizon:
+        return encode_cursor(horizon, ObjectId("0" * 24)).decode()
+    return encode_cursor(stored_at, last["_id"]).decode()
+
+
+# (stored_at, _id) of the last stored record of the kind, whatever the query
+# string selects, or None; probed once per request, after the query string
+# is checked
+def newest(request, module_num, kind):
+    if not hasattr(request, "_history_newest"):
+        query(request, module_num, kind)
+        collection, selector = storage.telemetry(module_num, kind)
+        request._history_newest = collection.find_one(
+            selector, {"stored_at": 1}, sort=[("stored_at", -1), ("_id", -1)]
+        )
+    return request._history_newest
+
+
+# View decorator answering conditional GETs for a page of the stored replies
+# of the given kind from module module_num. Responses must be revalidated on
+# every use, so browsers poll with If-None-Match instead of caching them.
+def conditional(module_num, kind):
+    def etag(request):
+        try:
+            doc = newest(request, module_num, kind)
+        except QueryError:
+            return None  # the view answers with a 400
+        stored_at = doc and doc.get("stored_at")
+        key = f"{request.get_full_path()}|{stored_at}|{doc and doc['_id']}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def last_modified(request):
+        try:
+            doc = newest(request, module_num, kind)
+        except QueryError:
+            return None
+        if doc is None or doc.get("stored_at") is None:
+            return None
+        return doc["stored_at"].replace(tzinfo=datetime.timezone.utc)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(
+            view
+        )
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
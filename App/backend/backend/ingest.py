@@ -0,0 +1,209 @@
+import datetime
+
+from bson import ObjectId
+from django.conf import settings
+import pymongo
+
+from backend import relay
+
+# Stored form of the server's replies.
+#
+# A reply is kept as the server sent it, with four top-level fields added so
+# that every subsystem collection can be read through one index:
+#
+#   kind       the reply type: its single top-level key ("telemetry",
+#              "housekeeping_data", "transmit_config", ...); flat replies
+#              (EPS housekeeping) are named after a field only they carry
+#   subsystem  "obc", "cam", "com", "eps" or "adcs"
+#   ts         the reply's own timestamp as a BSON (UTC) datetime, or the
+#              time it was stored when it has none
+#   stored_at  the time it was stored, from stored_now()
+#
+# The fetch views select on (kind, ts), which the (kind, ts, _id) index of
+# each collection serves as a range scan in the order pages are read. Their
+# since watermarks and ETags follow stored_at instead, through the
+# (kind, stored_at, _id) index, so a reply stored late with an old ts is
+# still picked up by the next poll.
+#
+# With MONGODB_TIMESERIES on, the periodic telemetry (TIMESERIES_KINDS) goes
+# to one time-series collection instead, where MongoDB stores it compressed
+# in buckets per meta value: kind and subsystem move into the metaField
+# "meta", along with the ground station that received the reply.
+
+SUBSYSTEMS = {
+    1: "obc",
+    2: "cam",
+    3: "com",
+    4: "eps",
+    5: "adcs",
+}
+
+# Kind of the flat replies, by a field only that reply type carries
+FLAT_KINDS = {
+    "vbatt": "housekeeping_data",
+    "boot_count": "persistent_telemetry",
+}
+
+# Replies of the *_telem_* commands, stored as time series
+TIMESERIES_KINDS = {
+    "housekeeping_data",
+    "telemetry",
+    "command_data",
+    "telemetry_command_data",
+    "persistent_telemetry",
+}
+
+INDEX_NAME = "kind_ts"
+INDEX_KEYS = [
+    ("kind", pymongo.ASCENDING),
+    ("ts", pymongo.ASCENDING),
+    ("_id", pymongo.ASCENDING),
+]
+TIMESERIES_INDEX_KEYS = [
+    ("meta.subsystem", pymongo.ASCENDING),
+    ("meta.kind", pymongo.ASCENDING),
+    ("ts", pymongo.ASCENDING),
+]
+STORED_INDEX_NAME = "kind_stored_at"
+STORED_INDEX_KEYS = [
+    ("kind", pymongo.ASCENDING),
+    ("stored_at", pymongo.ASCENDING),
+    ("_id", pymongo.ASCENDING),
+]
+TIMESERIES_STORED_INDEX_KEYS = [
+    ("meta.subsystem", pymongo.ASCENDING),
+    ("meta.kind", pymongo.ASCENDING),
+    ("stored_at", pymongo.ASCENDING),
+]
+
+
+def kind_of(reply):
+    if len(reply) == 1:
+        key, value = next(iter(reply.items()))
+        if isinstance(value, dict):
+            return key
+    for field, kind in FLAT_KINDS.items():
+        if field in reply:
+            return kind
+    return "reply"
+
+
+# Timestamp of a reply as a naive UTC datetime, or None. The server writes
+# ISO 8601 strings, "Timestamp" or "timestamp", at the top level or in the
+# single nested document; times without an offset are taken as UTC.
+def timestamp_of(reply):
+    candidates = [reply]
+    if len(reply) == 1 and isinstance(next(iter(reply.values())), dict):
+        candidates.insert(0, next(iter(reply.values())))
+    for candidate in candidates:
+        for key in ("timestamp", "Timestamp"):
+            value = candidate.get(key)
+            if isinstance(value, datetime.datetime):
+                return to_utc(value)
+            if isinstance(value, str):
+                try:
+                    return to_utc(datetime.datetime.fromisoformat(value))
+                except ValueError:
+                    continue
+    return None
+
+
+# Naive UTC datetime truncated to BSON's millisecond precision
+def to_utc(time):
+    if time.tzinfo is not None:
+        time = time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return time.replace(microsecond=time.microsecond // 1000 * 1000)
+
+
+# Current time as a naive UTC datetime. Every process stamps stored_at from
+# the system clock, which hosts keep in step; the since watermarks lag behind
+# it (backend/history.py) for a document stamped just before another but
+# inserted after it.
+def stored_now():
+    return to_utc(datetime.datetime.now(datetime.timezone.utc))
+
+
+# The top-level fields added to a reply of module module_num
+def envelope(module_num, reply):
+    stored_at = stored_now()
+    return {
+        "kind": kind_of(reply),
+        "subsystem": SUBSYSTEMS[int(module_num)],
+        "ts": timestamp_of(reply) or stored_at,
+        "stored_at": stored_at,
+    }
+
+
+# stored_at of a document stored before it had one: the time its ObjectId was
+# generated
+def stored_at_of(doc):
+    if isinstance(doc.get("_id"), ObjectId):
+        return to_utc(doc["_id"].generation_time)
+    return stored_now()
+
+
+# The document stored for a reply of module module_num
+def document(module_num, reply):
+    if not isinstance(reply, dict):
+        raise TypeError("Acknowledgment is not a document")
+    return {**reply, **envelope(module_num, reply)}
+
+
+# Whether replies of kind are stored in the time-series collection
+def timeseries(kind):
+    return settings.MONGODB_TIMESERIES and kind in TIMESERIES_KINDS
+
+
+# Time-series form of a stored document: kind and subsystem in the metaField
+def timeseries_document(doc):
+    doc = dict(doc)
+    doc["meta"] = {
+        "subsystem": doc.pop("subsystem"),
+        "kind": doc.pop("kind"),
+        "station": relay.STATION_NUMBER,
+    }
+    return doc
+
+
+# Selector of the stored replies of kind from module module_num, in the
+# collection timeseries(kind) picks
+def selector(module_num, kind):
+    if timeseries(kind):
+        return {"meta.subsystem": SUBSYSTEMS[int(module_num)], "meta.kind": kind}
+    return {"kind": kind}
+
+
+# Create the (kind, ts) and (kind, stored_at) indexes of collection; a no-op
+# when they exist
+def ensure_index(collection):
+    collection.create_index(INDEX_KEYS, name=INDEX_NAME)
+    collection.create_index(STORED_INDEX_KEYS, name=STORED_INDEX_NAME)
+
+
+# Create the (subsystem, kind, ts) and (subsystem, kind, stored_at) indexes of
+# the time-series collection
+def ensure_timeseries_index(collection):
+    collection.create_index(TIMESERIES_INDEX_KEYS, name=INDEX_NAME)
+    collection.create_index(TIMESERIES_STORED_INDEX_KEYS, name=STORED_INDEX_NAME)
+
+
+# Add the envelope, or only stored_at, to the documents of collection stored
+# before they existed, batch_size at a time; returns how many were updated
+def backfill(collection, module_num, batch_size=1000):
+    updated = 0
+    batch = []
+    query = {"$or": [{"kind": {"$exists": False}}, {"stored_at": {"$exists": False}}]}
+    for doc in collection.find(query):
+        if "kind" in doc:
+            fields = {}
+        else:
+            raw = {key: value for key, value in doc.items() if key != "_id"}
+            fields = envelope(module_num, raw)
+        fields["stored_at"] = stored_at_of(doc)
+        batch.append(pymongo.UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    return updated
@@ -0,0 +1,65 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse, JsonResponse
+
+import metrics
+
+# Request metrics of the Django tier: one series per view, labelled with its
+# URL route (the same under WSGI and ASGI, and unique where URL names are
+# not), and one per command sent on to the relay (recorded in
+# backend/relay.py)
+view_metrics = metrics.Metrics("tmtc_views", ("view",))
+command_metrics = metrics.Metrics("tmtc_views_relay", ("module", "command"))
+
+
+# Times every request; 5xx responses and exceptions count as errors. Runs
+# natively under ASGI as well, so async views are not pushed onto a thread.
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self.record(request, start, response)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            self.record(request, start, response)
+
+    def record(self, request, start, response):
+        match = request.resolver_match
+        view_metrics.record(
+            (match.route if match else "unresolved",),
+            time.perf_counter() - start,
+            response is None or response.status_code >= 500,
+        )
+
+
+# GET /metrics: Prometheus text, or JSON with ?format=json
+def metrics_view(request):
+    if request.GET.get("format") == "json":
+        return JsonResponse(
+            {"views": view_metrics.snapshot(), "commands": command_metrics.snapshot()}
+        )
+    return HttpResponse(
+        view_metrics.to_text() + command_metrics.to_text(),
+        content_type="text/plain; version=0.0.4",
+    )
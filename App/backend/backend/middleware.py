@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.deprecation import MiddlewareMixin
+
+
+# Route requests served through ASGI (backend/asgi.py) with the async views of
+# settings.ASGI_URLCONF; WSGI requests keep ROOT_URLCONF
+class AsgiUrlconfMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        if isinstance(request, ASGIRequest):
+            request.urlconf = settings.ASGI_URLCONF
@@ -0,0 +1,404 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+import framing
+import hk_schema
+import singleflight
+import uplink
+from backend.instrumentation import command_metrics
+
+STATION_NUMBER = 10
+
+logger = logging.getLogger(__name__)
+
+# Housekeeping of every subsystem as (module, command) pairs, for send_batch
+HK_SWEEP = [
+    (1, "obc_telem_hk_get_cb"),
+    (2, "cam_telem_hk_get_cb"),
+    (3, "com_telem_hk_get_cb"),
+    (4, "eps_telem_hk_get_cb"),
+    (5, "adcs_telem_hk_get_cb"),
+]
+
+
+# Pool of framed connections to the relay shared by every view in the
+# process. Concurrent commands are pipelined over the connection with the
+# fewest requests in flight instead of opening a socket each. A background
+# thread pings connections that have been idle for a while and reopens the
+# ones that failed, backing off exponentially while the relay is down; until
+# one is back up, commands fail at once instead of each waiting on a connect.
+class RelayPool:
+    def __init__(
+        self,
+        address,
+        size=2,
+        connect_timeout=5.0,
+        health_check_interval=15.0,
+        backoff_min=0.5,
+        backoff_max=30.0,
+    ):
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self.health_check_interval = health_check_interval
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self._connections = [None] * size
+        # Per slot: seconds to wait after the next failed attempt, and the
+        # time before which the slot is not retried
+        self._backoff = [backoff_min] * size
+        self._retry_at = [0.0] * size
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.reconnects = 0
+        self.connect_failures = 0
+        self.health_check_failures = 0
+        self._checker = threading.Thread(
+            target=self._check_health, name="relay-pool", daemon=True
+        )
+        self._checker.start()
+
+    # A live connection, opening one when none is up and the backoff allows.
+    # Raises ConnectionError when the relay cannot be reached.
+    def connection(self):
+        with self._lock:
+            live = [c for c in self._connections if c is not None and not c.closed]
+        if live:
+            return min(live, key=lambda c: c.pending)
+        # One caller connects while the others wait for it
+        with self._connect_lock:
+            with self._lock:
+                live = [c for c in self._connections if c is not None and not c.closed]
+            if live:
+                return live[0]
+            for slot in range(len(self._connections)):
+                connection = self._connect(slot)
+                if connection is not None:
+                    return connection
+        raise framing.FramingError(f"Relay at {self.address} is unavailable")
+
+    # Open the connection of slot unless it is up or backing off; None on
+    # failure. Called with _connect_lock held.
+    def _connect(self, slot):
+        now = time.monotonic()
+        with self._lock:
+            connection = self._connections[slot]
+            if connection is not None and not connection.closed:
+                return connection
+            if now < self._retry_at[slot]:
+                return None
+        try:
+            connection = framing.FramedConnection(self.address, self.connect_timeout)
+        except OSError as e:
+            with self._lock:
+                self.connect_failures += 1
+                self._retry_at[slot] = now + self._backoff[slot]
+                self._backoff[slot] = min(self._backoff[slot] * 2, self.backoff_max)
+            logger.warning(f"Cannot connect to the relay: {str(e)}")
+            return None
+        with self._lock:
+            if self._connections[slot] is not None:
+                self.reconnects += 1
+            self._connections[slot] = connection
+            self._backoff[slot] = self.backoff_min
+        return connection
+
+    def _check_health(self):
+        tick = min(1.0, self.health_check_interval)
+        while not self._stop.wait(tick):
+            for slot, connection in enumerate(list(self._connections)):
+                if connection is None or connection.closed:
+                    with self._connect_lock:
+                        self._connect(slot)
+                    continue
+                idle = time.monotonic() - connection.last_reply
+                if connection.pending or idle < self.health_check_interval:
+                    continue
+                try:
+                    connection.ping(self.connect_timeout)
+                except (OSError, TimeoutError) as e:
+                    with self._lock:
+                        self.health_check_failures += 1
+                    reason = str(e) or "no reply"
+                    logger.warning(
+                        f"Relay connection failed its health check: {reason}"
+                    )
+                    connection.close()
+                    with self._connect_lock:
+                        self._connect(slot)
+
+    def close(self):
+        self._stop.set()
+        for connection in self._connections:
+            if connection is not None:
+                connection.close()
+
+    def stats(self):
+        with self._lock:
+            connections = [c for c in self._connections if c is not None]
+            return {
+                "relay_connections_up": sum(not c.closed for c in connections),
+                "relay_pending": sum(c.pending for c in connections),
+                "relay_reconnects": self.reconnects,
+                "relay_connect_failures": self.connect_failures,
+                "relay_health_check_failures": self.health_check_failures,
+            }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+# The process-wide pool; a forked child builds its own
+def get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = RelayPool(
+                (settings.SERVER_HOST, settings.SERVER_PORT),
+                settings.RELAY_POOL_SIZE,
+                settings.RELAY_CONNECT_TIMEOUT,
+                settings.RELAY_HEALTH_CHECK_INTERVAL,
+                settings.RELAY_BACKOFF_MIN,
+                settings.RELAY_BACKOFF_MAX,
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def get_connection():
+    return get_pool().connection()
+
+
+def _pool_stats():
+    if _pool is None or _pool_pid != os.getpid():
+        return {}
+    return _pool.stats()
+
+
+command_metrics.add_gauges(_pool_stats)
+
+
+# asyncio counterpart of RelayPool for the async views (backend/async_views.py):
+# one pipelined stream connection per event loop, opened on demand and backing
+# off the same way while the relay is down
+class AsyncRelayLink:
+    def __init__(self, address, connect_timeout=5.0, backoff_min=0.5, backoff_max=30.0):
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self._connection = None
+        self._connect_lock = asyncio.Lock()
+        self._backoff = backoff_min
+        self._retry_at = 0.0
+        self.coalesced = singleflight.AsyncGroup()
+        self.reconnects = 0
+        self.connect_failures = 0
+
+    async def connection(self):
+        if self._connection is not None and not self._connection.closed:
+            return self._connection
+        async with self._connect_lock:
+            if self._connection is not None and not self._connection.closed:
+                return self._connection
+            if time.monotonic() < self._retry_at:
+                raise framing.FramingError(f"Relay at {self.address} is unavailable")
+            try:
+                connection = await framing.AsyncFramedConnection.open(
+                    self.address, self.connect_timeout
+                )
+            except (OSError, TimeoutError) as e:
+                self.connect_failures += 1
+                self._retry_at = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self.backoff_max)
+                logger.warning(f"Cannot connect to the relay: {str(e)}")
+                raise framing.FramingError(
+                    f"Relay at {self.address} is unavailable"
+                ) from e
+            if self._connection is not None:
+                self.reconnects += 1
+            self._connection = connection
+            self._backoff = self.backoff_min
+            return connection
+
+    async def submit(self, payload, flags):
+        return await (await self.connection()).submit(payload, flags)
+
+    async def request(self, payload, flags, timeout):
+        return await (await self.connection()).request(payload, flags, timeout)
+
+    def stats(self):
+        connection = self._connection
+        up = connection is not None and not connection.closed
+        return {
+            "relay_async_connections_up": int(up),
+            "relay_async_pending": connection.pending if up else 0,
+            "relay_async_reconnects": self.reconnects,
+            "relay_async_connect_failures": self.connect_failures,
+        }
+
+
+_async_links = weakref.WeakKeyDictionary()
+
+
+# The link of the running event loop
+def get_async_link():
+    loop = asyncio.get_running_loop()
+    link = _async_links.get(loop)
+    if link is None:
+        link = _async_links[loop] = AsyncRelayLink(
+            (settings.SERVER_HOST, settings.SERVER_PORT),
+            settings.RELAY_CONNECT_TIMEOUT,
+            settings.RELAY_BACKOFF_MIN,
+            settings.RELAY_BACKOFF_MAX,
+        )
+    return link
+
+
+def _async_link_stats():
+    totals = {}
+    for link in list(_async_links.values()):
+        for name, value in link.stats().items():
+            totals[name] = totals.get(name, 0) + value
+        for name, value in link.coalesced.stats().items():
+            totals[f"async_{name}"] = totals.get(f"async_{name}", 0) + value
+    return totals
+
+
+command_metrics.add_gauges(_async_link_stats)
+
+
+# Identical read-only commands from concurrent views share one relay call
+coalesced = singleflight.Group()
+command_metrics.add_gauges(coalesced.stats)
+
+
+# Send "station,module,command" to the relay; returns the reply flags and
+# payload. Waits up to timeout seconds (default settings.RELAY_TIMEOUT) and
+# raises TimeoutError after that.
+def send_command_frame(module_num, command, flags=framing.FLAG_NONE, timeout=None):
+    payload = f"{STATION_NUMBER},{module_num},{command}".encode("utf-8")
+    request = (str(STATION_NUMBER), str(module_num), command)
+    timeout = timeout or settings.RELAY_TIMEOUT
+    with command_metrics.timed((str(module_num), command)):
+        if uplink.is_read_only(request):
+            # Other views may still be waiting on the shared call
+            return coalesced.submit(
+                (payload, flags), lambda: get_connection().submit(payload, flags)
+            ).result(timeout)
+        return get_connection().request(payload, flags, timeout)
+
+
+# Coroutine version of send_command_frame, for the async views
+async def send_command_frame_async(
+    module_num, command, flags=framing.FLAG_NONE, timeout=None
+):
+    payload = f"{STATION_NUMBER},{module_num},{command}".encode("utf-8")
+    request = (str(STATION_NUMBER), str(module_num), command)
+    timeout = timeout or settings.RELAY_TIMEOUT
+    link = get_async_link()
+    with command_metrics.timed((str(module_num), command)):
+        if uplink.is_read_only(request):
+            return await asyncio.wait_for(
+                link.coalesced.run(
+                    (payload, flags), lambda: link.submit(payload, flags)
+                ),
+                timeout,
+            )
+        return await link.request(payload, flags, timeout)
+
+
+# Raw JSON acknowledgment of a command
+def send_command(module_num, command, timeout=None):
+    flags, acknowledgment = send_command_frame(module_num, command, timeout=timeout)
+    return acknowledgment
+
+
+# Reply encodings this process accepts: binary housekeeping frames when
+# settings.BINARY_HK is on, msgpack instead of JSON when settings.MSGPACK is
+def reply_flags():
+    flags = framing.FLAG_NONE
+    if settings.BINARY_HK:
+        flags |= framing.FLAG_BINARY_HK
+    if settings.MSGPACK:
+        flags |= framing.FLAG_MSGPACK
+    return flags
+
+
+# Acknowledgment decoded to a dict. Raises ValueError on a malformed reply.
+def send_command_decoded(module_num, command, timeout=None):
+    return hk_schema.decode_reply(
+        *send_command_frame(module_num, command, reply_flags(), timeout)
+    )
+
+
+async def send_command_decoded_async(module_num, command, timeout=None):
+    return hk_schema.decode_reply(
+        *await send_command_frame_async(module_num, command, reply_flags(), timeout)
+    )
+
+
+# Commands the server runs per batch request
+MAX_BATCH = 64
+
+
+def _batch_payload(commands):
+    batch = ";".join(f"{module_num}:{command}" for module_num, command in commands)
+    return f"{STATION_NUMBER},batch,{batch}".encode("utf-8")
+
+
+def _batch_replies(flags, payload):
+    reply = hk_schema.decode_reply(flags, payload)
+    if not isinstance(reply, dict):
+        raise ValueError(reply)
+    return [
+        (int(item["module"]), item["command"], item["reply"]) for item in reply["batch"]
+    ]
+
+
+# Run up to MAX_BATCH commands in one round trip (the server's "batch"
+# request). Returns (module, command, reply) triples in request order; raises
+# ValueError for a larger batch, without sending it, or when the server
+# rejects the batch. send_pipelined takes any number of commands.
+def send_batch(commands, timeout=None):
+    if len(commands) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} commands per batch")
+    batch = ";".join(f"{module_num}:{command}" for module_num, command in commands)
+    return _batch_replies(
+        *send_command_frame(
+            "batch", batch, reply_flags() & framing.FLAG_MSGPACK, timeout
+        )
+    )
+
+
+# Any number of commands as MAX_BATCH-sized batch requests, all sent before
+# waiting on the first reply. Batches may run concurrently on the server, so
+# only the order within a batch is kept. Same result as send_batch; timeout
+# bounds the whole call.
+def send_pipelined(commands, timeout=None):
+    flags = reply_flags() & framing.FLAG_MSGPACK
+    deadline = time.monotonic() + (timeout or settings.RELAY_TIMEOUT)
+    connection = get_connection()
+    with command_metrics.timed(("batch", "pipelined")):
+        futures = [
+            connection.submit(_batch_payload(commands[i : i + MAX_BATCH]), flags)
+            for i in range(0, len(commands), MAX_BATCH)
+        ]
+        replies = []
+        try:
+            for future in futures:
+                remaining = max(deadline - time.monotonic(), 0)
+                replies.extend(_batch_replies(*future.result(remaining)))
+        except TimeoutError:
+            for future in futures:
+                connection.discard(future)
+            raise
+    return replies
@@ -0,0 +1,12 @@
+from django.http import HttpResponse
+
+import codec
+
+
+# JsonResponse counterpart serialized with the shared codec (orjson when it is
+# installed). Datetimes and ObjectIds are encoded directly, so documents from
+# MongoDB can be returned without converting fields by hand.
+class CodecResponse(HttpResponse):
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=codec.dumps(data), **kwargs)
@@ -10,11 +10,16 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Modules shared with the TM/TC server and relay (wire framing, ...)
+sys.path.append(str(BASE_DIR.parent.parent / "Shared"))
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
@@ -29,6 +34,24 @@ ALLOWED_HOSTS = []
 
 SERVER_HOST = "localhost"
 SERVER_PORT = 2847
+RELAY_TIMEOUT = 30  # seconds to wait for a command acknowledgment
+# Pooled framed connections to the relay (backend/relay.py)
+RELAY_POOL_SIZE = 2
+RELAY_CONNECT_TIMEOUT = 5  # seconds, also the health check ping timeout
+RELAY_HEALTH_CHECK_INTERVAL = 15  # seconds idle before a connection is pinged
+RELAY_BACKOFF_MIN = 0.5  # seconds before the first reconnect attempt
+RELAY_BACKOFF_MAX = 30  # doubling up to this while the relay is down
+BINARY_HK = False  # request struct-packed housekeeping frames (Shared/hk_schema.py)
+MSGPACK = False  # request msgpack instead of JSON replies (Shared/codec.py)
+
+# Store-and-forward (dashboard/command_queue.py): commands submitted outside a
+# Gpredict pass window are queued and flushed at the next AOS
+STORE_AND_FORWARD = True
+PASS_LINK_BPS = 9600  # link rate used to fit queued telemetry into a pass
+PASS_POLL_INTERVAL = 10  # seconds between checks for a pass in progress
+# Run the thread flushing the queue in this process; enable it in one serving
+# process, not in every worker or management command
+COMMAND_QUEUE_SCHEDULER = os.environ.get("COMMAND_QUEUE_SCHEDULER", "0") == "1"
 
 # Application definition
 
@@ -40,9 +63,12 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "corsheaders",
+    "dashboard",
 ]
 
 MIDDLEWARE = [
+    "backend.instrumentation.MetricsMiddleware",
+    "backend.middleware.AsgiUrlconfMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -77,6 +103,8 @@ CSRF_TRUSTED_ORIGINS = [
 CORS_ALLOW_CREDENTIALS = True
 
 ROOT_URLCONF = "backend.urls"
+# Served through backend/asgi.py, the command and fetch views are async
+ASGI_URLCONF = "backend.asgi_urls"
 
 TEMPLATES = [
     {
@@ -102,6 +130,40 @@ WSGI_APPLICATION = "backend.wsgi.application"
 
 DATABASES = {}  # empty as solely using MongoDB and not any SQL databases
 
+# MongoDB (backend/storage.py): one pooled client per process. Set MONGODB_URI
+# to your deployment (e.g. a mongodb+srv:// Atlas URI, or mongomock:// for an
+# in-memory stand-in).
+MONGODB_URI = os.environ.get("MONGODB_URI", "mongodb://localhost:27017")
+MONGODB_DATABASE = os.environ.get("MONGODB_DATABASE", "myDatabase")
+MONGODB_MAX_POOL_SIZE = int(os.environ.get("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.environ.get("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.environ.get("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")
+)
+MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGODB_SOCKET_TIMEOUT_MS", "30000"))
+# Create the (kind, ts) indexes of the subsystem collections at startup
+MONGODB_CREATE_INDEXES = os.environ.get("MONGODB_CREATE_INDEXES", "1") == "1"
+# Store periodic telemetry in one time-series collection (MongoDB 5.0+);
+# existing data is moved there with `python migrate.py timeseries`
+MONGODB_TIMESERIES = os.environ.get("MONGODB_TIMESERIES", "0") == "1"
+MONGODB_TIMESERIES_COLLECTION = "telemetry_timeseries"
+MONGODB_TIMESERIES_GRANULARITY = os.environ.get(
+    "MONGODB_TIMESERIES_GRANULARITY", "seconds"
+)  # seconds, minutes or hours: the expected interval between samples
+MONGODB_TIMESERIES_EXPIRE_AFTER_SECONDS = int(
+    os.environ.get("MONGODB_TIMESERIES_EXPIRE_AFTER_SECONDS", "0")
+)  # 0 keeps the telemetry forever; set when the collection is created
+
+# Page size of the fetch views (backend/history.py), overridable per request
+# with ?limit= up to FETCH_MAX_LIMIT
+FETCH_DEFAULT_LIMIT = 500
+FETCH_MAX_LIMIT = 5000
+# Seconds the since watermark stays behind the current time, longer than a
+# document takes from being stamped to being inserted
+FETCH_WATERMARK_LAG = 2
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -144,19 +206,39 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# Records go through the shared queue pipeline (Shared/logs.py): a background
+# thread writes them to the console and, with LOG_FILE set, to a rotating
+# JSON-lines file. LOG_SAMPLE keeps that fraction of the per-request access
+# log lines; warnings and errors are always kept.
+LOG_FILE = os.environ.get("LOG_FILE")
+LOG_SAMPLE = float(os.environ.get("LOG_SAMPLE", "1.0"))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "filters": {
+        "sample": {
+            "()": "logs.SampleFilter",
+            "rate": LOG_SAMPLE,
+        },
+    },
     "handlers": {
-        "console": {
-            "class": "logging.StreamHandler",
+        "queue": {
+            "()": "logs.queue_handler",
+            "path": LOG_FILE,
         },
     },
     "loggers": {
         "": {
-            "handlers": ["console"],
+            "handlers": ["queue"],
             "level": "INFO",
             "propagate": True,
         },
+        "django.server": {
+            "handlers": ["queue"],
+            "level": "INFO",
+            "filters": ["sample"],
+            "propagate": False,
+        },
     },
 }
@@ -0,0 +1,296 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+import certifi
+import pymongo
+from pymongo import monitoring
+
+from backend import ingest
+from backend.instrumentation import view_metrics
+
+# MongoDB access shared by every app.
+#
+# Each process builds one MongoClient, on first use, and every view borrows
+# connections from its pool instead of paying for DNS, TCP/TLS handshakes and
+# server discovery on each request. The client is rebuilt after a fork, since
+# pymongo clients must not be shared across processes. MONGODB_URI picks the
+# deployment; "mongomock://" gives an in-memory stand-in for local runs.
+#
+# Replies are written through store() and store_many(), which tag them
+# (backend/ingest.py) and pick their collection: the subsystem's, or with
+# MONGODB_TIMESERIES on the time-series collection for periodic telemetry.
+# That collection and the (kind, ts) indexes are created when a process
+# builds its client.
+#
+# The async views run their database calls through run(), on a thread pool
+# no larger than the connection pool, so the event loop never blocks on one.
+
+MOCK_URI = "mongomock://"
+
+# Collection each subsystem's replies are stored in, by module number
+MODULE_COLLECTIONS = {
+    1: "obc_collection",
+    2: "cam_collection",
+    3: "com_collection",
+    4: "eps_collection",
+    5: "adcs_collection",
+}
+
+_client = None
+_client_pid = None
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+# Connection pool counters of the process-wide client
+class PoolCounters(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkouts = 0
+        self._lock = threading.Lock()
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mongo_connections_open": self.created - self.closed,
+                "mongo_connections_in_use": self.checked_out,
+                "mongo_connections_created": self.created,
+                "mongo_checkouts": self.checkouts,
+            }
+
+
+pool_counters = PoolCounters()
+view_metrics.add_gauges(pool_counters.stats)
+
+
+# A new client configured from the settings
+def connect(uri=None):
+    uri = uri or settings.MONGODB_URI
+    if uri.startswith(MOCK_URI):
+        import mongomock
+
+        return mongomock.MongoClient()
+
+    options = {
+        "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": settings.MONGODB_SOCKET_TIMEOUT_MS,
+        "appname": "tmtc-backend",
+        "event_listeners": [pool_counters],
+    }
+    # Atlas (SRV) connections use TLS, verified against certifi's CA bundle
+    if uri.startswith("mongodb+srv://") or "tls=true" in uri.lower():
+        options["tlsCAFile"] = certifi.where()
+    return pymongo.MongoClient(uri, **options)
+
+
+# The process-wide client
+def client():
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = connect()
+            _client_pid = os.getpid()
+            prepare(_client[settings.MONGODB_DATABASE])
+        return _client
+
+
+# Create the time-series collection and the indexes of the fetch views in db,
+# as configured. An unreachable database is logged, not raised: the views
+# report it when they use it.
+def prepare(db):
+    try:
+        if settings.MONGODB_TIMESERIES:
+            create_timeseries(db)
+        if settings.MONGODB_CREATE_INDEXES:
+            for name in MODULE_COLLECTIONS.values():
+                ingest.ensure_index(db[name])
+            if settings.MONGODB_TIMESERIES:
+                ingest.ensure_timeseries_index(
+                    db[settings.MONGODB_TIMESERIES_COLLECTION]
+                )
+    except pymongo.errors.PyMongoError as e:
+        logger.error(f"Error preparing the database: {str(e)}")
+
+
+# Create the time-series collection in db unless it exists. mongomock has no
+# time-series collections: a plain one stands in.
+def create_timeseries(db):
+    name = settings.MONGODB_TIMESERIES_COLLECTION
+    if name in db.list_collection_names():
+        return db[name]
+    if settings.MONGODB_URI.startswith(MOCK_URI):
+        return db.create_collection(name)
+    options = {
+        "timeseries": {
+            "timeField": "ts",
+            "metaField": "meta",
+            "granularity": settings.MONGODB_TIMESERIES_GRANULARITY,
+        }
+    }
+    if settings.MONGODB_TIMESERIES_EXPIRE_AFTER_SECONDS:
+        options["expireAfterSeconds"] = settings.MONGODB_TIMESERIES_EXPIRE_AFTER_SECONDS
+    return db.create_collection(name, **options)
+
+
+# Close the process-wide client; the next access builds a new one
+def close():
+    global _client
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+
+
+# Thread pool for the database calls of the async views
+def executor():
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                settings.MONGODB_MAX_POOL_SIZE, thread_name_prefix="storage"
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+# Await func(*args, **kwargs) run on the storage thread pool
+async def run(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def database():
+    return client()[settings.MONGODB_DATABASE]
+
+
+def obc_collection():
+    return database().obc_collection
+
+
+def cam_collection():
+    return database().cam_collection
+
+
+def com_collection():
+    return database().com_collection
+
+
+def eps_collection():
+    return database().eps_collection
+
+
+def adcs_collection():
+    return database().adcs_collection
+
+
+# Gpredict pass table
+def pass_collection():
+    return database().dashboard_collection
+
+
+# Store-and-forward queue (dashboard/command_queue.py)
+def command_queue_collection():
+    return database().command_queue
+
+
+# Collection of a subsystem by module number
+def module_collection(module_num):
+    return database()[MODULE_COLLECTIONS[int(module_num)]]
+
+
+# Periodic telemetry of every subsystem, with MONGODB_TIMESERIES on
+def timeseries_collection():
+    return database()[settings.MONGODB_TIMESERIES_COLLECTION]
+
+
+# Collection holding the replies of kind from module module_num, and the
+# selector of those replies
+def telemetry(module_num, kind):
+    if ingest.timeseries(kind):
+        collection = timeseries_collection()
+    else:
+        collection = module_collection(module_num)
+    return collection, ingest.selector(module_num, kind)
+
+
+# The collection and stored form of a reply of module module_num
+def _target(module_num, reply):
+    doc = ingest.document(module_num, reply)
+    if ingest.timeseries(doc["kind"]):
+        return timeseries_collection(), ingest.timeseries_document(doc)
+    return module_collection(module_num), doc
+
+
+# Store a reply of module module_num
+def store(module_num, reply):
+    collection, doc = _target(module_num, reply)
+    return collection.insert_one(doc)
+
+
+# Store (module_num, reply) pairs, one insert_many per collection; returns the
+# number of documents inserted by collection name
+def store_many(replies):
+    batches = {}
+    for module_num, reply in replies:
+        collection, doc = _target(module_num, reply)
+        batches.setdefault(collection.name, (collection, []))[1].append(doc)
+    inserted = {}
+    for name, (collection, batch) in batches.items():
+        result = collection.insert_many(batch, ordered=False)
+        inserted[name] = len(result.inserted_ids)
+    return inserted
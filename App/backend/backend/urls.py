@@ -17,6 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from backend.instrumentation import metrics_view
+
 urlpatterns = [
     path("obc", include("obc.urls")),
     path("eps", include("eps.urls")),
@@ -24,5 +26,6 @@ urlpatterns = [
     path("com", include("com.urls")),
     path("adcs", include("adcs.urls")),
     path("dashboard", include("dashboard.urls")),
+    path("metrics", metrics_view, name="metrics"),
     path("admin/", admin.site.urls),
 ]
@@ -0,0 +1,303 @@
+import argparse
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+# Request benchmarks of the Django backend, run in-process through the test
+# clients against the database MONGODB_URI points at (give --mongo-uri to
+# override it, e.g. a local mongod).
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+
+def setup(mongo_uri=None):
+    if mongo_uri:
+        os.environ["MONGODB_URI"] = mongo_uri
+    django.setup()
+    from django.conf import settings
+
+    # Keep the store-and-forward scheduler from querying in the background
+    settings.STORE_AND_FORWARD = False
+    # The checked-in settings leave the key blank; sessions are never used here
+    if not settings._wrapped.SECRET_KEY:
+        settings.SECRET_KEY = "benchmark"
+    settings.ALLOWED_HOSTS = ["testserver"]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+def print_load_header():
+    print(
+        f"{'mode':>12} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'max ms':>9} {'errors':>7} {'connections':>12}"
+    )
+
+
+def print_load_row(mode, elapsed, latencies, errors, connections):
+    print(
+        f"{mode:>12} {len(latencies) / elapsed:>10.0f} "
+        f"{percentile(latencies, 50) * 1000:>9.2f} "
+        f"{percentile(latencies, 99) * 1000:>9.2f} "
+        f"{(latencies[-1] if latencies else float('nan')) * 1000:>9.2f} "
+        f"{errors:>7} {connections:>12}"
+    )
+
+
+# GET path from clients threads, requests_per_client times each; returns the
+# elapsed time, the sorted latencies and the number of failed requests
+def run_load(path, clients, requests_per_client):
+    from django.test import Client
+
+    def client_loop():
+        client = Client()
+        latencies = []
+        errors = 0
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+        with results_lock:
+            results.append((latencies, errors))
+
+    results = []
+    results_lock = threading.Lock()
+    threads = [threading.Thread(target=client_loop) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    return elapsed, latencies, errors
+
+
+# Fetch endpoint latency with the shared pooled client, compared with a new
+# MongoClient per request as the views used to build. With mongomock:// only
+# the client construction cost shows; a real mongod adds the connection
+# handshakes and server discovery the pool saves.
+def bench_storage(args):
+    setup(args.mongo_uri)
+    from bson import ObjectId
+
+    from backend import storage
+
+    documents = [
+        (
+            4,
+            {
+                "_id": ObjectId(),
+                "timestamp": f"2024-01-01T00:00:{i % 60:02d}",
+                "vbatt": 7000 + i,
+            },
+        )
+        for i in range(args.documents)
+    ]
+    if documents:
+        storage.store_many(documents)
+
+    shared_client = storage.client
+    opened = []
+    opened_lock = threading.Lock()
+
+    def per_request_client():
+        fresh = storage.connect()
+        with opened_lock:
+            opened.append(fresh)
+        return fresh
+
+    print_load_header()
+    for mode in args.modes:
+        storage.client = per_request_client if mode == "per-request" else shared_client
+        created = storage.pool_counters.created
+        try:
+            elapsed, latencies, errors = run_load(
+                args.path, args.clients, args.requests
+            )
+        finally:
+            storage.client = shared_client
+            for fresh in opened:
+                fresh.close()
+            opened.clear()
+        print_load_row(
+            mode, elapsed, latencies, errors, storage.pool_counters.created - created
+        )
+
+    if documents:
+        collection, _ = storage.telemetry(4, "housekeeping_data")
+        collection.delete_many(
+            {"_id": {"$in": [reply["_id"] for _, reply in documents]}}
+        )
+
+
+# Relay stand-in answering every framed request after latency seconds (the
+# satellite round trip), served from an event loop on a background thread.
+# Returns its address and a dict with the peak number of requests in flight.
+def start_stub_relay(latency):
+    import codec
+    import framing
+
+    reply = codec.dumps({"Status": "Success"})
+    counts = {"in_flight": 0, "peak": 0}
+    started = threading.Event()
+    address = []
+
+    async def answer(writer, request_id):
+        counts["in_flight"] += 1
+        counts["peak"] = max(counts["peak"], counts["in_flight"])
+        await asyncio.sleep(latency)
+        counts["in_flight"] -= 1
+        framing.write_frame(writer, request_id, reply)
+
+    async def handle(reader, writer):
+        tasks = set()
+        while True:
+            frame = await framing.read_frame(reader)
+            if frame is None:
+                break
+            request_id, flags, payload = frame
+            if flags & framing.FLAG_PING:
+                framing.write_frame(writer, request_id, b"", flags)
+                continue
+            task = asyncio.create_task(answer(writer, request_id))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def serve():
+        server = await asyncio.start_server(handle, "localhost", 0, backlog=1024)
+        address.append(server.sockets[0].getsockname()[:2])
+        started.set()
+        await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    started.wait()
+    return address[0], counts
+
+
+# requests POSTs of body to path from workers threads running the synchronous
+# views, as WSGI workers would
+def run_sync_commands(path, body, requests, workers):
+    from django.test import Client
+
+    local = threading.local()
+
+    def post(_):
+        if not hasattr(local, "client"):
+            local.client = Client()
+        start = time.perf_counter()
+        response = local.client.post(path, body, content_type="application/json")
+        return time.perf_counter() - start, response.status_code >= 400
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(post, range(requests)))
+    return time.perf_counter() - start, results
+
+
+# The same through ASGI and the async views, concurrency requests at a time on
+# one event loop
+def run_async_commands(path, body, requests, concurrency):
+    from django.test import AsyncClient
+
+    async def load():
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def post():
+            async with slots:
+                start = time.perf_counter()
+                response = await client.post(
+                    path, body, content_type="application/json"
+                )
+                return time.perf_counter() - start, response.status_code >= 400
+
+        return await asyncio.gather(*(post() for _ in range(requests)))
+
+    start = time.perf_counter()
+    results = asyncio.run(load())
+    return time.perf_counter() - start, results
+
+
+# Command views under a relay that takes --latency seconds per command: the
+# synchronous views hold a worker thread for each command in flight, the
+# async views (ASGI) only a coroutine
+def bench_commands(args):
+    setup(args.mongo_uri or "mongomock://")
+    from django.conf import settings
+
+    (settings.SERVER_HOST, settings.SERVER_PORT), counts = start_stub_relay(
+        args.latency
+    )
+    body = f'{{"command": "{args.command}"}}'
+
+    print(f"{args.requests} commands, {args.latency * 1000:.0f} ms relay latency")
+    print(
+        f"{'mode':>22} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'errors':>7} {'peak in flight':>15}"
+    )
+    runs = [
+        (f"sync, {workers} workers", run_sync_commands, workers)
+        for workers in args.workers
+    ] + [
+        (f"async, {concurrency} concurrent", run_async_commands, concurrency)
+        for concurrency in args.concurrency
+    ]
+    for mode, run, width in runs:
+        counts["peak"] = 0
+        elapsed, results = run(args.path, body, args.requests, width)
+        latencies = sorted(latency for latency, _ in results)
+        print(
+            f"{mode:>22} {len(results) / elapsed:>10.0f} "
+            f"{percentile(latencies, 50) * 1000:>9.1f} "
+            f"{percentile(latencies, 99) * 1000:>9.1f} "
+            f"{sum(error for _, error in results):>7} {counts['peak']:>15}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Django backend benchmarks")
+    parser.add_argument("--mongo-uri", help="default: the MONGODB_URI setting")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    storage_parser = subparsers.add_parser(
+        "storage", help="pooled MongoDB client vs. a client per request"
+    )
+    storage_parser.add_argument("--modes", nargs="+", default=["per-request", "pooled"])
+    storage_parser.add_argument("--path", default="/eps/aespa")
+    storage_parser.add_argument("--clients", type=int, default=8)
+    storage_parser.add_argument(
+        "--requests", type=int, default=50, help="requests per client"
+    )
+    storage_parser.add_argument(
+        "--documents", type=int, default=100, help="documents inserted for the run"
+    )
+    storage_parser.set_defaults(func=bench_storage)
+
+    commands_parser = subparsers.add_parser(
+        "commands", help="sync (WSGI) vs. async (ASGI) command views under load"
+    )
+    commands_parser.add_argument("--path", default="/eps/command")
+    commands_parser.add_argument("--command", default="eps_cmd_reset_wdt_gnd_cb")
+    commands_parser.add_argument(
+        "--latency", type=float, default=0.2, help="relay round trip in seconds"
+    )
+    commands_parser.add_argument("--requests", type=int, default=2000)
+    commands_parser.add_argument("--workers", type=int, nargs="+", default=[8, 32])
+    commands_parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[100, 1000, 2000]
+    )
+    commands_parser.set_defaults(func=bench_commands)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -2,6 +2,6 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path("/command", views.com_view, name="cam_view"),
+    path("/command", views.com_view, name="com_view"),
     path("/getRate", views.getRate, name="getRate"),
 ]
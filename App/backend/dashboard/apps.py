@@ -1,6 +1,23 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
+
+    # Flush commands queued outside a pass at the next AOS, in the processes
+    # started with COMMAND_QUEUE_SCHEDULER=1; not in the runserver
+    # autoreloader, whose child process serves the requests
+    def ready(self):
+        if not (settings.STORE_AND_FORWARD and settings.COMMAND_QUEUE_SCHEDULER):
+            return
+        if 'runserver' in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+            if '--noreload' not in sys.argv:
+                return
+        from dashboard import command_queue
+
+        command_queue.start_scheduler()
@@ -0,0 +1,318 @@
+import datetime
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+import pymongo
+
+import codec
+import uplink
+from backend import relay, storage
+
+# Store-and-forward of commands between passes.
+#
+# Outside a pass window (from the Gpredict table the dashboard stores) the
+# module views queue commands here instead of sending them to a satellite
+# that cannot hear them. The queue is a MongoDB collection, so it survives
+# restarts. At AOS a background thread flushes it as pipelined batches:
+# telecommands first, in submission order, then as many telemetry requests as
+# the rest of the contact time fits, housekeeping before history and shortest
+# first. What does not fit waits for the next pass. A read-only request is
+# queued once per (module, command): a new poll of it replaces the one
+# waiting, so repeated dashboard polls between passes do not pile up.
+#
+# When a flush fails (the relay errors, or the process dies) its telemetry
+# requests go back to the queue, but its unsent telecommands are marked
+# "unknown": they may have reached the satellite, and only an operator can
+# tell whether sending one again is safe. Only the link time of what was
+# sent stays booked.
+
+logger = logging.getLogger(__name__)
+
+# Seconds left unused at the end of a pass
+LOS_MARGIN = 5.0
+# Round trip assumed per request on top of its time on the link
+REQUEST_OVERHEAD = 0.05
+# Reply size assumed for a command that never went through the queue
+DEFAULT_REPLY_BYTES = 1024
+# Seconds after which an entry still being sent is taken as abandoned by a
+# flush that died with its process, and released
+SENDING_TIMEOUT = 600
+
+
+# Pass in progress at now, or None
+def current_pass(now=None):
+    now = now or datetime.datetime.now()
+    return storage.pass_collection().find_one(
+        {"aos": {"$lte": now}, "los": {"$gt": now}}
+    )
+
+
+def next_pass(now=None):
+    now = now or datetime.datetime.now()
+    return storage.pass_collection().find_one({"aos": {"$gt": now}}, sort=[("aos", 1)])
+
+
+def enqueue(module_num, command):
+    request = (str(relay.STATION_NUMBER), str(module_num), command)
+    entry = {
+        "module": int(module_num),
+        "command": command,
+        "kind": uplink.PRIORITY_NAMES[uplink.classify(request)],
+        "status": "queued",
+        "submitted": datetime.datetime.now(),
+    }
+    queue = storage.command_queue_collection()
+    if uplink.is_read_only(request):
+        return queue.find_one_and_update(
+            {"module": entry["module"], "command": command, "status": "queued"},
+            {"$set": entry},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+    entry["_id"] = queue.insert_one(entry).inserted_id
+    return entry
+
+
+# Queue the command when the satellite is out of view and a pass is coming.
+# Returns the queue entry, or None when the command should be sent now.
+def defer(module_num, command):
+    if not settings.STORE_AND_FORWARD:
+        return None
+    now = datetime.datetime.now()
+    if current_pass(now) is not None:
+        return None
+    upcoming = next_pass(now)
+    # Without a pass table there is no window to wait for
+    if upcoming is None:
+        return None
+    entry = enqueue(module_num, command)
+    entry["aos"] = upcoming["aos"]
+    return entry
+
+
+# Reply size of each command last time it was flushed
+def reply_sizes(entries):
+    queue = storage.command_queue_collection()
+    sizes = {}
+    for module_num, command in {(e["module"], e["command"]) for e in entries}:
+        last = queue.find_one(
+            {"module": module_num, "command": command, "reply_bytes": {"$gt": 0}},
+            sort=[("sent", -1)],
+        )
+        if last is not None:
+            sizes[(module_num, command)] = last["reply_bytes"]
+    return sizes
+
+
+# Seconds a request is expected to hold the link
+def estimated_seconds(entry, sizes):
+    size = len(entry["command"]) + sizes.get(
+        (entry["module"], entry["command"]), DEFAULT_REPLY_BYTES
+    )
+    return size * 8 / settings.PASS_LINK_BPS + REQUEST_OVERHEAD
+
+
+# Entries to send with budget seconds of contact left: every telecommand, then
+# the telemetry requests that still fit. Returns them with the link time each
+# is expected to take, by _id.
+def plan(entries, budget):
+    sizes = reply_sizes(entries)
+    selected = [e for e in entries if e["kind"] == "telecommand"]
+    seconds = {e["_id"]: estimated_seconds(e, sizes) for e in selected}
+    budget -= sum(seconds.values())
+    telemetry = sorted(
+        (e for e in entries if e["kind"] != "telecommand"),
+        key=lambda e: (
+            uplink.PRIORITY_NAMES.index(e["kind"]),
+            estimated_seconds(e, sizes),
+            e["submitted"],
+        ),
+    )
+    for entry in telemetry:
+        entry_seconds = estimated_seconds(entry, sizes)
+        # A shorter request of a lower class may still fit
+        if entry_seconds <= budget:
+            selected.append(entry)
+            seconds[entry["_id"]] = entry_seconds
+            budget -= entry_seconds
+    return selected, seconds
+
+
+# Release the entries of flush_id still being sent (those of every flush when
+# None, if claimed before stale_before). Telemetry requests go back to the
+# queue, unless a newer poll of the same command is waiting there. A
+# telecommand may have reached the satellite before the failure, so it is
+# marked "unknown" for an operator to check and resubmit, never sent again
+# on its own.
+def release(flush_id=None, stale_before=None, error=None):
+    queue = storage.command_queue_collection()
+    query = {"status": "sending"}
+    if flush_id is not None:
+        query["flush"] = flush_id
+    if stale_before is not None:
+        query["claimed"] = {"$not": {"$gte": stale_before}}
+
+    unknown = queue.update_many(
+        {**query, "kind": "telecommand"},
+        {
+            "$set": {"status": "unknown", "error": error or "Flush abandoned"},
+            "$unset": {"claimed": ""},
+        },
+    )
+    if unknown.modified_count:
+        logger.warning(
+            f"Delivery of {unknown.modified_count} queued telecommands is unknown"
+        )
+    for entry in queue.find(query, projection=["module", "command"]):
+        waiting = queue.find_one(
+            {
+                "module": entry["module"],
+                "command": entry["command"],
+                "status": "queued",
+            },
+            projection=["_id"],
+        )
+        if waiting is not None:
+            queue.delete_one({"_id": entry["_id"]})
+        else:
+            queue.update_one(
+                {"_id": entry["_id"]},
+                {"$set": {"status": "queued"}, "$unset": {"flush": "", "claimed": ""}},
+            )
+
+
+# Send claimed entries as pipelined batches and record their replies
+def send_entries(entries):
+    queue = storage.command_queue_collection()
+    replies = relay.send_pipelined([(e["module"], e["command"]) for e in entries])
+
+    sent = datetime.datetime.now()
+    documents = []
+    for entry, (module_num, command, reply) in zip(entries, replies):
+        queue.update_one(
+            {"_id": entry["_id"]},
+            {
+                "$set": {
+                    "status": "sent",
+                    "sent": sent,
+                    "reply": reply,
+                    "reply_bytes": len(codec.dumps(reply)),
+                }
+            },
+        )
+        # Unknown commands come back as plain strings, not documents
+        if isinstance(reply, dict):
+            documents.append((module_num, reply))
+    if documents:
+        storage.store_many(documents)
+    return replies
+
+
+# Send what fits in the pass window; returns (module, command, reply) triples.
+# The pass keeps the time its link is booked until, so that flushes during
+# the same pass share its contact time. On failure the entries not sent are
+# released and the error is raised.
+def flush(window, now=None):
+    now = now or datetime.datetime.now()
+    queue = storage.command_queue_collection()
+    release(stale_before=now - datetime.timedelta(seconds=SENDING_TIMEOUT))
+    start = max(now, window.get("link_busy_until", now))
+    budget = (window["los"] - start).total_seconds() - LOS_MARGIN
+    if budget <= 0:
+        return []
+    selected, seconds = plan(
+        list(queue.find({"status": "queued"}, sort=[("submitted", 1)])), budget
+    )
+    if not selected:
+        return []
+
+    # Claim the entries, so another process flushing the same queue skips them
+    flush_id = uuid.uuid4().hex
+    queue.update_many(
+        {"_id": {"$in": [e["_id"] for e in selected]}, "status": "queued"},
+        {"$set": {"status": "sending", "flush": flush_id, "claimed": now}},
+    )
+    claimed = {e["_id"] for e in queue.find({"flush": flush_id}, projection=["_id"])}
+    selected = [e for e in selected if e["_id"] in claimed]
+    if not selected:
+        return []
+
+    # Book the link for the claimed entries while they are sent
+    booked = start + datetime.timedelta(
+        seconds=sum(seconds[e["_id"]] for e in selected)
+    )
+    storage.pass_collection().update_one(
+        {"_id": window["_id"]}, {"$set": {"link_busy_until": booked}}
+    )
+
+    # Telecommands complete before the telemetry that may depend on them
+    telecommands = [e for e in selected if e["kind"] == "telecommand"]
+    telemetry = [e for e in selected if e["kind"] != "telecommand"]
+    replies = []
+    try:
+        for entries in (telecommands, telemetry):
+            if entries:
+                replies.extend(send_entries(entries))
+    except Exception as e:
+        release(flush_id, error=str(e))
+        # Only what went out keeps its link time, unless a later flush
+        # booked past it already
+        sent = queue.find({"flush": flush_id, "status": "sent"}, projection=["_id"])
+        sent_seconds = sum(seconds[e["_id"]] for e in sent)
+        storage.pass_collection().update_one(
+            {"_id": window["_id"], "link_busy_until": booked},
+            {
+                "$set": {
+                    "link_busy_until": start + datetime.timedelta(seconds=sent_seconds)
+                }
+            },
+        )
+        raise
+    logger.info(
+        f"Flushed {len(replies)} queued commands "
+        f"({len(telecommands)} telecommands) with {budget:.0f}s of pass left"
+    )
+    return replies
+
+
+# Sleep until the next AOS (checking at least every poll_interval seconds for
+# new passes) and flush the queue while a pass is in progress
+def run_scheduler(poll_interval):
+    while True:
+        now = datetime.datetime.now()
+        wait = poll_interval
+        try:
+            window = current_pass(now)
+            if window is not None:
+                release(stale_before=now - datetime.timedelta(seconds=SENDING_TIMEOUT))
+                if storage.command_queue_collection().count_documents(
+                    {"status": "queued"}, limit=1
+                ):
+                    flush(window, now)
+            else:
+                upcoming = next_pass(now)
+                if upcoming is not None:
+                    wait = min(wait, (upcoming["aos"] - now).total_seconds())
+        except Exception as e:
+            logger.error(f"Command queue flush failed: {str(e)}")
+        time.sleep(max(wait, 0.1))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(
+                target=run_scheduler,
+                args=(settings.PASS_POLL_INTERVAL,),
+                name="command-queue",
+                daemon=True,
+            )
+            _scheduler.start()
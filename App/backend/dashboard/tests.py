@@ -1,3 +1,63 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from backend import relay, storage
+from dashboard import command_queue
+
+
+@override_settings(MONGODB_URI=storage.MOCK_URI)
+class FlushFailureTests(SimpleTestCase):
+    def setUp(self):
+        storage.close()
+        self.addCleanup(storage.close)
+        now = datetime.datetime.now()
+        storage.pass_collection().insert_one(
+            {
+                "aos": now - datetime.timedelta(minutes=1),
+                "los": now + datetime.timedelta(minutes=10),
+            }
+        )
+        self.queue = storage.command_queue_collection()
+
+    def statuses(self):
+        return {entry["command"]: entry["status"] for entry in self.queue.find()}
+
+    def test_failed_flush_requeues_telemetry_only(self):
+        command_queue.enqueue(1, "obc_cmd_jump_ram_cb")
+        command_queue.enqueue(4, "eps_telem_hk_get_cb")
+
+        with mock.patch.object(
+            relay, "send_pipelined", side_effect=TimeoutError("timed out")
+        ):
+            with self.assertRaises(TimeoutError):
+                command_queue.flush(command_queue.current_pass())
+        self.assertEqual(
+            self.statuses(),
+            {"obc_cmd_jump_ram_cb": "unknown", "eps_telem_hk_get_cb": "queued"},
+        )
+
+        with mock.patch.object(
+            relay,
+            "send_pipelined",
+            side_effect=lambda commands: [(m, c, {"ok": 1}) for m, c in commands],
+        ) as send:
+            command_queue.flush(command_queue.current_pass())
+        send.assert_called_once_with([(4, "eps_telem_hk_get_cb")])
+        self.assertEqual(self.statuses()["obc_cmd_jump_ram_cb"], "unknown")
+
+    def test_stale_telecommand_is_not_resent(self):
+        claimed = datetime.datetime.now() - datetime.timedelta(
+            seconds=command_queue.SENDING_TIMEOUT + 1
+        )
+        entry = command_queue.enqueue(1, "obc_cmd_jump_ram_cb")
+        self.queue.update_one(
+            {"_id": entry["_id"]},
+            {"$set": {"status": "sending", "flush": "dead", "claimed": claimed}},
+        )
+
+        with mock.patch.object(relay, "send_pipelined") as send:
+            command_queue.flush(command_queue.current_pass())
+        send.assert_not_called()
+        self.assertEqual(self.statuses(), {"obc_cmd_jump_ram_cb": "unknown"})
@@ -4,4 +4,7 @@ from . import views
 urlpatterns = [
     path("/upload-passes", views.parse_and_store_gpredict_data, name="upload-passes"),
     path("/next-pass", views.get_next_satellite_pass, name="next-pass"),
+    path("/collect-hk", views.collect_housekeeping, name="collect-hk"),
+    path("/command-queue", views.command_queue_view, name="command-queue"),
+    path("/flush-queue", views.flush_command_queue, name="flush-queue"),
 ]
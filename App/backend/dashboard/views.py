@@ -1,17 +1,14 @@
 from django.http import JsonResponse
-from pymongo import MongoClient
 import datetime
+import logging
+import codec
+from backend import relay, storage
+from backend.responses import CodecResponse
+from dashboard import command_queue
 from django.views.decorators.csrf import csrf_exempt
 import os
-import certifi
 
-# Replace with your MongoDB connection details
-client = MongoClient(
-    "",
-    tlsCAFile=certifi.where(),
-)
-db = client.myDatabase
-collection = db.dashboard_collection
+logger = logging.getLogger(__name__)
 
 
 @csrf_exempt
@@ -56,7 +53,7 @@ def parse_and_store_gpredict_data():
                 )
 
                 # Store in MongoDB
-                collection.insert_one(
+                storage.pass_collection().insert_one(
                     {
                         "aos": aos,
                         "tca": tca,
@@ -77,12 +74,121 @@ def parse_and_store_gpredict_data():
 def get_next_satellite_pass(request):
     parse_and_store_gpredict_data()
     now = datetime.datetime.now()
-    next_pass = collection.find_one({"aos": {"$gt": now}}, sort=[("aos", 1)])
+    next_pass = storage.pass_collection().find_one(
+        {"aos": {"$gt": now}}, sort=[("aos", 1)]
+    )
 
     if next_pass:
-        next_pass["_id"] = str(next_pass["_id"])
-        next_pass["aos"] = next_pass["aos"].isoformat()
-        next_pass["los"] = next_pass["los"].isoformat()
-        return JsonResponse(next_pass)
+        return CodecResponse(next_pass)
     else:
         return JsonResponse({"message": "No upcoming passes found"})
+
+
+# Housekeeping sweep: one batch round trip to the server for every subsystem
+# (or the [module, command] pairs posted as "commands"), stored with one
+# insert_many per subsystem collection
+@csrf_exempt
+def collect_housekeeping(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Unsupported request method."}, status=405)
+
+    try:
+        request_data = codec.loads(request.body or b"{}")
+        commands = request_data.get("commands") or relay.HK_SWEEP
+        if any(
+            int(module_num) not in storage.MODULE_COLLECTIONS
+            for module_num, _ in commands
+        ):
+            return JsonResponse({"error": "Invalid request data."}, status=400)
+        if len(commands) > relay.MAX_BATCH:
+            return JsonResponse(
+                {"error": f"At most {relay.MAX_BATCH} commands per request."},
+                status=400,
+            )
+
+        try:
+            replies = relay.send_batch(commands)
+        except ValueError:
+            return JsonResponse({"error": "Invalid acknowledgment format."}, status=500)
+
+        documents = []
+        skipped = []
+        for module_num, command, reply in replies:
+            # Unknown commands come back as plain strings, not documents
+            if isinstance(reply, dict):
+                documents.append((module_num, reply))
+            else:
+                skipped.append({"command": command, "reply": reply})
+
+        inserted = storage.store_many(documents) if documents else {}
+
+        return JsonResponse(
+            {
+                "message": "Data inserted successfully",
+                "inserted": inserted,
+                "skipped": skipped,
+            }
+        )
+
+    except (TypeError, ValueError) as e:
+        logger.error(f"Error parsing request data: {str(e)}")
+        return JsonResponse({"error": "Invalid JSON data."}, status=400)
+    except OSError as e:
+        logger.error(f"Socket error: {str(e)}")
+        return JsonResponse({"error": "Error connecting to the server."}, status=500)
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}")
+        return JsonResponse({"error": "An unexpected error occurred."}, status=500)
+
+
+# GET: commands waiting for a pass (?status=sent for the flushed ones,
+# ?status=unknown for telecommands a failed flush may have sent) and the next
+# pass. POST {"module": 4, "command": "..."}: queue a command for the
+# next pass even when one is in progress.
+@csrf_exempt
+def command_queue_view(request):
+    if request.method == "GET":
+        status = request.GET.get("status", "queued")
+        entries = storage.command_queue_collection().find(
+            {"status": status}, sort=[("submitted", 1)], limit=500
+        )
+        return CodecResponse(
+            {"commands": list(entries), "next_pass": command_queue.next_pass()}
+        )
+    if request.method != "POST":
+        return JsonResponse({"error": "Unsupported request method."}, status=405)
+
+    try:
+        request_data = codec.loads(request.body)
+        module_num = int(request_data["module"])
+        command = request_data["command"]
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "Invalid request data."}, status=400)
+    if module_num not in storage.MODULE_COLLECTIONS or not command:
+        return JsonResponse({"error": "Invalid request data."}, status=400)
+    return CodecResponse(command_queue.enqueue(module_num, command), status=202)
+
+
+# Flush the queue now; only while a pass is in progress
+@csrf_exempt
+def flush_command_queue(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Unsupported request method."}, status=405)
+
+    window = command_queue.current_pass()
+    if window is None:
+        return JsonResponse({"error": "No pass in progress."}, status=409)
+    try:
+        replies = command_queue.flush(window)
+    except (OSError, TimeoutError, ValueError) as e:
+        logger.error(f"Socket error: {str(e)}")
+        return JsonResponse({"error": "Error connecting to the server."}, status=500)
+    return CodecResponse(
+        {
+            "message": "Queue flushed",
+            "sent": [
+                {"module": module_num, "command": command, "reply": reply}
+                for module_num, command, reply in replies
+            ],
+        }
+    )
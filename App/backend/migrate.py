@@ -0,0 +1,105 @@
+import argparse
+import os
+
+import django
+
+# Migrations of the telemetry stored in MongoDB, run against the database
+# MONGODB_URI points at (give --mongo-uri to override it).
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+
+
+def setup(mongo_uri=None):
+    if mongo_uri:
+        os.environ["MONGODB_URI"] = mongo_uri
+    django.setup()
+
+
+# Tag the replies stored before backend/ingest.py with their kind, subsystem,
+# ts and stored_at, and create the indexes the fetch views read through
+def normalize(args):
+    setup(args.mongo_uri)
+    from backend import ingest, storage
+
+    db = storage.database()
+    for module_num, name in storage.MODULE_COLLECTIONS.items():
+        collection = db[name]
+        updated = ingest.backfill(collection, module_num, args.batch_size)
+        ingest.ensure_index(collection)
+        print(f"{name}: {updated} documents updated")
+
+
+# Move the periodic telemetry (ingest.TIMESERIES_KINDS) of the subsystem
+# collections into the time-series collection, batch_size documents at a
+# time; run it with the views stopped, then turn MONGODB_TIMESERIES on.
+# Documents are deleted from their collection once copied, so an interrupted
+# run can be resumed; with --keep they stay, and a second run copies them
+# again.
+def timeseries(args):
+    setup(args.mongo_uri)
+    from django.conf import settings
+
+    from backend import ingest, storage
+
+    db = storage.database()
+    target = storage.create_timeseries(db)
+    ingest.ensure_timeseries_index(target)
+    query = {
+        "$or": [
+            {"kind": {"$in": sorted(ingest.TIMESERIES_KINDS)}},
+            {"kind": {"$exists": False}},
+        ]
+    }
+
+    def move(source, batch):
+        target.insert_many([ingest.timeseries_document(doc) for doc in batch])
+        if not args.keep:
+            source.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        return len(batch)
+
+    for module_num, name in storage.MODULE_COLLECTIONS.items():
+        source = db[name]
+        moved = 0
+        batch = []
+        for doc in source.find(query, batch_size=args.batch_size):
+            stored_at = doc.get("stored_at") or ingest.stored_at_of(doc)
+            # Stored before backend/ingest.py: tag it first
+            if "kind" not in doc:
+                raw = {key: value for key, value in doc.items() if key != "_id"}
+                doc.update(ingest.envelope(module_num, raw))
+            doc["stored_at"] = stored_at
+            if doc["kind"] not in ingest.TIMESERIES_KINDS:
+                continue
+            batch.append(doc)
+            if len(batch) >= args.batch_size:
+                moved += move(source, batch)
+                batch = []
+        if batch:
+            moved += move(source, batch)
+        print(f"{name}: {moved} documents moved")
+    if not settings.MONGODB_TIMESERIES:
+        print("Set MONGODB_TIMESERIES=1 for the views to read and write them there")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stored telemetry migrations")
+    parser.add_argument("--mongo-uri", help="default: the MONGODB_URI setting")
+    subparsers = parser.add_subparsers(dest="migration", required=True)
+
+    normalize_parser = subparsers.add_parser(
+        "normalize", help="add kind, subsystem, ts and stored_at to existing replies"
+    )
+    normalize_parser.add_argument("--batch-size", type=int, default=1000)
+    normalize_parser.set_defaults(func=normalize)
+
+    timeseries_parser = subparsers.add_parser(
+        "timeseries", help="move telemetry into the time-series collection"
+    )
+    timeseries_parser.add_argument("--batch-size", type=int, default=1000)
+    timeseries_parser.add_argument(
+        "--keep", action="store_true", help="leave the original documents in place"
+    )
+    timeseries_parser.set_defaults(func=timeseries)
+
+    args = parser.parse_args()
+    args.func(args)
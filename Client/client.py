@@ -1,49 +1,876 @@
+import argparse
+import asyncio
+import itertools
+import logging
+import os
 import socket
+import sys
 import threading
+import time
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Shared")
+)
+import codec
+import framing
+import logs
+import metrics
+import prefork
+import response_cache
+import singleflight
+import uplink
+import workers
+
+SERVER_ADDRESS = ("localhost", 2738)
+DEFAULT_METRICS_PORT = 9847
+DEFAULT_UPSTREAM_CONNECTIONS = 4
+
+# Per-command counts, errors and upstream round-trip latency as seen here
+relay_metrics = metrics.Metrics("tmtc_relay", ("module", "command"))
+
+# asyncio mode: time spent in the relay itself vs. waiting on the server
+hop_metrics = metrics.Metrics("tmtc_relay_hops", ("hop",))
+
+# Replies to read-only config commands, served here without reaching the server
+reply_cache = response_cache.ResponseCache()
+relay_metrics.add_gauges(reply_cache.stats)
+relay_metrics.add_gauges(logs.stats)
+
+# Service messages, and the per-request records (sampled with --log-sample)
+log = logging.getLogger("tmtc_relay")
+request_log = logging.getLogger("tmtc_relay.requests")
+
+# Long-lived framed connection to the server, shared by all views connections
+upstream = None
+upstream_lock = threading.Lock()
+
+# Identical read-only requests in flight share one upstream call (threaded and
+# pool mode use coalesced, asyncio mode coalesced_async)
+coalesced = singleflight.Group()
+coalesced_async = singleflight.CallbackGroup()
+
+
+def get_upstream():
+    global upstream
+    with upstream_lock:
+        if upstream is None or upstream.closed:
+            upstream = framing.FramedConnection(SERVER_ADDRESS)
+        return upstream
+
+
+# Future (flags, payload) of the server's reply, shared with the identical
+# read-only requests already on their way
+def submit_upstream(request, payload, flags):
+    if uplink.is_read_only(request):
+        return coalesced.submit(
+            (payload, flags), lambda: get_upstream().submit(payload, flags)
+        )
+    return get_upstream().submit(payload, flags)
+
+
+# (station, module, command) of a request, or None when malformed
+def parse_command(payload):
+    parts = payload.decode("utf-8", "replace").split(",")
+    if len(parts) != 3:
+        return None
+    return tuple(parts)
+
+
+# Metrics key of a request
+def command_key(request):
+    if request is None:
+        return ("invalid", "invalid")
+    return request[1:]
+
+
+# Drop the cached replies a set/reset command changes. Called when the command
+# is forwarded and again when its reply comes back, so a get answered in
+# between is not cached with the old value. Covers commands inside a batch.
+def invalidate_cache(request):
+    if request is None:
+        return
+    station, module_num, command = request
+    if module_num == "batch":
+        for item in command.split(";"):
+            item_module, separator, item_command = item.partition(":")
+            reply_cache.invalidate(item_module, item_command)
+    else:
+        reply_cache.invalidate(module_num, command)
+
+
+# Cached (flags, payload) reply, or a token to store the reply under on a miss
+def cache_lookup(request, flags):
+    if request is None:
+        return None, None
+    return reply_cache.lookup(request + (flags,))
+
+
+def cache_reply(request, token, flags, payload):
+    invalidate_cache(request)
+    if token is not None:
+        reply_cache.store(token, (flags, payload))
+
+
+# Forward framed requests over the shared upstream connection. Each reply is
+# sent back under the views' own request id as soon as it arrives, so replies
+# may overtake each other.
+def relay_framed_connection(views_socket):
+    send_lock = threading.Lock()
+    in_flight = threading.Condition()
+    pending = [0]
+
+    def forward_reply(request_id, request, token, start, future):
+        try:
+            send_reply(request_id, request, token, start, future)
+        finally:
+            with in_flight:
+                pending[0] -= 1
+                in_flight.notify_all()
+
+    def send_reply(request_id, request, token, start, future):
+        relay_metrics.record(
+            command_key(request),
+            time.perf_counter() - start,
+            future.exception() is not None,
+        )
+        try:
+            flags, payload = future.result()
+            cache_reply(request, token, flags, payload)
+            if flags & (framing.FLAG_BINARY_HK | framing.FLAG_MSGPACK):
+                request_log.info(
+                    "Server Acknowledgment: binary frame, %d bytes", len(payload)
+                )
+            else:
+                request_log.info("Server Acknowledgment: %s", logs.text(payload))
+            with send_lock:
+                framing.send_frame(views_socket, request_id, payload, flags)
+        except Exception as e:
+            log.error("An error occurred: %s", e)
+            # Dropping the connection fails every request still waiting on it
+            try:
+                views_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    try:
+        while True:
+            frame = framing.recv_frame(views_socket)
+            if frame is None:
+                break
+
+            request_id, flags, payload = frame
+            if flags & framing.FLAG_PING:
+                with send_lock:
+                    framing.send_frame(views_socket, request_id, b"", flags)
+                continue
+            request_log.info("Received data: %s", logs.text(payload))
+
+            start = time.perf_counter()
+            request = parse_command(payload)
+            invalidate_cache(request)
+            cached, token = cache_lookup(request, flags)
+            if cached is not None:
+                relay_metrics.record(command_key(request), time.perf_counter() - start)
+                with send_lock:
+                    framing.send_frame(views_socket, request_id, cached[1], cached[0])
+                continue
+
+            # Counted, not kept: the connection may stay open for days
+            with in_flight:
+                pending[0] += 1
+            try:
+                future = submit_upstream(request, payload, flags)
+            except BaseException:
+                with in_flight:
+                    pending[0] -= 1
+                raise
+            future.add_done_callback(
+                lambda done, request_id=request_id, request=request, token=token, start=start: (
+                    forward_reply(request_id, request, token, start, done)
+                )
+            )
+    finally:
+        with in_flight:
+            in_flight.wait_for(lambda: pending[0] == 0)
+
+
+# Legacy one-shot CSV request, forwarded over a connection of its own
+def relay_legacy_request(views_socket):
+    data = views_socket.recv(1024)
+    if not data:
+        return
+
+    received_data = data.decode("utf-8")
+    request_log.info("Received data: %s", received_data)
+
+    # Processing and validation logic for received_data (if needed)
+    request = parse_command(data)
+    invalidate_cache(request)
+
+    with relay_metrics.timed(command_key(request)):
+        cached, token = cache_lookup(request, framing.FLAG_NONE)
+        if cached is not None:
+            acknowledgment = cached[1]
+        else:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+                server_socket.connect(SERVER_ADDRESS)
+                server_socket.sendall(received_data.encode("utf-8"))
+
+                # The server closes the connection once the whole reply is sent
+                acknowledgment = framing.recv_all(server_socket)
+                request_log.info("Server Acknowledgment: %s", logs.text(acknowledgment))
+            cache_reply(request, token, framing.FLAG_NONE, acknowledgment)
+
+    views_socket.sendall(acknowledgment)
 
 
 def handle_client_connection(views_socket):
     try:
-        data = views_socket.recv(1024)
-        if not data:
-            return
+        if framing.peek_framed(views_socket):
+            relay_framed_connection(views_socket)
+        else:
+            relay_legacy_request(views_socket)
+    except Exception as e:
+        log.error("An error occurred: %s", e)
+    finally:
+        views_socket.close()
+
+
+# Framed reply to requests refused by a saturated worker pool
+OVERLOAD_REPLY = codec.dumps({"error": workers.OVERLOAD_ERROR})
 
-        received_data = data.decode("utf-8")
-        print(f"Received data: {received_data}")
 
-        # Processing and validation logic for received_data (if needed)
+# Framed reply to a request the server could not answer
+def upstream_error_reply(error):
+    return codec.dumps({"error": f"Server request failed: {error}"})
 
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-            server_socket.connect(("localhost", 2738))
-            server_socket.send(received_data.encode("utf-8"))
 
-            acknowledgment = server_socket.recv(1024)
-            print(f"Server Acknowledgment: {acknowledgment.decode('utf-8')}")
+# Framed connection in pool mode: each request waits on the server in a pool
+# worker, so the pool size bounds the requests in flight upstream
+def pool_framed_connection(views_socket, pool, connection_slots):
+    send_lock = threading.Lock()
+    in_flight = threading.Condition()
+    pending = [0]
 
-        views_socket.send(acknowledgment)
+    # The server's reply, or an error reply the caller gets right away instead
+    # of waiting out its timeout
+    def answer(flags, payload, request, token):
+        try:
+            with relay_metrics.timed(command_key(request)):
+                reply_flags, reply = submit_upstream(request, payload, flags).result()
+        except Exception as e:
+            log.error("An error occurred: %s", e)
+            return framing.FLAG_NONE, upstream_error_reply(e)
+        cache_reply(request, token, reply_flags, reply)
+        return reply_flags, reply
+
+    def forward(request_id, flags, payload, request, token):
+        try:
+            reply_flags, reply = answer(flags, payload, request, token)
+            with send_lock:
+                framing.send_frame(views_socket, request_id, reply, reply_flags)
+        except OSError as e:
+            log.error("An error occurred: %s", e)
+            # Dropping the connection fails every request still waiting on it
+            try:
+                views_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        finally:
+            with in_flight:
+                pending[0] -= 1
+                in_flight.notify_all()
+
+    try:
+        while True:
+            frame = framing.recv_frame(views_socket)
+            if frame is None:
+                break
+            request_id, flags, payload = frame
+            if flags & framing.FLAG_PING:
+                with send_lock:
+                    framing.send_frame(views_socket, request_id, b"", flags)
+                continue
+            request_log.info("Received data: %s", logs.text(payload))
+            request = parse_command(payload)
+            invalidate_cache(request)
+            cached, token = cache_lookup(request, flags)
+            if cached is not None:
+                relay_metrics.record(command_key(request), 0.0)
+                with send_lock:
+                    framing.send_frame(views_socket, request_id, cached[1], cached[0])
+                continue
+
+            with in_flight:
+                pending[0] += 1
+            if not pool.submit(forward, request_id, flags, payload, request, token):
+                relay_metrics.record(command_key(request), 0.0, error=True)
+                with in_flight:
+                    pending[0] -= 1
+                with send_lock:
+                    framing.send_frame(views_socket, request_id, OVERLOAD_REPLY)
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error("An error occurred: %s", e)
     finally:
+        with in_flight:
+            in_flight.wait_for(lambda: pending[0] == 0)
         views_socket.close()
+        connection_slots.release()
+
 
+# First task of every connection in pool mode; framed connections get a
+# reader thread of their own, at most max_connections of them
+def pool_client_connection(views_socket, pool, connection_slots):
+    try:
+        if framing.peek_framed(views_socket):
+            if connection_slots.acquire(blocking=False):
+                threading.Thread(
+                    target=pool_framed_connection,
+                    args=(views_socket, pool, connection_slots),
+                    daemon=True,
+                ).start()
+                return
+            log.warning("Connection limit reached, dropping framed connection")
+        else:
+            relay_legacy_request(views_socket)
+    except Exception as e:
+        log.error("An error occurred: %s", e)
+    views_socket.close()
 
-def start_listener():
+
+def start_listener(
+    host="localhost",
+    port=2847,
+    backlog=1,
+    pool=None,
+    max_connections=workers.DEFAULT_QUEUE_DEPTH,
+    reuse_port=False,
+):
+    connection_slots = threading.BoundedSemaphore(max_connections)
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener_socket:
-        listener_socket.bind(("localhost", 2847))
-        listener_socket.listen(1)
-        print("Client is listening for connections...")
+        listener_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            prefork.set_reuse_port(listener_socket)
+        listener_socket.bind((host, port))
+        listener_socket.listen(backlog)
+        log.info("Client is listening for connections...")
 
         while True:
             try:
                 views_socket, views_address = listener_socket.accept()
-                print(f"Accepted connection from {views_address}")
-                threading.Thread(
-                    target=handle_client_connection, args=(views_socket,)
-                ).start()
+                request_log.info("Accepted connection from %s", views_address)
+                if pool is None:
+                    threading.Thread(
+                        target=handle_client_connection, args=(views_socket,)
+                    ).start()
+                elif not pool.submit(
+                    pool_client_connection, views_socket, pool, connection_slots
+                ):
+                    log.warning("Worker pool saturated, dropping connection")
+                    views_socket.close()
             except Exception as e:
-                print(f"An error occurred: {e}")
-                break
+                # e.g. out of file descriptors; keep accepting once it clears
+                log.error("An error occurred: %s", e)
+                time.sleep(0.1)
+
+
+# One framed connection to the server in the asyncio relay. Requests from any
+# views connection are pipelined over it; each reply goes to the callback
+# registered under its request id, as callback(flags, payload, error).
+class UpstreamProtocol(asyncio.Protocol):
+    def __init__(self):
+        self.transport = None
+        self.parser = framing.FrameParser()
+        self._ids = itertools.count(1)
+        self._callbacks = {}
+        self.closed = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        try:
+            frames = self.parser.feed(data)
+        except framing.FramingError as e:
+            log.error("An error occurred: %s", e)
+            self.transport.close()
+            return
+        for request_id, flags, payload in frames:
+            callback = self._callbacks.pop(request_id, None)
+            if callback is not None:
+                callback(flags, payload, None)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        error = exc or framing.FramingError("Connection closed by peer")
+        callbacks, self._callbacks = self._callbacks, {}
+        for callback in callbacks.values():
+            callback(None, None, error)
+
+    # Requests waiting for their reply
+    @property
+    def pending(self):
+        return len(self._callbacks)
+
+    def send(self, payload, flags, callback):
+        request_id = next(self._ids) & 0xFFFFFFFF
+        self._callbacks[request_id] = callback
+        self.transport.write(framing.encode_frame(request_id, payload, flags))
+
+
+# Warm connections to the server. Requests go to the open connection with the
+# fewest replies outstanding; closed ones are reopened in the background.
+class UpstreamPool:
+    def __init__(self, address=SERVER_ADDRESS, size=DEFAULT_UPSTREAM_CONNECTIONS):
+        self.address = address
+        self.connections = [None] * size
+        self._connecting = [None] * size
+
+    async def _connect(self, slot):
+        try:
+            transport, connection = await asyncio.get_running_loop().create_connection(
+                UpstreamProtocol, *self.address
+            )
+            self.connections[slot] = connection
+            return connection
+        except OSError as e:
+            log.warning("Could not connect to the server: %s", e)
+            return None
+        finally:
+            self._connecting[slot] = None
+
+    # Connection attempt for slot, starting one unless it is under way
+    def _reconnect(self, slot):
+        if self._connecting[slot] is None:
+            self._connecting[slot] = asyncio.ensure_future(self._connect(slot))
+        return self._connecting[slot]
+
+    # Open every connection up front so the first requests skip the handshake
+    async def warm(self):
+        await asyncio.gather(
+            *(self._reconnect(slot) for slot in range(len(self.connections)))
+        )
+
+    # Forward the request bytes as they are; callback(flags, payload, error)
+    def send(self, payload, flags, callback):
+        best = None
+        for slot, connection in enumerate(self.connections):
+            if connection is None or connection.closed:
+                self._reconnect(slot)
+            elif best is None or connection.pending < best.pending:
+                best = connection
+        if best is not None:
+            best.send(payload, flags, callback)
+        else:
+            asyncio.ensure_future(self._send_when_connected(payload, flags, callback))
+
+    async def _send_when_connected(self, payload, flags, callback):
+        connection = await self._reconnect(0)
+        if connection is None or connection.closed:
+            callback(None, None, framing.FramingError("Server unavailable"))
+        else:
+            connection.send(payload, flags, callback)
+
+    def stats(self):
+        open_connections = [
+            connection
+            for connection in self.connections
+            if connection is not None and not connection.closed
+        ]
+        return {
+            "upstream_connections": len(open_connections),
+            "upstream_pending": sum(c.pending for c in open_connections),
+        }
+
+
+# Relay one request from the reply cache, or through the uplink scheduler and
+# the upstream pool, and hand the reply to reply(flags, payload, error).
+# Payloads stay bytes end to end; a request shed from a full uplink queue is
+# answered with OVERLOAD_REPLY. Records the time spent queued for the uplink,
+# upstream and in the relay itself separately.
+def relay_async_request(upstream_pool, scheduler, payload, flags, reply):
+    start = time.perf_counter()
+    request = parse_command(payload)
+    invalidate_cache(request)
+    cached, token = cache_lookup(request, flags)
+    if cached is not None:
+        reply(cached[0], cached[1], None)
+        record_hops(request, start, 0.0, 0.0, False)
+        return
+
+    # Identical read-only requests in flight wait for the same reply
+    coalesce = uplink.is_read_only(request)
+    if coalesce:
+        key = (payload, flags)
+
+        def follow(reply_flags, reply_payload, error):
+            reply(reply_flags, reply_payload, error)
+            relay_metrics.record(
+                command_key(request), time.perf_counter() - start, error is not None
+            )
+
+        if not coalesced_async.join(key, follow):
+            return
+
+    priority = uplink.classify(request)
+
+    def transmit(queued_time):
+        sent = time.perf_counter()
+
+        def on_reply(reply_flags, reply_payload, error):
+            upstream_time = time.perf_counter() - sent
+            if error is None:
+                cache_reply(request, token, reply_flags, reply_payload)
+                update_uplink_rate(scheduler, request, reply_flags, reply_payload)
+            reply(reply_flags, reply_payload, error)
+            if coalesce:
+                coalesced_async.finish(key, reply_flags, reply_payload, error)
+            record_hops(request, start, queued_time, upstream_time, error is not None)
+
+        upstream_pool.send(payload, flags, on_reply)
+
+    def shed():
+        reply(framing.FLAG_NONE, OVERLOAD_REPLY, None)
+        if coalesce:
+            coalesced_async.finish(key, framing.FLAG_NONE, OVERLOAD_REPLY, None)
+        relay_metrics.record(command_key(request), time.perf_counter() - start, True)
+
+    request_log.debug(
+        "Queued %s as %s", command_key(request), uplink.PRIORITY_NAMES[priority]
+    )
+    scheduler.submit(priority, framing.HEADER.size + len(payload), transmit, shed)
+
+
+def record_hops(request, start, queued_time, upstream_time, error):
+    total = time.perf_counter() - start
+    relay_metrics.record(command_key(request), total, error)
+    hop_metrics.record(("uplink_queue",), queued_time)
+    hop_metrics.record(("upstream",), upstream_time, error)
+    hop_metrics.record(("relay",), total - queued_time - upstream_time)
+    request_log.debug(
+        "Relayed %s in %.0f us (queued %.0f us, upstream %.0f us)",
+        command_key(request),
+        total * 1e6,
+        queued_time * 1e6,
+        upstream_time * 1e6,
+    )
+
+
+# Commands whose replies carry the COM receive configuration
+RECEIVE_CONFIG_COMMANDS = {
+    ("3", "com_cmd_get_config_rx_cb"): "receive_config",
+    ("3", "com_cmd_set_config_rx_cb"): "receive_config_set",
+}
+
+# Uplink pacing, off by default so the relay adds no delay of its own. Start
+# the relay with --uplink-rate com to pace requests at the rate of the COM
+# receive link, following its configuration as it passes through, or with
+# --uplink-rate <bytes/s> for a fixed rate. Only the request bytes are
+# counted, so either mode models the uplink, not the replies.
+uplink_rate_mode = "0"
+
+
+# Follow the COM receive configuration in the replies passing through
+def update_uplink_rate(scheduler, request, reply_flags, reply_payload):
+    if uplink_rate_mode != "com" or request is None:
+        return
+    field = RECEIVE_CONFIG_COMMANDS.get(request[1:])
+    if field is None:
+        return
+    try:
+        receive_config = codec.for_flags(reply_flags).loads(reply_payload)[field]
+        rate = uplink.link_rate(receive_config)
+    except (ValueError, TypeError, KeyError) as e:
+        log.warning("Unreadable COM receive configuration: %s", e)
+        return
+    if rate and rate != scheduler.bucket.link_rate:
+        log.info("Uplink rate set to %.0f bytes/s from the COM configuration", rate)
+        scheduler.set_rate(rate)
+
+
+# Ask the server for the COM receive configuration to size the token bucket,
+# retrying every retry_interval seconds until it answers
+async def fetch_uplink_rate(upstream_pool, scheduler, retry_interval=5.0):
+    request = ("10", "3", "com_cmd_get_config_rx_cb")
+    while True:
+        future = asyncio.get_running_loop().create_future()
+
+        def on_reply(reply_flags, reply_payload, error):
+            if error is None:
+                update_uplink_rate(scheduler, request, reply_flags, reply_payload)
+            future.set_result(error)
+
+        upstream_pool.send(
+            ",".join(request).encode("utf-8"), framing.FLAG_NONE, on_reply
+        )
+        error = await future
+        if error is None:
+            return
+        log.warning("Uplink rate unknown, not limiting until it is read: %s", error)
+        await asyncio.sleep(retry_interval)
+
+
+# A views connection in the asyncio relay: frames are forwarded as soon as
+# they are parsed and replies written back as they come, possibly out of order
+class RelayProtocol(asyncio.Protocol):
+    def __init__(self, upstream_pool, scheduler, connection_slots):
+        self.upstream_pool = upstream_pool
+        self.scheduler = scheduler
+        self.connection_slots = connection_slots
+        self.transport = None
+        self.parser = None
+        self.prefix = b""
+        self.legacy = False
+        self.has_slot = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.connection_slots[0] == 0:
+            log.warning("Connection limit reached, dropping connection")
+            transport.abort()
+            return
+        self.connection_slots[0] -= 1
+        self.has_slot = True
+        request_log.info(
+            "Accepted connection from %s", transport.get_extra_info("peername")
+        )
+
+    def connection_lost(self, exc):
+        if self.has_slot:
+            self.connection_slots[0] += 1
+
+    def data_received(self, data):
+        if self.legacy:
+            return
+        if self.parser is None:
+            # Tell the protocols apart by the first bytes
+            data = self.prefix + data
+            if len(data) < len(framing.MAGIC):
+                self.prefix = data
+                return
+            self.prefix = b""
+            if not framing.is_framed(data):
+                self.relay_legacy(data[:1024])
+                return
+            self.parser = framing.FrameParser()
+        try:
+            frames = self.parser.feed(data)
+        except framing.FramingError as e:
+            log.error("An error occurred: %s", e)
+            self.transport.close()
+            return
+        for request_id, flags, payload in frames:
+            self.relay_frame(request_id, flags, payload)
+
+    def eof_received(self):
+        if self.parser is None and self.prefix:
+            self.relay_legacy(self.prefix)
+        # Keep the connection open for a legacy reply still on its way
+        return self.legacy
+
+    def relay_frame(self, request_id, flags, payload):
+        if flags & framing.FLAG_PING:
+            self.transport.write(framing.encode_frame(request_id, b"", flags))
+            return
+        request_log.info("Received data: %s", logs.text(payload))
+
+        def reply(reply_flags, reply_payload, error):
+            if error is not None:
+                log.error("An error occurred: %s", error)
+                # As in the threaded relay, dropping the connection fails the
+                # views' pending requests at once
+                self.transport.close()
+            elif not self.transport.is_closing():
+                self.transport.write(
+                    framing.encode_frame(request_id, reply_payload, reply_flags)
+                )
+
+        relay_async_request(self.upstream_pool, self.scheduler, payload, flags, reply)
+
+    # Legacy one-shot CSV request, relayed over a pooled framed connection
+    # rather than a connection of its own
+    def relay_legacy(self, data):
+        self.legacy = True
+        request_log.info("Received data: %s", logs.text(data))
+
+        def reply(reply_flags, reply_payload, error):
+            if error is not None:
+                log.error("An error occurred: %s", error)
+            elif not self.transport.is_closing():
+                self.transport.write(reply_payload)
+            self.transport.close()
+
+        relay_async_request(
+            self.upstream_pool, self.scheduler, data, framing.FLAG_NONE, reply
+        )
+
+
+async def serve_async(
+    host="localhost",
+    port=2847,
+    backlog=1,
+    max_connections=workers.DEFAULT_QUEUE_DEPTH,
+    upstream_connections=DEFAULT_UPSTREAM_CONNECTIONS,
+    reuse_port=False,
+    uplink_queue_depth=uplink.DEFAULT_MAX_DEPTH,
+    processes=1,
+):
+    upstream_pool = UpstreamPool(SERVER_ADDRESS, upstream_connections)
+    relay_metrics.add_gauges(upstream_pool.stats)
+    fixed_rate = 0.0 if uplink_rate_mode == "com" else float(uplink_rate_mode)
+    # The processes sharing the port split the one link between them
+    scheduler = uplink.PriorityScheduler(
+        uplink.TokenBucket(fixed_rate, shares=processes), uplink_queue_depth
+    )
+    relay_metrics.add_gauges(scheduler.stats)
+    await upstream_pool.warm()
+    if uplink_rate_mode == "com":
+        rate_task = asyncio.create_task(fetch_uplink_rate(upstream_pool, scheduler))
+    # Free connection slots; connections beyond the cap are dropped
+    connection_slots = [max_connections]
+    server = await asyncio.get_running_loop().create_server(
+        lambda: RelayProtocol(upstream_pool, scheduler, connection_slots),
+        host,
+        port,
+        backlog=backlog,
+        reuse_port=reuse_port or None,
+    )
+    log.info("Client is listening for connections...")
+    async with server:
+        await server.serve_forever()
+
+
+# Relay from this process; index numbers it in multi-process mode (None when
+# running alone) and offsets its metrics port
+def run(index, args):
+    if args.metrics_port:
+        metrics.serve_metrics(
+            [relay_metrics, hop_metrics], args.host, args.metrics_port + (index or 0)
+        )
+    if args.mode == "asyncio":
+        relay_metrics.add_gauges(coalesced_async.stats)
+        asyncio.run(
+            serve_async(
+                args.host,
+                args.port,
+                args.backlog,
+                args.max_connections,
+                args.upstream_connections,
+                reuse_port=index is not None,
+                uplink_queue_depth=args.uplink_queue_depth,
+                processes=args.processes,
+            )
+        )
+        return
+    relay_metrics.add_gauges(coalesced.stats)
+    pool = None
+    if args.mode == "pool":
+        pool = workers.WorkerPool(args.workers, args.queue_depth)
+        relay_metrics.add_gauges(pool.stats)
+        if args.stats_interval:
+            workers.report_stats(pool, args.stats_interval)
+    start_listener(
+        args.host,
+        args.port,
+        args.backlog,
+        pool,
+        args.max_connections,
+        reuse_port=index is not None,
+    )
+
+
+# --uplink-rate: "com" or a number of bytes per second
+def uplink_rate(value):
+    if value == "com":
+        return value
+    try:
+        float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not 'com' or a rate: {value}")
+    return value
 
 
 if __name__ == "__main__":
-    start_listener()
+    parser = argparse.ArgumentParser(
+        description="Relay between the views and the server"
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["asyncio", "threaded", "pool"],
+        default="asyncio",
+        help="asyncio proxy over pooled upstream connections, thread per "
+        "connection or a bounded worker pool",
+    )
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=2847)
+    parser.add_argument("--backlog", type=int, default=1)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="relay processes sharing the port through SO_REUSEPORT",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=workers.DEFAULT_QUEUE_DEPTH,
+        help="connections served at once in pool and asyncio mode",
+    )
+    parser.add_argument(
+        "--upstream-connections",
+        type=int,
+        default=DEFAULT_UPSTREAM_CONNECTIONS,
+        help="warm connections to the server in asyncio mode",
+    )
+    parser.add_argument(
+        "--uplink-rate",
+        type=uplink_rate,
+        default="0",
+        help="asyncio mode: uplink bytes/s for the token bucket, 'com' to follow "
+        "the COM receive configuration, or 0 (default) for no limit",
+    )
+    parser.add_argument(
+        "--uplink-queue-depth",
+        type=int,
+        default=uplink.DEFAULT_MAX_DEPTH,
+        help="asyncio mode: requests waiting for the uplink before the least "
+        "urgent is shed",
+    )
+    parser.add_argument("--workers", type=int, default=workers.DEFAULT_WORKERS)
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=workers.DEFAULT_QUEUE_DEPTH,
+        help="requests waiting for a worker before new ones are refused",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=60.0,
+        help="seconds between worker pool stats lines in pool mode (0: off)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=DEFAULT_METRICS_PORT,
+        help="HTTP port serving /metrics and /metrics.json (0: off)",
+    )
+    parser.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="answer read-only config commands from the reply cache",
+    )
+    logs.add_arguments(parser)
+    args = parser.parse_args()
+
+    logs.setup_from_args("tmtc_relay", args)
+    if not args.cache:
+        reply_cache.ttls.clear()
+    uplink_rate_mode = args.uplink_rate
+    if args.processes > 1:
+        # A set relayed by any process invalidates the cache of all of them
+        reply_cache.share()
+        prefork.run_processes(args.processes, run, args)
+    else:
+        run(None, args)
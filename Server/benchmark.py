@@ -0,0 +1,393 @@
+import argparse
+import datetime
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+
+from server import CommandRegistry, MODULE_NAMES, registry, eps_telem_hk_get_cb
+import codec  # importable once server.py has put Shared/ on the path
+import framing
+import hk_schema
+
+try:
+    from bson import ObjectId
+except ImportError:  # history documents get string ids without pymongo
+    ObjectId = None
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+# Callback used to isolate the dispatch cost from the command work
+def noop_cb():
+    return None
+
+
+# Average cost in nanoseconds of calling func(name) over a list of names
+def time_per_call(func, names, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for name in names:
+            func(name)
+        best = min(best, (time.perf_counter_ns() - start) / len(names))
+    return best
+
+
+# Dispatch cost per command for a growing number of registered commands,
+# compared with the if/elif string-compare chain it replaces
+def bench_dispatch(args):
+    print(f"Registered commands in server.py: {len(registry)}")
+    print(f"{'commands':>10} {'registry ns/op':>16} {'if/elif ns/op':>15}")
+
+    for size in args.sizes:
+        table = CommandRegistry(MODULE_NAMES)
+        chain = []
+        for i in range(size):
+            name = f"cmd_{i}_cb"
+            table.register("1", name)(noop_cb)
+            chain.append((name, noop_cb))
+
+        def linear_dispatch(command):
+            for name, callback in chain:
+                if name == command:
+                    return callback()
+            return "Unknown OBC Command"
+
+        names = [random.choice(chain)[0] for _ in range(args.calls)]
+        registry_ns = time_per_call(lambda name: table.dispatch("1", name), names)
+        # The chain grows linearly, so keep its sample short for large tables
+        chain_names = names[: max(100, args.calls * 10 // size)]
+        chain_ns = time_per_call(linear_dispatch, chain_names)
+        print(f"{size:>10} {registry_ns:>16.1f} {chain_ns:>15.1f}")
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(("localhost", 0))
+        return probe.getsockname()[1]
+
+
+# Start server.py in a subprocess and wait until it accepts connections
+def launch_server(server_args, port, timeout=10.0):
+    process = subprocess.Popen(
+        [sys.executable, SERVER_PATH, "--port", str(port), *server_args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("localhost", port), timeout=0.5).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"Server did not start: {server_args}")
+
+
+# One request on a fresh connection, read until the server closes it
+def send_request(port, payload):
+    with socket.create_connection(("localhost", port), timeout=10) as client_socket:
+        client_socket.sendall(payload)
+        chunks = []
+        while True:
+            chunk = client_socket.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+# Fire requests from concurrent clients; returns elapsed time, latencies, errors
+def run_load(request, clients, requests_per_client):
+    def client_loop():
+        latencies, errors = [], 0
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            try:
+                if not request():
+                    errors += 1
+                    continue
+            except OSError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(lambda _: client_loop(), range(clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    errors = sum(result[1] for result in results)
+    return elapsed, latencies, errors
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+def print_load_header():
+    print(
+        f"{'mode':>18} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}"
+    )
+
+
+def print_load_row(mode, elapsed, latencies, errors):
+    print(
+        f"{mode:>18} {len(latencies) / elapsed:>10.0f} "
+        f"{percentile(latencies, 50) * 1000:>9.2f} "
+        f"{percentile(latencies, 99) * 1000:>9.2f} "
+        f"{(latencies[-1] if latencies else float('nan')) * 1000:>9.2f} "
+        f"{errors:>7}"
+    )
+
+
+# Request callable for one protocol: a fresh connection per legacy request, or
+# one persistent framed connection per client thread
+def protocol_request(protocol, port, payload):
+    if protocol == "legacy":
+        return lambda: send_request(port, payload)
+
+    connections = threading.local()
+
+    def framed_request():
+        if not hasattr(connections, "conn"):
+            connections.conn = framing.FramedConnection(("localhost", port))
+        flags, reply = connections.conn.request(payload, timeout=10)
+        return reply
+
+    return framed_request
+
+
+# Side-by-side throughput/latency of the server modes and wire protocols
+def bench_servers(args):
+    payload = args.request.encode("utf-8")
+    print(f"{args.clients} clients x {args.requests} requests")
+    print_load_header()
+    for mode in args.modes:
+        port = free_port()
+        process = launch_server(["--mode", mode, "--backlog", str(args.backlog)], port)
+        try:
+            for protocol in args.protocols:
+                result = run_load(
+                    protocol_request(protocol, port, payload),
+                    args.clients,
+                    args.requests,
+                )
+                print_load_row(f"{mode}/{protocol}", *result)
+        finally:
+            process.terminate()
+            process.wait()
+
+
+# run_load in a separate client process (picklable entry point)
+def load_process(port, protocol, payload, clients, requests_per_client):
+    return run_load(
+        protocol_request(protocol, port, payload), clients, requests_per_client
+    )
+
+
+# run_load spread over several client processes, so the load generator is not
+# itself held to one core by the GIL
+def run_load_processes(port, protocol, payload, processes, clients, requests):
+    context = multiprocessing.get_context("fork")
+    with context.Pool(processes) as pool:
+        results = pool.starmap(
+            load_process,
+            [(port, protocol, payload, clients, requests)] * processes,
+        )
+    elapsed = max(result[0] for result in results)
+    latencies = sorted(latency for result in results for latency in result[1])
+    errors = sum(result[2] for result in results)
+    return elapsed, latencies, errors
+
+
+# Throughput as the number of server processes grows
+def bench_scaling(args):
+    payload = args.request.encode("utf-8")
+    print(
+        f"{os.cpu_count()} CPUs, {args.client_processes} client processes x "
+        f"{args.clients} clients x {args.requests} requests"
+    )
+    print_load_header()
+    baseline = None
+    for processes in args.processes:
+        port = free_port()
+        process = launch_server(
+            [
+                "--mode",
+                args.mode,
+                "--processes",
+                str(processes),
+                "--metrics-port",
+                "0",
+            ],
+            port,
+        )
+        try:
+            # Let every worker process bind before the load starts
+            time.sleep(0.5)
+            elapsed, latencies, errors = run_load_processes(
+                port,
+                args.protocol,
+                payload,
+                args.client_processes,
+                args.clients,
+                args.requests,
+            )
+            print_load_row(f"{processes} processes", elapsed, latencies, errors)
+            throughput = len(latencies) / elapsed
+            baseline = baseline or throughput
+            print(f"{'':>18} speedup {throughput / baseline:.2f}x")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+# Best per-item time in microseconds of func over items
+def time_per_item(func, items, repeat=5):
+    return time_per_call(func, items, repeat) / 1000
+
+
+# Size and encode/decode cost of binary EPS housekeeping frames vs. JSON
+def bench_hk_codec(args):
+    frames = [eps_telem_hk_get_cb() for _ in range(args.frames)]
+    json_payloads = [json.dumps(frame).encode("utf-8") for frame in frames]
+    binary_payloads = [hk_schema.EPS_HK.encode(frame) for frame in frames]
+
+    json_size = sum(map(len, json_payloads)) / len(frames)
+    binary_size = sum(map(len, binary_payloads)) / len(frames)
+    print(f"EPS HK frame: JSON {json_size:.0f} B, binary {binary_size:.0f} B")
+    print(f"size ratio: {json_size / binary_size:.1f}x")
+
+    print(f"{'':>16} {'encode us':>10} {'decode us':>10}")
+    print(
+        f"{'json':>16} "
+        f"{time_per_item(lambda frame: json.dumps(frame).encode('utf-8'), frames):>10.2f} "
+        f"{time_per_item(lambda data: json.loads(data.decode('utf-8')), json_payloads):>10.2f}"
+    )
+    print(
+        f"{'binary':>16} "
+        f"{time_per_item(hk_schema.EPS_HK.encode, frames):>10.2f} "
+        f"{time_per_item(hk_schema.decode, binary_payloads):>10.2f}"
+    )
+    if hk_schema.np is not None:
+        start = time.perf_counter()
+        columns = hk_schema.decode_numpy(binary_payloads)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{'binary -> numpy':>16} {'':>10} {elapsed * 1e6 / len(frames):>10.2f}"
+            f"  ({len(columns['vbatt'])} frames in one call)"
+        )
+
+
+# Housekeeping replies of every subsystem plus history documents shaped like
+# the ones the fetch endpoints return (datetime and ObjectId fields)
+def codec_payloads(count):
+    hk = [
+        registry.dispatch(module_num, command)
+        for _ in range(count // 5)
+        for module_num in MODULE_NAMES
+        for command in registry.commands(module_num)
+        if command.endswith("_telem_hk_get_cb")
+    ]
+    documents = []
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        document = {"_id": ObjectId() if ObjectId else str(i)}
+        document.update(hk[i % len(hk)])
+        document["timestamp"] = start + datetime.timedelta(seconds=i)
+        documents.append(document)
+    return {"housekeeping": hk, "history": documents}
+
+
+# Size and encode/decode cost of the reply codecs (Shared/codec.py)
+def bench_codecs(args):
+    codecs = [codec.STDLIB_JSON]
+    if codec.orjson is not None:
+        codecs.append(codec.OrjsonCodec())
+    if codec.MSGPACK is not None:
+        codecs.append(codec.MSGPACK)
+    print(f"{'':>10} {'codec':>8} {'bytes':>8} {'encode us':>10} {'decode us':>10}")
+    for name, items in codec_payloads(args.items).items():
+        for item_codec in codecs:
+            payloads = [item_codec.dumps(item) for item in items]
+            print(
+                f"{name:>10} {item_codec.name:>8} "
+                f"{sum(map(len, payloads)) / len(payloads):>8.0f} "
+                f"{time_per_item(item_codec.dumps, items):>10.2f} "
+                f"{time_per_item(item_codec.loads, payloads):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TM/TC server micro-benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    dispatch_parser = subparsers.add_parser(
+        "dispatch", help="command dispatch cost vs. number of commands"
+    )
+    dispatch_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000]
+    )
+    dispatch_parser.add_argument("--calls", type=int, default=100000)
+    dispatch_parser.set_defaults(func=bench_dispatch)
+
+    servers_parser = subparsers.add_parser(
+        "servers", help="throughput/latency of the server modes"
+    )
+    servers_parser.add_argument("--modes", nargs="+", default=["threaded", "asyncio"])
+    servers_parser.add_argument("--protocols", nargs="+", default=["legacy", "framed"])
+    servers_parser.add_argument("--clients", type=int, default=32)
+    servers_parser.add_argument(
+        "--requests", type=int, default=200, help="requests per client"
+    )
+    servers_parser.add_argument("--backlog", type=int, default=128)
+    servers_parser.add_argument("--request", default="10,4,eps_cmd_get_config1_cb")
+    servers_parser.set_defaults(func=bench_servers)
+
+    scaling_parser = subparsers.add_parser(
+        "scaling", help="throughput vs. number of server processes"
+    )
+    scaling_parser.add_argument(
+        "--processes", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()]
+    )
+    scaling_parser.add_argument("--mode", default="asyncio")
+    scaling_parser.add_argument("--protocol", default="framed")
+    scaling_parser.add_argument("--client-processes", type=int, default=os.cpu_count())
+    scaling_parser.add_argument("--clients", type=int, default=8)
+    scaling_parser.add_argument(
+        "--requests", type=int, default=500, help="requests per client"
+    )
+    scaling_parser.add_argument(
+        "--request", default="10,5,adcs_telem_hk_get_cb", help="request payload"
+    )
+    scaling_parser.set_defaults(func=bench_scaling)
+
+    hk_parser = subparsers.add_parser(
+        "hk-codec", help="binary vs. JSON housekeeping frames"
+    )
+    hk_parser.add_argument("--frames", type=int, default=10000)
+    hk_parser.set_defaults(func=bench_hk_codec)
+
+    codecs_parser = subparsers.add_parser(
+        "codecs", help="stdlib json vs. orjson vs. msgpack replies"
+    )
+    codecs_parser.add_argument("--items", type=int, default=5000)
+    codecs_parser.set_defaults(func=bench_codecs)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,165 @@
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Image sources for the CAM snap command.
+#
+# A provider lists the images currently available upstream. ImageSource keeps
+# that listing in an LRU/TTL cache and a background thread keeps a small queue
+# of images ready, so a snap request takes the next queued image (or the last
+# one seen) without waiting on the network.
+
+NO_IMAGE = "No image available"
+
+log = logging.getLogger(__name__)
+
+
+# Mars rover photo API (or anything answering {"photos": [{"img_src": ...}]})
+# through one pooled session, so snaps reuse the same TLS connection
+class RoverApiProvider:
+    def __init__(self, url, timeout=5.0, pool_size=4):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def key(self):
+        return self.url
+
+    def images(self):
+        response = self.session.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        return [photo["img_src"] for photo in response.json().get("photos", [])]
+
+    def close(self):
+        self.session.close()
+
+
+# Image files in a local directory, for offline runs
+class DirectoryProvider:
+    EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff")
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    @property
+    def key(self):
+        return self.path
+
+    def images(self):
+        return [
+            "file://" + os.path.join(self.path, name)
+            for name in sorted(os.listdir(self.path))
+            if name.lower().endswith(self.EXTENSIONS)
+        ]
+
+    def close(self):
+        pass
+
+
+# "http(s)://..." is a rover API endpoint, anything else a directory
+def make_provider(source, timeout=5.0):
+    if source.startswith(("http://", "https://")):
+        return RoverApiProvider(source, timeout)
+    return DirectoryProvider(source)
+
+
+# Least recently used mapping whose entries expire ttl seconds after put
+class LruTtlCache:
+    def __init__(self, max_entries=32, ttl=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ImageSource:
+    def __init__(self, provider, cache=None, prefetch=8, retry_interval=5.0):
+        self.provider = provider
+        self.cache = LruTtlCache() if cache is None else cache
+        self.retry_interval = retry_interval
+        self._ready = queue.Queue(maxsize=prefetch)
+        self._last = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    # Next image for a snap; never blocks on the provider
+    def snap(self):
+        try:
+            self._last = self._ready.get_nowait()
+        except queue.Empty:
+            pass
+        return self._last or NO_IMAGE
+
+    # Provider listing, from the cache while it is fresh
+    def images(self):
+        images = self.cache.get(self.provider.key)
+        if images is None:
+            images = self.provider.images()
+            self.cache.put(self.provider.key, images)
+        return images
+
+    # Keep the ready queue topped up, cycling through the listing and
+    # refreshing it whenever the cached copy expires
+    def _prefetch(self):
+        position = 0
+        while not self._stopped.is_set():
+            try:
+                images = self.images()
+            except Exception as e:
+                log.warning("Image provider failed: %s", e)
+                self._stopped.wait(self.retry_interval)
+                continue
+            if not images:
+                self._stopped.wait(self.retry_interval)
+                continue
+
+            image = images[position % len(images)]
+            position += 1
+            while not self._stopped.is_set():
+                try:
+                    self._ready.put(image, timeout=1.0)
+                    break
+                except queue.Full:
+                    pass
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._prefetch, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.provider.close()
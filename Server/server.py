@@ -1,23 +1,119 @@
 import socket
 import threading
+import time
+import asyncio
 import datetime
 import random
-import requests
-import json
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Shared")
+)
+import codec
+import framing
+import hk_schema
+import image_source
+import logs
+import metrics
+import prefork
+import simulator as simulator_state
+import workers
+from simulator import Simulator, format_isotime, format_time
+
+# Module numbers carried in the "station,module,command" requests
+OBC_MODULE = "1"
+CAM_MODULE = "2"
+COM_MODULE = "3"
+EPS_MODULE = "4"
+ADCS_MODULE = "5"
+
+MODULE_NAMES = {
+    OBC_MODULE: "OBC",
+    CAM_MODULE: "CAM",
+    COM_MODULE: "COM",
+    EPS_MODULE: "EPS",
+    ADCS_MODULE: "ADCS",
+}
+
+
+# Table of command callbacks keyed by (module number, command name)
+class CommandRegistry:
+    def __init__(self, module_names):
+        self.module_names = dict(module_names)
+        self._callbacks = {}
+        self._blocking = set()
+
+    # Decorator registering a callback under its function name. Callbacks
+    # doing network or disk I/O are flagged blocking so that event-loop
+    # servers run them off the loop.
+    def register(self, module_num, command=None, blocking=False):
+        def decorator(callback):
+            key = (module_num, command or callback.__name__)
+            if key in self._callbacks:
+                raise ValueError(f"Command already registered: {key}")
+            self._callbacks[key] = callback
+            if blocking:
+                self._blocking.add(key)
+            return callback
+
+        return decorator
+
+    def lookup(self, module_num, command):
+        return self._callbacks.get((module_num, command))
+
+    def is_blocking(self, module_num, command):
+        return (module_num, command) in self._blocking
+
+    def dispatch(self, module_num, command):
+        callback = self._callbacks.get((module_num, command))
+        if callback is not None:
+            return callback()
+        if module_num in self.module_names:
+            return f"Unknown {self.module_names[module_num]} Command"
+        return "Unknown module"
+
+    # Introspection: registered commands, optionally for a single module
+    def commands(self, module_num=None):
+        return sorted(
+            command
+            for (module, command) in self._callbacks
+            if module_num is None or module == module_num
+        )
+
+    def modules(self):
+        return {
+            module_num: self.commands(module_num) for module_num in self.module_names
+        }
+
+    def __len__(self):
+        return len(self._callbacks)
 
+    def __contains__(self, key):
+        return key in self._callbacks
 
-# Helper function to generate random date and time
-def random_datetime():
-    return datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
 
+registry = CommandRegistry(MODULE_NAMES)
 
-# Helper function to simulate satellite orientation and position
-def random_orientation():
-    return [random.uniform(-180, 180) for _ in range(3)]  # Orientation in degrees
+# Listen backlog and concurrent connection cap for the socket servers
+DEFAULT_BACKLOG = 128
+DEFAULT_MAX_CONNECTIONS = 1024
+DEFAULT_METRICS_PORT = 9738
 
+# Per-command request counts, error counts and latency histograms
+command_metrics = metrics.Metrics("tmtc_server", ("module", "command"))
+command_metrics.add_gauges(logs.stats)
 
-def random_position():
-    return [random.uniform(-10000, 10000) for _ in range(3)]  # Position in kilometers
+# Service messages, and the per-request records (sampled with --log-sample)
+log = logging.getLogger("tmtc_server")
+request_log = logging.getLogger("tmtc_server.requests")
+
+
+# Stateful satellite simulator: telemetry and get commands read the replies it
+# publishes every tick, set commands mutate its state
+simulator = Simulator()
 
 
 # Helper functions to simulate COM data
@@ -25,78 +121,84 @@ def random_frequency():
     return random.randint(400000000, 450000000)  # Frequency in Hz
 
 
-def random_data_volume():
-    return random.randint(1000, 5000)  # Data volume in bytes
-
+# Source of CAM snap images, set up from --image-source in __main__
+images = None
 
-# Helper function to get a Mars rover image
-def get_mars_rover_image():
-    rover_url = ""
-    response = requests.get(rover_url)
-    if response.status_code == 200:
-        data = response.json()
-        if data["photos"]:
-            latest_photo = data["photos"][0]
-            return latest_photo["img_src"]
-    return "No image available"
 
-
-def simulate_error():
-    # Randomly simulate an error occurrence
-    if random.random() < 0.1:  # 10% chance of error
-        return True
-    return False
+def on_off(values):
+    return ["ON" if value else "OFF" for value in values]
 
 
 # EPS Command: Get Configuration 1
-def eps_cmd_get_config1_cb():
-    vboost = [random.randint(3000, 4000) for _ in range(3)]
-    return {"config_1": {"VBoost": vboost}}
+@registry.register(EPS_MODULE)
+@simulator.snapshot
+def eps_cmd_get_config1_cb(state):
+    return {"config_1": {"VBoost": list(state.vboost)}}
 
 
 # EPS Command: Set Configuration 1
+@registry.register(EPS_MODULE)
 def eps_cmd_set_config1_cb():
     vboost = [random.randint(3000, 4000) for _ in range(3)]
+    with simulator.update() as state:
+        state.vboost[:] = vboost
     return {"config_1_set": {"VBoost": vboost}}
 
 
 # EPS Command: Get Configuration 2
-def eps_cmd_get_config2_cb():
-    vbatt_max = random.randint(8000, 9000)
-    vbatt_safe = random.randint(6000, 7000)
-    return {"config_2": {"VBatt Max": vbatt_max, "VBatt Safe": vbatt_safe}}
+@registry.register(EPS_MODULE)
+@simulator.snapshot
+def eps_cmd_get_config2_cb(state):
+    return {"config_2": {"VBatt Max": state.vbatt_max, "VBatt Safe": state.vbatt_safe}}
 
 
 # EPS Command: Set Configuration 2
+@registry.register(EPS_MODULE)
 def eps_cmd_set_config2_cb():
     vbatt_max = random.randint(8000, 9000)
     vbatt_safe = random.randint(6000, 7000)
+    with simulator.update() as state:
+        state.vbatt_max = vbatt_max
+        state.vbatt_safe = vbatt_safe
     return {"config_2_set": {"VBatt Max": vbatt_max, "VBatt Safe": vbatt_safe}}
 
 
 # EPS Command: Get Configuration 3
-def eps_cmd_get_config3_cb():
-    output_status = [random.choice(["ON", "OFF"]) for _ in range(3)]
-    return {"config_3": {"Output Status": output_status}}
+@registry.register(EPS_MODULE)
+@simulator.snapshot
+def eps_cmd_get_config3_cb(state):
+    return {"config_3": {"Output Status": on_off(state.output_status)}}
 
 
 # EPS Command: Set Configuration 3
+@registry.register(EPS_MODULE)
 def eps_cmd_set_config3_cb():
-    output_status = [random.choice(["ON", "OFF"]) for _ in range(3)]
-    return {"config_3_set": {"Output Status": output_status}}
+    output_status = [random.choice([1, 0]) for _ in range(3)]
+    with simulator.update() as state:
+        state.output_status[:] = output_status
+        state.output[:3] = output_status
+    return {"config_3_set": {"Output Status": on_off(output_status)}}
 
 
 # EPS Command: Set Timeout
+@registry.register(EPS_MODULE)
 def eps_cmd_set_timeout_cb():
     timeout = random.randint(100, 600)  # Random timeout in seconds
+    with simulator.update() as state:
+        state.wdt_timeout = timeout
     return {"timeout_set": {"WDT": f"{timeout}s"}}
 
 
 # EPS Command: Set Heater Control
+@registry.register(EPS_MODULE)
 def eps_cmd_set_heater_ctrl_cb():
-    mode = random.choice(["AUTO", "MANUAL"])
+    mode = random.choice(simulator_state.HEATER_MODES)
     temp_high = random.randint(15, 25)  # High temperature threshold
     temp_low = random.randint(0, 10)  # Low temperature threshold
+    with simulator.update() as state:
+        state.heater_mode = simulator_state.HEATER_MODES.index(mode)
+        state.heater_temp_high = temp_high
+        state.heater_temp_low = temp_low
     return {
         "heater_control_set": {
             "Mode": mode,
@@ -107,217 +209,212 @@ def eps_cmd_set_heater_ctrl_cb():
 
 
 # EPS Command: Reset Watchdog Timer Ground
+@registry.register(EPS_MODULE)
 def eps_cmd_reset_wdt_gnd_cb():
+    with simulator.update() as state:
+        state.wdt_gnd_time_left = state.wdt_timeout
     return {"wdt_ground_reset": {"Status": "Success"}}
 
 
 # EPS Command: Set PPT Mode
+@registry.register(EPS_MODULE)
 def eps_cmd_set_pptmode_cb():
-    mode = random.choice(["MPPT", "FIXED"])
+    mode = random.choice(simulator_state.PPT_MODES)
+    with simulator.update() as state:
+        state.pptmode = simulator_state.PPT_MODES.index(mode)
     return {"ppt_mode_set": {"Mode": mode}}
 
 
 # EPS Command: Set VBoost
+@registry.register(EPS_MODULE)
 def eps_cmd_set_vboost_cb():
     vboost = [random.randint(3000, 4000) for _ in range(3)]
+    with simulator.update() as state:
+        state.vboost[:] = vboost
     return {"vboost_set": {"VBoost": vboost}}
 
 
 # EPS Telemetry Data Request
-def eps_telem_hk_get_cb():
-    error_occurred = simulate_error()
+@registry.register(EPS_MODULE)
+@simulator.snapshot
+def eps_telem_hk_get_cb(state):
     return {
-        "timestamp": random_datetime(),
-        "vboost": [random.randint(3000, 4000) for _ in range(3)],
-        "vbatt": random.randint(6000, 9000),
-        "curout": [random.randint(100, 500) for _ in range(6)],
-        "curin": [random.randint(100, 500) for _ in range(3)],
-        "cursun": random.randint(100, 500),
-        "cursys": random.randint(100, 500),
-        "temp": [random.randint(-40, 80) for _ in range(6)],
-        "output": [random.randint(0, 1) for _ in range(8)],
-        "output_on_delta": [random.randint(0, 1000) for _ in range(8)],
-        "output_off_delta": [random.randint(0, 1000) for _ in range(8)],
-        "wdt_i2c_time_left": random.randint(0, 10000),
-        "wdt_gnd_time_left": random.randint(0, 10000),
-        "counter_boot": random.randint(0, 100),
-        "counter_wdt_i2c": random.randint(0, 100),
-        "counter_wdt_gnd": random.randint(0, 100),
-        "counter_wdt_csp": [random.randint(0, 100) for _ in range(2)],
-        "wdt_csp_pings_left": [random.randint(0, 10) for _ in range(2)],
-        "bootcause": random.randint(0, 2),
-        "latchup": [random.randint(0, 10) for _ in range(6)],
-        "battmode": random.randint(0, 2),
-        "pptmode": random.randint(0, 2),
-        "error": error_occurred,
-        "error_code": "E01" if error_occurred else "None",
+        "timestamp": format_time(state),
+        "vboost": list(state.vboost),
+        "vbatt": state.vbatt,
+        "curout": list(state.curout),
+        "curin": list(state.curin),
+        "cursun": state.cursun,
+        "cursys": state.cursys,
+        "temp": list(state.temp),
+        "output": list(state.output),
+        "output_on_delta": list(state.output_on_delta),
+        "output_off_delta": list(state.output_off_delta),
+        "wdt_i2c_time_left": state.wdt_i2c_time_left,
+        "wdt_gnd_time_left": state.wdt_gnd_time_left,
+        "counter_boot": state.counter_boot,
+        "counter_wdt_i2c": state.counter_wdt_i2c,
+        "counter_wdt_gnd": state.counter_wdt_gnd,
+        "counter_wdt_csp": list(state.counter_wdt_csp),
+        "wdt_csp_pings_left": list(state.wdt_csp_pings_left),
+        "bootcause": state.bootcause,
+        "latchup": list(state.latchup),
+        "battmode": state.battmode,
+        "pptmode": state.pptmode,
+        "error": state.eps_error,
+        "error_code": "E01" if state.eps_error else "None",
     }
 
 
 # EPS Telemetry Housekeeping Persistent Data Request
-def eps_telem_hk_persist_get_cb():
-    error_occurred = simulate_error()
+@registry.register(EPS_MODULE)
+@simulator.snapshot
+def eps_telem_hk_persist_get_cb(state):
     return {
-        "timestamp": random_datetime(),
-        "boot_count": random.randint(1, 100),
-        "resets": random.randint(1, 10),
-        "uptime": random.randint(0, 10000),  # System uptime in seconds
-        "last_reset_reason": random.choice(["Power Cycle", "Watchdog", "Manual"]),
-        "error": error_occurred,
-        "error_code": "E02" if error_occurred else "None",
+        "timestamp": format_time(state),
+        "boot_count": state.counter_boot,
+        "resets": state.eps_resets,
+        "uptime": state.eps_uptime,  # System uptime in seconds
+        "last_reset_reason": simulator_state.RESET_REASONS[state.eps_reset_reason],
+        "error": state.eps_persist_error,
+        "error_code": "E02" if state.eps_persist_error else "None",
     }
 
 
-# COM Command: Get System Configuration
-def com_cmd_get_config_sys_cb():
-    csp_address = random.randint(1, 10)
-    i2c_enabled = random.choice([True, False])
-    can_enabled = random.choice([True, False])
-    modulation_type = random.choice(["FSK", "OMSK", "QPSK"])
+def system_config(state):
     return {
-        "system_config": {
-            "CSP_Address": csp_address,
-            "I2C_Enabled": i2c_enabled,
-            "CAN_Enabled": can_enabled,
-            "Modulation_Type": modulation_type,
-        }
+        "CSP_Address": state.csp_address,
+        "I2C_Enabled": state.i2c_enabled,
+        "CAN_Enabled": state.can_enabled,
+        "Modulation_Type": simulator_state.MODULATIONS[state.sys_modulation],
     }
 
 
-# COM Command: Set System Configuration
-def com_cmd_set_config_sys_cb():
-    csp_address = random.randint(1, 10)
-    i2c_enabled = random.choice([True, False])
-    can_enabled = random.choice([True, False])
-    modulation_type = random.choice(["FSK", "OMSK", "QPSK"])
+def transmit_config(state):
     return {
-        "system_config_set": {
-            "CSP_Address": csp_address,
-            "I2C_Enabled": i2c_enabled,
-            "CAN_Enabled": can_enabled,
-            "Modulation_Type": modulation_type,
-        }
+        "Timestamp": format_isotime(state),
+        "TX_Power": state.tx_power,
+        "Beacon_Interval": state.beacon_interval,
+        "Data_Rate_Mbps": state.tx_data_rate,
+        "Modulation_Type": simulator_state.MODULATIONS[state.tx_modulation],
     }
 
 
-# COM Command: Get Transmit Configuration
-def com_cmd_get_config_tx_cb():
-    timestamp = datetime.datetime.now().isoformat()
-    tx_power = random.randint(1, 5)  # Arbitrary TX power level
-    beacon_interval = random.randint(5, 15)  # Beacon interval in seconds
-    data_rate = random.randint(1, 10)  # Data rate in Mbps
-    modulation_type = random.choice(["FSK", "OMSK", "QPSK"])
+def receive_config(state):
     return {
-        "transmit_config": {
-            "Timestamp": timestamp,
-            "TX_Power": tx_power,
-            "Beacon_Interval": beacon_interval,
-            "Data_Rate_Mbps": data_rate,
-            "Modulation_Type": modulation_type,
-        }
+        "Timestamp": format_isotime(state),
+        "Frequency_Hz": state.rx_frequency,
+        "Baudrate": state.rx_baudrate,
+        "Modulation_Type": simulator_state.MODULATIONS[state.rx_modulation],
+        "Data_Rate_Mbps": state.rx_data_rate,
     }
 
 
+# COM Command: Get System Configuration
+@registry.register(COM_MODULE)
+@simulator.snapshot
+def com_cmd_get_config_sys_cb(state):
+    return {"system_config": system_config(state)}
+
+
+# COM Command: Set System Configuration
+@registry.register(COM_MODULE)
+def com_cmd_set_config_sys_cb():
+    with simulator.update() as state:
+        state.csp_address = random.randint(1, 10)
+        state.i2c_enabled = random.choice([True, False])
+        state.can_enabled = random.choice([True, False])
+        state.sys_modulation = random.randrange(len(simulator_state.MODULATIONS))
+        return {"system_config_set": system_config(state)}
+
+
+# COM Command: Get Transmit Configuration
+@registry.register(COM_MODULE)
+@simulator.snapshot
+def com_cmd_get_config_tx_cb(state):
+    return {"transmit_config": transmit_config(state)}
+
+
 # COM Command: Set Transmit Configuration
+@registry.register(COM_MODULE)
 def com_cmd_set_config_tx_cb():
-    timestamp = datetime.datetime.now().isoformat()
-    tx_power = random.randint(1, 5)
-    beacon_interval = random.randint(5, 15)
-    data_rate = random.randint(1, 10)  # Data rate in Mbps
-    modulation_type = random.choice(["FSK", "OMSK", "QPSK"])
-    return {
-        "transmit_config_set": {
-            "Timestamp": timestamp,
-            "TX_Power": tx_power,
-            "Beacon_Interval": beacon_interval,
-            "Data_Rate_Mbps": data_rate,
-            "Modulation_Type": modulation_type,
-        }
-    }
+    with simulator.update() as state:
+        state.tx_power = random.randint(1, 5)
+        state.beacon_interval = random.randint(5, 15)
+        state.tx_data_rate = random.randint(1, 10)  # Data rate in Mbps
+        state.tx_modulation = random.randrange(len(simulator_state.MODULATIONS))
+        return {"transmit_config_set": transmit_config(state)}
 
 
 # COM Command: Get Receive Configuration
-def com_cmd_get_config_rx_cb():
-    timestamp = datetime.datetime.now().isoformat()
-    frequency = random_frequency()
-    baudrate = random.choice([1200, 2400, 4800, 9600])
-    modulation_type = random.choice(["FSK", "OMSK", "QPSK"])
-    data_rate = random.randint(1, 10)  # Data rate in Mbps
-    return {
-        "receive_config": {
-            "Timestamp": timestamp,
-            "Frequency_Hz": frequency,
-            "Baudrate": baudrate,
-            "Modulation_Type": modulation_type,
-            "Data_Rate_Mbps": data_rate,
-        }
-    }
+@registry.register(COM_MODULE)
+@simulator.snapshot
+def com_cmd_get_config_rx_cb(state):
+    return {"receive_config": receive_config(state)}
 
 
 # COM Command: Set Receive Configuration
+@registry.register(COM_MODULE)
 def com_cmd_set_config_rx_cb():
-    timestamp = datetime.datetime.now().isoformat()
-    frequency = random_frequency()
-    baudrate = random.choice([1200, 2400, 4800, 9600])
-    modulation_type = random.choice(["FSK", "OMSK", "QPSK"])
-    data_rate = random.randint(1, 10)  # Data rate in Mbps
-    return {
-        "receive_config_set": {
-            "Timestamp": timestamp,
-            "Frequency_Hz": frequency,
-            "Baudrate": baudrate,
-            "Modulation_Type": modulation_type,
-            "Data_Rate_Mbps": data_rate,
-        }
-    }
+    with simulator.update() as state:
+        state.rx_frequency = random_frequency()
+        state.rx_baudrate = random.choice([1200, 2400, 4800, 9600])
+        state.rx_modulation = random.randrange(len(simulator_state.MODULATIONS))
+        state.rx_data_rate = random.randint(1, 10)  # Data rate in Mbps
+        return {"receive_config_set": receive_config(state)}
 
 
 # COM Telemetry: Housekeeping Data
-def com_telem_hk_get_cb():
-    error_occurred = simulate_error()
+@registry.register(COM_MODULE)
+@simulator.snapshot
+def com_telem_hk_get_cb(state):
     return {
         "housekeeping_data": {
-            "timestamp": random_datetime(),
-            "board_temp": random.randint(-10, 50),
-            "pa_temp": random.randint(-10, 60),
-            "last_rssi": random.randint(-120, 0),
-            "signal_quality": random.randint(0, 100),
-            "uptime": random.randint(0, 10000),
-            "error": error_occurred,
-            "error_code": "E03" if error_occurred else "None",
+            "timestamp": format_time(state),
+            "board_temp": state.com_board_temp,
+            "pa_temp": state.com_pa_temp,
+            "last_rssi": state.com_last_rssi,
+            "signal_quality": state.com_signal_quality,
+            "uptime": state.com_uptime,
+            "error": state.com_error,
+            "error_code": "E03" if state.com_error else "None",
         }
     }
 
 
 # COM Telemetry: Command Data
-def com_telem_hk_cmd_get_cb():
-    error_occurred = simulate_error()
+@registry.register(COM_MODULE)
+@simulator.snapshot
+def com_telem_hk_cmd_get_cb(state):
     return {
         "command_data": {
-            "timestamp": random_datetime(),
-            "tx_count": random.randint(50, 200),
-            "rx_count": random.randint(50, 200),
-            "tx_bytes": random_data_volume(),
-            "rx_bytes": random_data_volume(),
-            "command_ack_rate": random.uniform(0, 1),
-            "error": error_occurred,
-            "error_code": "E04" if error_occurred else "None",
+            "timestamp": format_time(state),
+            "tx_count": state.tx_count,
+            "rx_count": state.rx_count,
+            "tx_bytes": state.tx_bytes,
+            "rx_bytes": state.rx_bytes,
+            "command_ack_rate": state.command_ack_rate,
+            "error": state.com_cmd_error,
+            "error_code": "E04" if state.com_cmd_error else "None",
         }
     }
 
 
 # CAM Command: Snap an image
+@registry.register(CAM_MODULE)
 def cam_cmd_snap_cb():
-    image_url = get_mars_rover_image()
+    image_url = images.snap() if images else image_source.NO_IMAGE
     timestamp = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
     return {"image_snapped": {"image_url": image_url, "timestamp": timestamp}}
 
 
 # CAM Command: Store image
+@registry.register(CAM_MODULE)
 def cam_cmd_store_cb():
-    image_id = random.randint(100, 200)
+    with simulator.update() as state:
+        image_id = simulator_state.store_image(state)
     storage_status = "Secured"
-    size = random.uniform(1.0, 5.0)  # Image size in MB
+    size = simulator_state.IMAGE_SIZE_MB  # Image size in MB
     return {
         "image_stored": {
             "image_id": image_id,
@@ -328,26 +425,35 @@ def cam_cmd_store_cb():
 
 
 # CAM Command: List stored images
-def cam_cmd_img_list_cb():
-    stored_images = random.sample(range(100, 200), 5)  # Randomly pick 5 image IDs
-    return {"stored_images": {"total": 5, "image_ids": stored_images}}
+@registry.register(CAM_MODULE)
+@simulator.snapshot
+def cam_cmd_img_list_cb(state):
+    stored_images = simulator_state.stored_images(state)
+    return {"stored_images": {"total": len(stored_images), "image_ids": stored_images}}
 
 
 # CAM Command: Flush image storage
+@registry.register(CAM_MODULE)
 def cam_cmd_img_flush_cb():
-    freed_space = random.uniform(10.0, 30.0)  # Freed space in MB
+    with simulator.update() as state:
+        freed_space = state.image_count * simulator_state.IMAGE_SIZE_MB  # In MB
+        state.image_count = 0
     return {
         "image_storage_flushed": {"status": "Success", "freed_space_MB": freed_space}
     }
 
 
 # CAM Command: Adjust focus
+@registry.register(CAM_MODULE)
 def cam_cmd_focus_cb():
     new_focus_level = random.uniform(5.0, 10.0)
+    with simulator.update() as state:
+        state.focus_level = new_focus_level
     return {"focus_adjusted": {"new_focus_level": new_focus_level, "status": "Sharp"}}
 
 
 # CAM Command: Recover file system
+@registry.register(CAM_MODULE)
 def cam_cmd_recover_fs_cb():
     recovered_files = random.randint(1, 5)
     return {
@@ -359,107 +465,108 @@ def cam_cmd_recover_fs_cb():
 
 
 # CAM Telemetry: Housekeeping Data
-def cam_telem_hk_get_cb():
-    error_occurred = simulate_error()
-    stored_images = random.sample(range(100, 200), 5)
+@registry.register(CAM_MODULE)
+@simulator.snapshot
+def cam_telem_hk_get_cb(state):
+    stored_images = simulator_state.stored_images(state)
     return {
         "housekeeping_data": {
-            "timestamp": random_datetime(),
+            "timestamp": format_time(state),
             "stored_images": stored_images,
-            "total_storage_used_MB": random.uniform(10.0, 30.0),
-            "camera_status": random.choice(["Operational", "Standby", "Error"]),
-            "error": error_occurred,
-            "error_code": "E05" if error_occurred else "None",
+            "total_storage_used_MB": len(stored_images) * simulator_state.IMAGE_SIZE_MB,
+            "camera_status": simulator_state.CAMERA_STATUSES[state.camera_status],
+            "error": state.cam_error,
+            "error_code": "E05" if state.cam_error else "None",
         }
     }
 
 
 # CAM Telemetry: Command Data
-def cam_telem_hk_cmd_get_cb():
-    error_occurred = simulate_error()
-    stored_images = random.sample(range(100, 200), 5)
+@registry.register(CAM_MODULE)
+@simulator.snapshot
+def cam_telem_hk_cmd_get_cb(state):
     return {
         "command_data": {
-            "timestamp": random_datetime(),
-            "recently_captured": stored_images,
-            "capture_success_rate": random.uniform(0, 1),
-            "error": error_occurred,
-            "error_code": "E06" if error_occurred else "None",
+            "timestamp": format_time(state),
+            "recently_captured": simulator_state.stored_images(state)[-5:],
+            "capture_success_rate": state.capture_success_rate,
+            "error": state.cam_cmd_error,
+            "error_code": "E06" if state.cam_cmd_error else "None",
         }
     }
 
 
 # ADCS Command: Set Timeout
+@registry.register(ADCS_MODULE)
 def adcs_cmd_set_timeout_cb():
     new_timeout = random.randint(60, 180)  # Timeout in seconds
+    with simulator.update() as state:
+        state.adcs_timeout = new_timeout
     return {"timeout_set": {"new_timeout": new_timeout, "status": "Updated"}}
 
 
 # ADCS Command: Get State
-def adcs_cmd_get_state_cb():
-    mode = random.choice(["Stable", "Maneuver", "Drift"])
-    orientation = random_orientation()  # Assuming this returns a dictionary
-    angular_velocity = [random.uniform(-1, 1) for _ in range(3)]
+@registry.register(ADCS_MODULE)
+@simulator.snapshot
+def adcs_cmd_get_state_cb(state):
     return {
         "adcs_state": {
-            "mode": mode,
-            "orientation": orientation,
-            "angular_velocity": angular_velocity,
+            "mode": simulator_state.ADCS_MODES[state.adcs_mode],
+            "orientation": list(state.orientation),  # Orientation in degrees
+            "angular_velocity": list(state.angular_velocity),
         }
     }
 
 
 # ADCS Telemetry: Housekeeping Data
-def adcs_telem_hk_get_cb():
-    error_occurred = simulate_error()
+@registry.register(ADCS_MODULE)
+@simulator.snapshot
+def adcs_telem_hk_get_cb(state):
     return {
         "housekeeping_data": {
-            "timestamp": random_datetime(),
-            "temperature": random.randint(-40, 80),
-            "power_usage": random.randint(10, 100),
-            "orientation": random_orientation(),
-            "angular_velocity": [random.uniform(-1, 1) for _ in range(3)],
-            "error": error_occurred,
-            "error_code": "E07" if error_occurred else "None",
+            "timestamp": format_time(state),
+            "temperature": state.adcs_temperature,
+            "power_usage": state.power_usage,
+            "orientation": list(state.orientation),
+            "angular_velocity": list(state.angular_velocity),
+            "error": state.adcs_error,
+            "error_code": "E07" if state.adcs_error else "None",
         }
     }
 
 
 # ADCS Telemetry: Command Data
-def adcs_telem_hk_cmd_get_cb():
-    error_occurred = simulate_error()
-    position = random_position()  # Assuming this returns a dictionary
-    velocity = [random.uniform(-5, 5) for _ in range(3)]
-    maneuver_count = random.randint(0, 10)
+@registry.register(ADCS_MODULE)
+@simulator.snapshot
+def adcs_telem_hk_cmd_get_cb(state):
     return {
         "command_data": {
-            "timestamp": random_datetime(),
-            "position": position,
-            "velocity": velocity,
-            "maneuver_count": maneuver_count,
-            "error": error_occurred,
-            "error_code": "E08" if error_occurred else "None",
+            "timestamp": format_time(state),
+            "position": list(state.position),  # Position in kilometers
+            "velocity": list(state.velocity),
+            "maneuver_count": state.maneuver_count,
+            "error": state.adcs_cmd_error,
+            "error_code": "E08" if state.adcs_cmd_error else "None",
         }
     }
 
 
 # OBC Command: Get MASAT State
-def obc_cmd_get_masat_state_cb():
-    mode = random.choice(["Science", "Standby", "Safe"])
-    temp = random.randint(-20, 40)  # Temperature in Celsius
-    power_status = random.choice(["Nominal", "Low", "Critical"])
-    current_time = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
+@registry.register(OBC_MODULE)
+@simulator.snapshot
+def obc_cmd_get_masat_state_cb(state):
     return {
         "masat_state": {
-            "Mode": mode,
-            "Temperature_Celsius": temp,
-            "Power_Status": power_status,
-            "Time": current_time,
+            "Mode": simulator_state.OBC_MODES[state.obc_mode],
+            "Temperature_Celsius": state.obc_temperature,
+            "Power_Status": simulator_state.POWER_STATUSES[state.battmode],
+            "Time": format_time(state),
         }
     }
 
 
 # OBC Command: Load Image
+@registry.register(OBC_MODULE)
 def obc_cmd_load_imag_cb():
     image_id = random.randint(1, 100)
     size = random.uniform(1.0, 5.0)  # Image size in MB
@@ -467,10 +574,14 @@ def obc_cmd_load_imag_cb():
 
 
 # OBC Command: Track Target
+@registry.register(OBC_MODULE)
 def obc_cmd_track_target_cb():
     target_id = random.randint(10000, 99999)
     status = random.choice(["Locked", "Searching", "Lost"])
     coordinates = [random.uniform(-180, 180), random.uniform(-90, 90)]  # Lat, Long
+    with simulator.update() as state:
+        state.adcs_mode = simulator_state.ADCS_MODES.index("Maneuver")
+        state.maneuver_count += 1
     return {
         "track_target": {
             "Target_ID": target_id,
@@ -481,30 +592,40 @@ def obc_cmd_track_target_cb():
 
 
 # OBC Command: Time Sync
+@registry.register(OBC_MODULE)
 def obc_cmd_timesync_cb():
     synced_time = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")
     return {"time_sync": {"Status": "Success", "Synced_Time": synced_time}}
 
 
 # OBC Command: Jump to RAM
+@registry.register(OBC_MODULE)
 def obc_cmd_jump_ram_cb():
     address = hex(random.randint(0x1000, 0xFFFF))
     return {"jump_to_ram": {"Address": address, "Status": "Executed"}}
 
 
 # OBC Command: Set Boot Configuration
+@registry.register(OBC_MODULE)
 def obc_cmd_boot_conf_cb():
-    new_boot_mode = random.choice(["Science Mode", "Safe Mode", "Bootloader"])
+    new_boot_mode = random.choice(simulator_state.BOOT_MODES)
+    with simulator.update() as state:
+        state.boot_mode = simulator_state.BOOT_MODES.index(new_boot_mode)
+        state.config_change_count += 1
     return {"boot_config_set": {"New_Boot_Mode": new_boot_mode, "Status": "Updated"}}
 
 
 # OBC Command: Delete Configuration
+@registry.register(OBC_MODULE)
 def obc_cmd_conf_del_cb():
     config_id = random.randint(1, 10)
+    with simulator.update() as state:
+        state.config_change_count += 1
     return {"config_deleted": {"Config_ID": config_id, "Status": "Removed"}}
 
 
 # OBC Command: RAM to ROM
+@registry.register(OBC_MODULE)
 def obc_cmd_ram_to_rom_cb():
     bytes_transferred = random.randint(1024, 4096)  # Bytes transferred
     return {
@@ -513,238 +634,561 @@ def obc_cmd_ram_to_rom_cb():
 
 
 # OBC Command: Get Boot Count
-def obc_cmd_boot_count_get_cb():
-    current_count = random.randint(1, 100)
-    return {"boot_count": {"Current_Count": current_count}}
+@registry.register(OBC_MODULE)
+@simulator.snapshot
+def obc_cmd_boot_count_get_cb(state):
+    return {"boot_count": {"Current_Count": state.boot_count}}
 
 
 # OBC Command: Reset Boot Count
+@registry.register(OBC_MODULE)
 def obc_cmd_boot_count_reset_cb():
+    with simulator.update() as state:
+        state.boot_count = 0
     return {"boot_count_reset": {"Status": "Reset", "New_Count": 0}}
 
 
 # OBC Command: Get Persistent Telemetry
-def obc_telem_hk_persist_get_cb():
-    error_occurred = simulate_error()
+@registry.register(OBC_MODULE)
+@simulator.snapshot
+def obc_telem_hk_persist_get_cb(state):
     return {
         "persistent_telemetry": {
-            "Timestamp": random_datetime(),
-            "Boot_Count": random.randint(1, 100),
-            "Resets": random.randint(1, 10),
-            "Total_Uptime_Seconds": random.randint(0, 10000),
-            "Last_Boot_Reason": random.choice(["Power Cycle", "Watchdog", "Manual"]),
-            "Config_Change_Count": random.randint(0, 50),
-            "Error": error_occurred,
-            "Error_Code": "E09" if error_occurred else "None",
+            "Timestamp": format_time(state),
+            "Boot_Count": state.boot_count,
+            "Resets": state.obc_resets,
+            "Total_Uptime_Seconds": state.obc_uptime,
+            "Last_Boot_Reason": simulator_state.RESET_REASONS[state.last_boot_reason],
+            "Config_Change_Count": state.config_change_count,
+            "Error": state.obc_persist_error,
+            "Error_Code": "E09" if state.obc_persist_error else "None",
         }
     }
 
 
 # OBC Command: Get Telemetry
-def obc_telem_hk_get_cb():
-    error_occurred = simulate_error()
+@registry.register(OBC_MODULE)
+@simulator.snapshot
+def obc_telem_hk_get_cb(state):
     return {
         "telemetry": {
-            "Timestamp": random_datetime(),
-            "CPU_Load": random.uniform(0, 1),
-            "Memory_Usage": random.uniform(0, 1),
-            "Temperature_Celsius": random.randint(-20, 70),
-            "Power_Status": random.choice(["Nominal", "Low", "Critical"]),
-            "Active_Processes": random.randint(0, 100),
-            "Error": error_occurred,
-            "Error_Code": "E10" if error_occurred else "None",
+            "Timestamp": format_time(state),
+            "CPU_Load": state.cpu_load,
+            "Memory_Usage": state.memory_usage,
+            "Temperature_Celsius": state.obc_temperature,
+            "Power_Status": simulator_state.POWER_STATUSES[state.battmode],
+            "Active_Processes": state.active_processes,
+            "Error": state.obc_error,
+            "Error_Code": "E10" if state.obc_error else "None",
         }
     }
 
 
 # OBC Command: Get Telemetry
-def obc_telem_hk_cmd_get_cb():
-    error_occurred = simulate_error()
+@registry.register(OBC_MODULE)
+@simulator.snapshot
+def obc_telem_hk_cmd_get_cb(state):
     return {
         "telemetry_command_data": {
-            "Timestamp": random_datetime(),
-            "Last_Command": random.choice(["CMD_A", "CMD_B", "CMD_C"]),
-            "Command_Success_Rate": random.uniform(0, 1),
-            "Recent_Errors": random.randint(0, 5),
-            "Error": error_occurred,
-            "Error_Code": "E11" if error_occurred else "None",
+            "Timestamp": format_time(state),
+            "Last_Command": simulator_state.LAST_COMMANDS[state.last_command],
+            "Command_Success_Rate": state.command_success_rate,
+            "Recent_Errors": state.recent_errors,
+            "Error": state.obc_cmd_error,
+            "Error_Code": "E11" if state.obc_cmd_error else "None",
         }
     }
 
 
-# Mock implementations for command handling
-def handle_obc_command(command):
-    if command == "obc_cmd_get_masat_state_cb":
-        return obc_cmd_get_masat_state_cb()
-    elif command == "obc_cmd_load_imag_cb":
-        return obc_cmd_load_imag_cb()
-    elif command == "obc_cmd_track_target_cb":
-        return obc_cmd_track_target_cb()
-    elif command == "obc_cmd_timesync_cb":
-        return obc_cmd_timesync_cb()
-    elif command == "obc_cmd_jump_ram_cb":
-        return obc_cmd_jump_ram_cb()
-    elif command == "obc_cmd_boot_conf_cb":
-        return obc_cmd_boot_conf_cb()
-    elif command == "obc_cmd_conf_del_cb":
-        return obc_cmd_conf_del_cb()
-    elif command == "obc_cmd_ram_to_rom_cb":
-        return obc_cmd_ram_to_rom_cb()
-    elif command == "obc_cmd_boot_count_get_cb":
-        return obc_cmd_boot_count_get_cb()
-    elif command == "obc_cmd_boot_count_reset_cb":
-        return obc_cmd_boot_count_reset_cb()
-    elif command == "obc_telem_hk_persist_get_cb":
-        return obc_telem_hk_persist_get_cb()
-    elif command == "obc_telem_hk_get_cb":
-        return obc_telem_hk_get_cb()
-    elif command == "obc_telem_hk_cmd_get_cb":
-        return obc_telem_hk_cmd_get_cb()
-    else:
-        return "Unknown OBC Command"
-
-
-def handle_eps_command(command):
-    if command == "eps_cmd_get_config1_cb":
-        return eps_cmd_get_config1_cb()
-    elif command == "eps_cmd_set_config1_cb":
-        return eps_cmd_set_config1_cb()
-    elif command == "eps_cmd_get_config2_cb":
-        return eps_cmd_get_config2_cb()
-    elif command == "eps_cmd_set_config2_cb":
-        return eps_cmd_set_config2_cb()
-    elif command == "eps_cmd_get_config3_cb":
-        return eps_cmd_get_config3_cb()
-    elif command == "eps_cmd_set_config3_cb":
-        return eps_cmd_set_config3_cb()
-    elif command == "eps_cmd_set_timeout_cb":
-        return eps_cmd_set_timeout_cb()
-    elif command == "eps_cmd_set_heater_ctrl_cb":
-        return eps_cmd_set_heater_ctrl_cb()
-    elif command == "eps_cmd_reset_wdt_gnd_cb":
-        return eps_cmd_reset_wdt_gnd_cb()
-    elif command == "eps_cmd_set_pptmode_cb":
-        return eps_cmd_set_pptmode_cb()
-    elif command == "eps_cmd_set_vboost_cb":
-        return eps_cmd_set_vboost_cb()
-    elif command == "eps_telem_hk_get_cb":
-        return eps_telem_hk_get_cb()
-    elif command == "eps_telem_hk_persist_get_cb":
-        return eps_telem_hk_persist_get_cb()
-    else:
-        return "Unknown EPS Command"
-
-
-def handle_com_command(command):
-    if command == "com_cmd_get_config_sys_cb":
-        return com_cmd_get_config_sys_cb()
-    elif command == "com_cmd_set_config_sys_cb":
-        return com_cmd_set_config_sys_cb()
-    elif command == "com_cmd_get_config_tx_cb":
-        return com_cmd_get_config_tx_cb()
-    elif command == "com_cmd_set_config_tx_cb":
-        return com_cmd_set_config_tx_cb()
-    elif command == "com_cmd_get_config_rx_cb":
-        return com_cmd_get_config_rx_cb()
-    elif command == "com_cmd_set_config_rx_cb":
-        return com_cmd_set_config_rx_cb()
-    elif command == "com_telem_hk_get_cb":
-        return com_telem_hk_get_cb()
-    elif command == "com_telem_hk_cmd_get_cb":
-        return com_telem_hk_cmd_get_cb()
-    else:
-        return "Unknown COM Command"
-
-
-def handle_cam_command(command):
-    if command == "cam_cmd_snap_cb":
-        return cam_cmd_snap_cb()
-    elif command == "cam_cmd_store_cb":
-        return cam_cmd_store_cb()
-    elif command == "cam_cmd_img_list_cb":
-        return cam_cmd_img_list_cb()
-    elif command == "cam_cmd_img_flush_cb":
-        return cam_cmd_img_flush_cb()
-    elif command == "cam_cmd_focus_cb":
-        return cam_cmd_focus_cb()
-    elif command == "cam_cmd_recover_fs_cb":
-        return cam_cmd_recover_fs_cb()
-    elif command == "cam_telem_hk_get_cb":
-        return cam_telem_hk_get_cb()
-    elif command == "cam_telem_hk_cmd_get_cb":
-        return cam_telem_hk_cmd_get_cb()
-    else:
-        return "Unknown CAM Command"
-
-
-def handle_adcs_command(command):
-    if command == "adcs_cmd_set_timeout_cb":
-        return adcs_cmd_set_timeout_cb()
-    elif command == "adcs_cmd_get_state_cb":
-        return adcs_cmd_get_state_cb()
-    elif command == "adcs_telem_hk_get_cb":
-        return adcs_telem_hk_get_cb()
-    elif command == "adcs_telem_hk_cmd_get_cb":
-        return adcs_telem_hk_cmd_get_cb()
+# Split a "station,module,command" request into its components
+def parse_request(data):
+    received_data = data.decode("utf-8")
+    components = received_data.split(",")
+    if len(components) != 3:
+        request_log.warning("Invalid data format: %s", logs.text(data))
+        return None
+
+    station_num, module_num, command = components
+    request_log.info(
+        "Received: Number 10: %s, Module Number: %s, Command: %s",
+        station_num,
+        module_num,
+        command,
+        extra={"station": station_num, "module_num": module_num, "command": command},
+    )
+    return station_num, module_num, command
+
+
+# Metrics series of a command; unknown commands share one series so bad input
+# cannot grow the table
+def metrics_key(module_num, command):
+    if (module_num, command) in registry:
+        return (MODULE_NAMES[module_num], command)
+    return (MODULE_NAMES.get(module_num, "unknown"), "unknown")
+
+
+# Run one command, recording its latency and whether it failed
+def run_command(module_num, command):
+    key = metrics_key(module_num, command)
+    with command_metrics.timed(key) as outcome:
+        # Single table lookup on the (module_num, command) key
+        response = registry.dispatch(module_num, command)
+        outcome[0] = key[1] == "unknown" or metrics.reply_has_error(response)
+    return response
+
+
+# Batch request "station,batch,module:command;module:command;...": every
+# command runs in turn and all replies come back together in one JSON reply,
+# e.g. a housekeeping sweep across subsystems in a single round trip
+BATCH_MODULE = "batch"
+MAX_BATCH = 64
+
+
+# List of (module, command) pairs, or None when the batch is malformed
+def parse_batch(commands):
+    pairs = []
+    for item in commands.split(";"):
+        module_num, separator, command = item.partition(":")
+        if not separator:
+            return None
+        pairs.append((module_num, command))
+    if len(pairs) > MAX_BATCH:
+        return None
+    return pairs
+
+
+def run_batch(commands):
+    pairs = parse_batch(commands)
+    if pairs is None:
+        return "Invalid batch"
+    return {
+        "batch": [
+            {
+                "module": module_num,
+                "command": command,
+                "reply": run_command(module_num, command),
+            }
+            for module_num, command in pairs
+        ]
+    }
+
+
+def is_blocking_request(module_num, command):
+    if module_num == BATCH_MODULE:
+        pairs = parse_batch(command) or []
+        return any(registry.is_blocking(*pair) for pair in pairs)
+    return registry.is_blocking(module_num, command)
+
+
+# Run the command and encode its reply: JSON (or msgpack when the client
+# accepts it), or a binary housekeeping frame when the client asked for one
+# and the command has a schema.
+# Returns (reply bytes, reply frame flags).
+def build_reply(module_num, command, flags=framing.FLAG_NONE):
+    if module_num == BATCH_MODULE:
+        response = run_batch(command)
     else:
-        return "Unknown ADCS Command"
+        response = run_command(module_num, command)
+    if flags & framing.FLAG_BINARY_HK and isinstance(response, dict):
+        schema = hk_schema.SCHEMAS_BY_COMMAND.get(command)
+        if schema is not None:
+            return schema.encode(response), framing.FLAG_BINARY_HK
+    reply_codec, reply_flags = codec.for_request(flags)
+    return reply_codec.dumps(response), reply_flags
 
 
-def handle_client_connection(client_socket):
-    try:
-        data = client_socket.recv(1024)
-        if not data:
-            return
+# Parse and answer one request; None when it is not a valid request
+def handle_request(data, flags=framing.FLAG_NONE):
+    request = parse_request(data)
+    if request is None:
+        return None
+
+    station_num, module_num, command = request
+    return build_reply(module_num, command, flags)
+
+
+# Framed requests always get a reply, so pipelining clients are never left
+# waiting on a request id
+INVALID_REPLY = (codec.dumps("Invalid data format"), framing.FLAG_NONE)
+
+
+def handle_framed_request(payload, flags):
+    if flags & framing.FLAG_PING:
+        return b"", framing.FLAG_PING
+    return handle_request(payload, flags) or INVALID_REPLY
 
-        received_data = data.decode("utf-8")
-        components = received_data.split(",")
-        if len(components) != 3:
-            print("Invalid data format")
+
+# Persistent framed connection: answer frames until the client disconnects
+def serve_framed_connection(client_socket):
+    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    while True:
+        frame = framing.recv_frame(client_socket)
+        if frame is None:
             return
+        request_id, flags, payload = frame
+        reply, reply_flags = handle_framed_request(payload, flags)
+        framing.send_frame(client_socket, request_id, reply, reply_flags)
 
-        station_num, module_num, command = components
-        print(
-            f"Received: Number 10: {station_num}, Module Number: {module_num}, Command: {command}"
-        )
 
-        # Handling commands based on the module_num
-        if module_num == "1":
-            response = handle_obc_command(command)
-        elif module_num == "4":
-            response = handle_eps_command(command)
-        elif module_num == "3":
-            response = handle_com_command(command)
-        elif module_num == "2":
-            response = handle_cam_command(command)
-        elif module_num == "5":
-            response = handle_adcs_command(command)
+# Legacy one-shot CSV request
+def serve_legacy_request(client_socket):
+    data = client_socket.recv(1024)
+    if not data:
+        return
+
+    reply = handle_request(data)
+    if reply is not None:
+        client_socket.sendall(reply[0])
+
+
+def handle_client_connection(client_socket):
+    try:
+        if framing.peek_framed(client_socket):
+            serve_framed_connection(client_socket)
         else:
-            response = "Unknown module"
+            serve_legacy_request(client_socket)
+    except Exception as e:
+        log.error("An error occurred: %s", e)
+    finally:
+        client_socket.close()
+
+
+# Framed reply to requests refused by a saturated worker pool
+OVERLOAD_REPLY = (
+    codec.dumps({"error": workers.OVERLOAD_ERROR}),
+    framing.FLAG_NONE,
+)
+
+
+# Framed connection in pool mode: this thread only reads frames. Each request
+# is answered by a pool worker, or refused at once when the pool is full.
+def pool_framed_connection(client_socket, pool, connection_slots):
+    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    send_lock = threading.Lock()
+    # Requests still queued or running; the socket is closed once they are done
+    in_flight = threading.Condition()
+    pending = [0]
+
+    def answer(request_id, flags, payload):
+        try:
+            reply, reply_flags = handle_framed_request(payload, flags)
+            with send_lock:
+                framing.send_frame(client_socket, request_id, reply, reply_flags)
+        finally:
+            with in_flight:
+                pending[0] -= 1
+                in_flight.notify_all()
 
-        client_socket.send(json.dumps(response).encode("utf-8"))
+    try:
+        while True:
+            frame = framing.recv_frame(client_socket)
+            if frame is None:
+                break
+            request_id, flags, payload = frame
+            with in_flight:
+                pending[0] += 1
+            if not pool.submit(answer, request_id, flags, payload):
+                with in_flight:
+                    pending[0] -= 1
+                with send_lock:
+                    framing.send_frame(client_socket, request_id, *OVERLOAD_REPLY)
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error("An error occurred: %s", e)
     finally:
+        with in_flight:
+            in_flight.wait_for(lambda: pending[0] == 0)
         client_socket.close()
+        connection_slots.release()
 
 
-def start_server():
+# First task of every connection in pool mode: legacy requests are answered
+# right here, framed connections get a reader thread of their own (at most
+# max_connections of them) so they do not pin a worker
+def pool_client_connection(client_socket, pool, connection_slots):
+    try:
+        if framing.peek_framed(client_socket):
+            if connection_slots.acquire(blocking=False):
+                threading.Thread(
+                    target=pool_framed_connection,
+                    args=(client_socket, pool, connection_slots),
+                    daemon=True,
+                ).start()
+                return
+            log.warning("Connection limit reached, dropping framed connection")
+        else:
+            serve_legacy_request(client_socket)
+    except Exception as e:
+        log.error("An error occurred: %s", e)
+    client_socket.close()
+
+
+# pool: a workers.WorkerPool to serve connections from instead of starting a
+# thread per connection; connections it cannot take are closed (load shed).
+# reuse_port: share the port with the other processes in multi-process mode
+def start_server(
+    host="localhost",
+    port=2738,
+    backlog=DEFAULT_BACKLOG,
+    pool=None,
+    max_connections=DEFAULT_MAX_CONNECTIONS,
+    reuse_port=False,
+):
+    connection_slots = threading.BoundedSemaphore(max_connections)
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
-        server_socket.bind(("localhost", 2738))
-        server_socket.listen(1)
-        print("Server is listening for connections...")
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            prefork.set_reuse_port(server_socket)
+        server_socket.bind((host, port))
+        server_socket.listen(backlog)
+        log.info("Server is listening for connections...")
 
         while True:
             try:
                 client_socket, client_address = server_socket.accept()
-                print(f"Accepted connection from {client_address}")
-                threading.Thread(
-                    target=handle_client_connection, args=(client_socket,)
-                ).start()
+                request_log.info("Accepted connection from %s", client_address)
+                if pool is None:
+                    threading.Thread(
+                        target=handle_client_connection, args=(client_socket,)
+                    ).start()
+                elif not pool.submit(
+                    pool_client_connection, client_socket, pool, connection_slots
+                ):
+                    log.warning("Worker pool saturated, dropping connection")
+                    client_socket.close()
             except Exception as e:
-                print(f"An error occurred: {e}")
+                # e.g. out of file descriptors; keep accepting once it clears
+                log.error("An error occurred: %s", e)
+                time.sleep(0.1)
+
+
+# Run a request on the loop, or in the executor for blocking callbacks
+async def answer_async(data, flags=framing.FLAG_NONE, framed=False):
+    if framed and flags & framing.FLAG_PING:
+        return b"", framing.FLAG_PING
+    request = parse_request(data)
+    if request is None:
+        return INVALID_REPLY if framed else None
+
+    station_num, module_num, command = request
+    if is_blocking_request(module_num, command):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, build_reply, module_num, command, flags
+        )
+    return build_reply(module_num, command, flags)
+
+
+async def answer_async_frame(writer, request_id, flags, payload):
+    try:
+        reply, reply_flags = await answer_async(payload, flags, framed=True)
+        framing.write_frame(writer, request_id, reply, reply_flags)
+        await writer.drain()
+    except Exception as e:
+        log.error("An error occurred: %s", e)
+
+
+# Frames are answered concurrently, so a slow command does not hold up the
+# replies to the requests pipelined behind it
+async def serve_async_framed(reader, writer, prefix):
+    tasks = set()
+    try:
+        while True:
+            frame = await framing.read_frame(reader, prefix)
+            prefix = b""
+            if frame is None:
                 break
+            request_id, flags, payload = frame
+            task = asyncio.create_task(
+                answer_async_frame(writer, request_id, flags, payload)
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# asyncio counterpart of handle_client_connection: same request/reply protocols,
+# with blocking callbacks moved to the executor
+async def handle_async_connection(reader, writer, connection_slots):
+    async with connection_slots:
+        try:
+            try:
+                prefix = await reader.readexactly(len(framing.MAGIC))
+            except asyncio.IncompleteReadError as e:
+                prefix = e.partial
+
+            if framing.is_framed(prefix):
+                await serve_async_framed(reader, writer, prefix)
+                return
+
+            # Legacy one-shot CSV request
+            data = prefix + await reader.read(1024 - len(prefix)) if prefix else b""
+            if not data:
+                return
+
+            reply = await answer_async(data)
+            if reply is not None:
+                writer.write(reply[0])
+                await writer.drain()
+        except Exception as e:
+            log.error("An error occurred: %s", e)
+        finally:
+            writer.close()
+
+
+async def serve_async(
+    host="localhost",
+    port=2738,
+    backlog=DEFAULT_BACKLOG,
+    max_connections=DEFAULT_MAX_CONNECTIONS,
+    reuse_port=False,
+):
+    # Connections beyond the cap wait for a free slot instead of being served
+    connection_slots = asyncio.Semaphore(max_connections)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_async_connection(
+            reader, writer, connection_slots
+        ),
+        host,
+        port,
+        backlog=backlog,
+        reuse_port=reuse_port or None,
+    )
+    log.info("Server is listening for connections...")
+    async with server:
+        await server.serve_forever()
+
+
+def start_async_server(
+    host="localhost",
+    port=2738,
+    backlog=DEFAULT_BACKLOG,
+    max_connections=DEFAULT_MAX_CONNECTIONS,
+    reuse_port=False,
+):
+    asyncio.run(serve_async(host, port, backlog, max_connections, reuse_port))
+
+
+# Serve in this process. index numbers the process in multi-process mode (None
+# when running alone): process 0 ticks the shared simulator state, and each
+# process serves its own metrics on --metrics-port + index.
+def run(index, args):
+    global images
+    reuse_port = index is not None
+    if args.metrics_port:
+        metrics.serve_metrics(
+            command_metrics, args.host, args.metrics_port + (index or 0)
+        )
+    if not index:
+        simulator.start()
+    if args.image_source:
+        images = image_source.ImageSource(
+            image_source.make_provider(args.image_source),
+            cache=image_source.LruTtlCache(ttl=args.image_ttl),
+        )
+        images.start()
+
+    if args.mode == "asyncio":
+        start_async_server(
+            args.host, args.port, args.backlog, args.max_connections, reuse_port
+        )
+    elif args.mode == "pool":
+        pool = workers.WorkerPool(args.workers, args.queue_depth)
+        command_metrics.add_gauges(pool.stats)
+        if args.stats_interval:
+            workers.report_stats(pool, args.stats_interval)
+        start_server(
+            args.host,
+            args.port,
+            args.backlog,
+            pool,
+            args.max_connections,
+            reuse_port,
+        )
+    else:
+        start_server(args.host, args.port, args.backlog, reuse_port=reuse_port)
 
 
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser(description="Simulated satellite TM/TC server")
+    parser.add_argument(
+        "--list-commands",
+        action="store_true",
+        help="print the registered commands per subsystem and exit",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["threaded", "pool", "asyncio"],
+        default="threaded",
+        help="thread per connection, a bounded worker pool or a single "
+        "asyncio event loop",
+    )
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=2738)
+    parser.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG)
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="worker processes sharing the port through SO_REUSEPORT",
+    )
+    parser.add_argument(
+        "--max-connections",
+        type=int,
+        default=DEFAULT_MAX_CONNECTIONS,
+        help="concurrent connections served in pool and asyncio mode",
+    )
+    parser.add_argument("--workers", type=int, default=workers.DEFAULT_WORKERS)
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=workers.DEFAULT_QUEUE_DEPTH,
+        help="requests waiting for a worker before new ones are refused",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=60.0,
+        help="seconds between worker pool stats lines in pool mode (0: off)",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=DEFAULT_METRICS_PORT,
+        help="HTTP port serving /metrics and /metrics.json (0: off)",
+    )
+    parser.add_argument(
+        "--tick",
+        type=float,
+        default=simulator.tick_interval,
+        help="seconds between simulator state updates",
+    )
+    parser.add_argument(
+        "--image-source",
+        default=os.environ.get("IMAGE_SOURCE"),
+        help="rover photo API URL or a directory of images for CAM snaps",
+    )
+    parser.add_argument(
+        "--image-ttl",
+        type=float,
+        default=300.0,
+        help="seconds an image listing is reused before refetching",
+    )
+    logs.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.list_commands:
+        for module_num, commands in registry.modules().items():
+            print(f"{MODULE_NAMES[module_num]} (module {module_num}):")
+            for command in commands:
+                print(f"  {command}")
+        sys.exit()
+
+    logs.setup_from_args("tmtc_server", args)
+    simulator.tick_interval = args.tick
+    if args.processes > 1:
+        # Every process answers from (and sets) the same satellite state
+        simulator.share()
+        prefork.run_processes(args.processes, run, args)
+    else:
+        run(None, args)
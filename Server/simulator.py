@@ -0,0 +1,415 @@
+import contextlib
+import ctypes
+import datetime
+import functools
+import math
+import multiprocessing.sharedctypes
+import random
+import threading
+import time
+
+# Stateful satellite simulator.
+#
+# The whole spacecraft state lives in one fixed-size ctypes structure that is
+# advanced on a fixed tick. After every tick (and every set command) the reply
+# of each read-only command is rebuilt once and published; requests then just
+# return the published reply, so concurrent polling costs a dict lookup
+# instead of dozens of RNG calls per request.
+
+# Enumerations kept as small integers in the state
+MODULATIONS = ["FSK", "OMSK", "QPSK"]
+HEATER_MODES = ["AUTO", "MANUAL"]
+PPT_MODES = ["MPPT", "FIXED"]
+RESET_REASONS = ["Power Cycle", "Watchdog", "Manual"]
+ADCS_MODES = ["Stable", "Maneuver", "Drift"]
+OBC_MODES = ["Science", "Standby", "Safe"]
+POWER_STATUSES = ["Critical", "Low", "Nominal"]
+BOOT_MODES = ["Science Mode", "Safe Mode", "Bootloader"]
+CAMERA_STATUSES = ["Operational", "Standby", "Error"]
+LAST_COMMANDS = ["CMD_A", "CMD_B", "CMD_C"]
+
+MAX_IMAGES = 64
+IMAGE_SIZE_MB = 3.0
+ORBIT_PERIOD = 5400.0  # seconds
+ORBIT_RADIUS = 6771.0  # kilometers
+SUNLIT_FRACTION = 0.65
+ERROR_RATE = 0.1  # odds of a housekeeping error flag per tick
+
+u8, u16, u32, u64 = ctypes.c_uint8, ctypes.c_uint16, ctypes.c_uint32, ctypes.c_uint64
+i8, i16, f64, flag = ctypes.c_int8, ctypes.c_int16, ctypes.c_double, ctypes.c_bool
+
+
+class SatelliteState(ctypes.Structure):
+    _fields_ = [
+        ("tick", u64),
+        # Bumped on every change, so processes sharing the state can tell when
+        # their published replies are out of date
+        ("version", u64),
+        ("time", f64),
+        # EPS housekeeping
+        ("vboost", u16 * 3),
+        ("vbatt", u16),
+        ("curout", u16 * 6),
+        ("curin", u16 * 3),
+        ("cursun", u16),
+        ("cursys", u16),
+        ("temp", i8 * 6),
+        ("output", u8 * 8),
+        ("output_on_delta", u16 * 8),
+        ("output_off_delta", u16 * 8),
+        ("wdt_i2c_time_left", u32),
+        ("wdt_gnd_time_left", u32),
+        ("counter_boot", u32),
+        ("counter_wdt_i2c", u32),
+        ("counter_wdt_gnd", u32),
+        ("counter_wdt_csp", u32 * 2),
+        ("wdt_csp_pings_left", u8 * 2),
+        ("bootcause", u8),
+        ("latchup", u16 * 6),
+        ("battmode", u8),
+        ("pptmode", u8),
+        ("eps_error", flag),
+        # EPS configuration and persistent data
+        ("vbatt_max", u16),
+        ("vbatt_safe", u16),
+        ("output_status", u8 * 3),
+        ("wdt_timeout", u16),
+        ("heater_mode", u8),
+        ("heater_temp_high", i8),
+        ("heater_temp_low", i8),
+        ("eps_resets", u32),
+        ("eps_uptime", u32),
+        ("eps_reset_reason", u8),
+        ("eps_persist_error", flag),
+        # COM
+        ("com_board_temp", i8),
+        ("com_pa_temp", i8),
+        ("com_last_rssi", i16),
+        ("com_signal_quality", u8),
+        ("com_uptime", u32),
+        ("com_error", flag),
+        ("tx_count", u32),
+        ("rx_count", u32),
+        ("tx_bytes", u32),
+        ("rx_bytes", u32),
+        ("command_ack_rate", f64),
+        ("com_cmd_error", flag),
+        ("csp_address", u8),
+        ("i2c_enabled", flag),
+        ("can_enabled", flag),
+        ("sys_modulation", u8),
+        ("tx_power", u8),
+        ("beacon_interval", u8),
+        ("tx_data_rate", u8),
+        ("tx_modulation", u8),
+        ("rx_frequency", u32),
+        ("rx_baudrate", u16),
+        ("rx_data_rate", u8),
+        ("rx_modulation", u8),
+        # CAM image store
+        ("image_ids", u16 * MAX_IMAGES),
+        ("image_count", u8),
+        ("next_image_id", u16),
+        ("camera_status", u8),
+        ("focus_level", f64),
+        ("capture_success_rate", f64),
+        ("cam_error", flag),
+        ("cam_cmd_error", flag),
+        # ADCS
+        ("adcs_mode", u8),
+        ("orientation", f64 * 3),
+        ("angular_velocity", f64 * 3),
+        ("adcs_temperature", i8),
+        ("power_usage", u8),
+        ("position", f64 * 3),
+        ("velocity", f64 * 3),
+        ("maneuver_count", u32),
+        ("adcs_timeout", u16),
+        ("adcs_error", flag),
+        ("adcs_cmd_error", flag),
+        # OBC
+        ("obc_mode", u8),
+        ("obc_temperature", i8),
+        ("cpu_load", f64),
+        ("memory_usage", f64),
+        ("active_processes", u16),
+        ("boot_count", u32),
+        ("obc_resets", u32),
+        ("obc_uptime", u32),
+        ("last_boot_reason", u8),
+        ("config_change_count", u32),
+        ("boot_mode", u8),
+        ("last_command", u8),
+        ("command_success_rate", f64),
+        ("recent_errors", u8),
+        ("obc_error", flag),
+        ("obc_persist_error", flag),
+        ("obc_cmd_error", flag),
+    ]
+
+
+def clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+# Random walk of a value kept inside [low, high]
+def drift(rng, value, step, low, high):
+    return clamp(value + rng.uniform(-step, step), low, high)
+
+
+def format_time(state):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(state.time))
+
+
+def format_isotime(state):
+    return datetime.datetime.fromtimestamp(state.time).isoformat()
+
+
+# Power-on values, drawn from the same ranges the callbacks used to randomize
+def initialize(state, rng, now):
+    state.tick = 0
+    state.time = now
+
+    state.vboost[:] = [rng.randint(3000, 4000) for _ in range(3)]
+    state.vbatt = 8000
+    state.temp[:] = [rng.randint(0, 30) for _ in range(6)]
+    state.output[:] = [1, 1, 1, 0, 0, 0, 0, 0]
+    state.wdt_timeout = 300
+    state.wdt_i2c_time_left = state.wdt_gnd_time_left = state.wdt_timeout
+    state.counter_boot = rng.randint(1, 100)
+    state.wdt_csp_pings_left[:] = [10, 10]
+    state.vbatt_max = 8300
+    state.vbatt_safe = 6500
+    state.output_status[:] = [1, 1, 0]
+    state.heater_temp_high = 20
+    state.heater_temp_low = 5
+    state.eps_resets = rng.randint(1, 10)
+
+    state.com_board_temp = 20
+    state.com_pa_temp = 25
+    state.com_last_rssi = -80
+    state.command_ack_rate = 0.95
+    state.csp_address = 5
+    state.i2c_enabled = True
+    state.can_enabled = True
+    state.tx_power = 3
+    state.beacon_interval = 10
+    state.tx_data_rate = 5
+    state.rx_frequency = 437000000
+    state.rx_baudrate = 9600
+    state.rx_data_rate = 5
+
+    state.next_image_id = 100
+    for _ in range(5):
+        store_image(state)
+    state.focus_level = 7.5
+    state.capture_success_rate = 0.9
+
+    state.adcs_temperature = 20
+    state.power_usage = 30
+    state.orientation[:] = [rng.uniform(-180, 180) for _ in range(3)]
+    state.angular_velocity[:] = [rng.uniform(-0.1, 0.1) for _ in range(3)]
+    state.adcs_timeout = 120
+
+    state.obc_mode = OBC_MODES.index("Standby")
+    state.obc_temperature = 25
+    state.cpu_load = 0.2
+    state.memory_usage = 0.4
+    state.active_processes = 20
+    state.boot_count = state.counter_boot
+    state.obc_resets = state.eps_resets
+    state.command_success_rate = 0.95
+    advance(state, rng, 0.0)
+
+
+def store_image(state):
+    if state.image_count == MAX_IMAGES:
+        state.image_ids[:-1] = state.image_ids[1:]
+        state.image_count -= 1
+    state.image_ids[state.image_count] = state.next_image_id
+    state.image_count += 1
+    state.next_image_id = 100 + (state.next_image_id - 99) % 100
+    return state.image_ids[state.image_count - 1]
+
+
+def stored_images(state):
+    return list(state.image_ids[: state.image_count])
+
+
+# Advance the state by dt seconds
+def advance(state, rng, dt):
+    state.tick += 1
+    # Whole seconds crossed by this tick, so short ticks still add up
+    elapsed = int(state.time + dt) - int(state.time)
+    state.time += dt
+
+    # Orbit: circular, with an eclipse over the last part of each period
+    phase = (state.time % ORBIT_PERIOD) / ORBIT_PERIOD
+    sunlit = phase < SUNLIT_FRACTION
+    angle = 2 * math.pi * phase
+    speed = 2 * math.pi * ORBIT_RADIUS / ORBIT_PERIOD
+    state.position[:] = [
+        ORBIT_RADIUS * math.cos(angle),
+        ORBIT_RADIUS * math.sin(angle),
+        0.0,
+    ]
+    state.velocity[:] = [-speed * math.sin(angle), speed * math.cos(angle), 0.0]
+
+    # EPS: solar input charges the battery, enabled outputs drain it
+    outputs_on = sum(state.output)
+    state.cursun = int(drift(rng, 450, 30, 100, 500)) if sunlit else 100
+    state.curin[:] = [clamp(state.cursun // 3 + rng.randint(-10, 10), 100, 500)] * 3
+    state.curout[:] = [
+        clamp((200 if state.output[i] else 100) + rng.randint(-20, 20), 100, 500)
+        for i in range(6)
+    ]
+    state.cursys = clamp(150 + 40 * outputs_on + rng.randint(-10, 10), 100, 500)
+    charge = (state.cursun - state.cursys) * dt / 100.0
+    state.vbatt = int(clamp(state.vbatt + charge, 6000, min(9000, state.vbatt_max)))
+    if state.vbatt < state.vbatt_safe:
+        state.battmode = 0
+    elif state.vbatt < (state.vbatt_safe + state.vbatt_max) // 2:
+        state.battmode = 1
+    else:
+        state.battmode = 2
+    state.temp[:] = [int(drift(rng, t, 1, -40, 80)) for t in state.temp]
+    for i in range(8):
+        if state.output[i]:
+            state.output_on_delta[i] = min(1000, state.output_on_delta[i] + elapsed)
+        else:
+            state.output_off_delta[i] = min(1000, state.output_off_delta[i] + elapsed)
+
+    # Watchdogs count down and fire when not kicked
+    if state.wdt_gnd_time_left <= elapsed:
+        state.counter_wdt_gnd += 1
+        state.wdt_gnd_time_left = state.wdt_timeout
+    else:
+        state.wdt_gnd_time_left -= elapsed
+    if state.wdt_i2c_time_left <= elapsed:
+        state.wdt_i2c_time_left = state.wdt_timeout
+    else:
+        state.wdt_i2c_time_left -= elapsed
+    state.eps_uptime += elapsed
+
+    # COM link
+    state.com_uptime += elapsed
+    state.com_board_temp = int(drift(rng, state.com_board_temp, 1, -10, 50))
+    state.com_pa_temp = int(drift(rng, state.com_pa_temp, 1, -10, 60))
+    state.com_last_rssi = int(drift(rng, state.com_last_rssi, 3, -120, 0))
+    state.com_signal_quality = int(clamp(state.com_last_rssi + 120, 0, 100))
+    if rng.random() < 0.2:
+        state.tx_count += 1
+        state.tx_bytes += rng.randint(10, 200)
+
+    # CAM
+    state.capture_success_rate = drift(rng, state.capture_success_rate, 0.01, 0, 1)
+
+    # ADCS: integrate the attitude, wrapping angles to [-180, 180)
+    state.orientation[:] = [
+        (angle + rate * dt + 180) % 360 - 180
+        for angle, rate in zip(state.orientation, state.angular_velocity)
+    ]
+    state.angular_velocity[:] = [
+        drift(rng, rate, 0.01, -1, 1) for rate in state.angular_velocity
+    ]
+    state.adcs_temperature = int(drift(rng, state.adcs_temperature, 1, -40, 80))
+    state.power_usage = int(drift(rng, state.power_usage, 2, 10, 100))
+
+    # OBC
+    state.obc_uptime += elapsed
+    state.cpu_load = drift(rng, state.cpu_load, 0.05, 0, 1)
+    state.memory_usage = drift(rng, state.memory_usage, 0.02, 0, 1)
+    state.obc_temperature = int(drift(rng, state.obc_temperature, 1, -20, 70))
+    state.active_processes = int(drift(rng, state.active_processes, 2, 0, 100))
+
+    # Simulated faults are drawn once per tick
+    for name in (
+        "eps_error",
+        "eps_persist_error",
+        "com_error",
+        "com_cmd_error",
+        "cam_error",
+        "cam_cmd_error",
+        "adcs_error",
+        "adcs_cmd_error",
+        "obc_error",
+        "obc_persist_error",
+        "obc_cmd_error",
+    ):
+        setattr(state, name, rng.random() < ERROR_RATE)
+
+
+class Simulator:
+    def __init__(self, tick_interval=1.0, seed=None, state=None, lock=None):
+        self.tick_interval = tick_interval
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock() if lock is None else lock
+        self.state = SatelliteState() if state is None else state
+        if state is None:
+            initialize(self.state, self.rng, time.time())
+        self._builders = {}
+        self._snapshots = {}
+        self._version = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    # Move the state into shared memory, guarded by a process-shared lock.
+    # Processes forked afterwards all see (and tick or set) the same state and
+    # rebuild their published replies when its version moves.
+    def share(self):
+        with self.lock:
+            shared = multiprocessing.sharedctypes.RawValue(SatelliteState)
+            ctypes.pointer(shared)[0] = self.state
+            self.state = shared
+        self.lock = multiprocessing.Lock()
+
+    # Decorator for read-only callbacks: builder(state) formats the reply, the
+    # returned callback hands out the copy published at the last tick
+    def snapshot(self, builder):
+        name = builder.__name__
+        with self.lock:
+            self._builders[name] = builder
+            self._snapshots = {**self._snapshots, name: builder(self.state)}
+
+        @functools.wraps(builder)
+        def read():
+            if self.state.version != self._version:
+                with self.lock:
+                    self._publish()
+            return self._snapshots[name]
+
+        return read
+
+    def _publish(self):
+        self._snapshots = {
+            name: builder(self.state) for name, builder in self._builders.items()
+        }
+        self._version = self.state.version
+
+    # Mutate the state (set commands); snapshots are republished on exit
+    @contextlib.contextmanager
+    def update(self):
+        with self.lock:
+            yield self.state
+            self.state.version += 1
+            self._publish()
+
+    def step(self, dt=None):
+        with self.lock:
+            advance(self.state, self.rng, self.tick_interval if dt is None else dt)
+            self.state.version += 1
+            self._publish()
+
+    def _run(self):
+        next_tick = time.monotonic() + self.tick_interval
+        while not self._stopped.wait(max(0.0, next_tick - time.monotonic())):
+            self.step()
+            next_tick += self.tick_interval
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,173 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Shared")
+)
+import hk_schema
+
+# Django project of the views, whose storage layer writes the documents
+BACKEND_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "App", "backend"
+)
+
+# Same error rate as the simulator (simulator.py)
+ERROR_RATE = 0.1
+
+# Module number of each subsystem, as the views store its replies
+MODULE_NUMBERS = {
+    "eps": 4,
+    "com": 3,
+    "adcs": 5,
+}
+
+
+# Draw count housekeeping frames at once as NumPy columns (the layout returned
+# by hk_schema decode_numpy). Values come from the field ranges of the schema;
+# timestamps increase by interval seconds and end now unless start is given.
+def generate(schema, count, interval=1, start=None, seed=None):
+    rng = np.random.default_rng(seed)
+    if start is None:
+        start = int(time.time()) - (count - 1) * interval
+
+    columns = {}
+    for f in schema.fields:
+        shape = count if f.count == 1 else (count, f.count)
+        dtype = np.dtype("<" + f.code) if f.kind == "value" else None
+        if f.kind == "timestamp":
+            epochs = start + np.arange(count, dtype=np.int64) * interval
+            columns[f.name] = epochs.astype("datetime64[s]")
+        elif f.kind == "bits":
+            columns[f.name] = rng.integers(0, 2, size=shape, dtype=np.uint8)
+        elif f.name == "error":
+            columns[f.name] = rng.random(count) < ERROR_RATE
+        elif f.name == "error_code":
+            columns[f.name] = np.where(columns["error"], schema.error_code, "None")
+        elif dtype.kind == "f":
+            columns[f.name] = rng.uniform(f.low, f.high, size=shape).astype(dtype)
+        else:
+            columns[f.name] = rng.integers(
+                f.low, f.high, size=shape, dtype=dtype, endpoint=True
+            )
+    return columns
+
+
+# Columns as a structured array whose bytes are a run of binary frames
+def to_records(schema, columns):
+    count = len(columns[schema.fields[0].name])
+    records = np.empty(count, dtype=schema.dtype)
+    records["schema_id"] = schema.schema_id
+    records["version"] = schema.version
+    for f in schema.fields:
+        column = columns[f.name]
+        if f.kind == "timestamp":
+            column = column.astype(np.int64)
+        elif f.kind == "bits":
+            weights = (1 << np.arange(f.count)).astype(np.uint64)
+            column = column.astype(np.uint64) @ weights
+        elif f.kind == "text":
+            column = column.astype(records.dtype[f.name])
+        records[f.name] = column
+    return records
+
+
+# Columns as documents shaped like the command replies the views store
+def to_documents(schema, columns):
+    values = {}
+    for f in schema.fields:
+        column = columns[f.name]
+        if f.kind == "timestamp":
+            column = np.char.add(np.datetime_as_string(column, unit="s"), "Z")
+        values[f.name] = column.tolist()
+
+    names = list(values)
+    for row in zip(*values.values()):
+        document = dict(zip(names, row))
+        yield {schema.root: document} if schema.root else document
+
+
+# Append the frames to a binary file, readable with hk_schema.decode_numpy
+def write_frames(path, schema, columns):
+    with open(path, "ab") as output:
+        to_records(schema, columns).tofile(output)
+
+
+# Settings and storage layer of the views, on the database at mongo_uri
+def setup_backend(mongo_uri, database):
+    os.environ["MONGODB_URI"] = mongo_uri
+    os.environ["MONGODB_DATABASE"] = database
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    sys.path.append(BACKEND_DIR)
+    import django
+
+    django.setup()
+    from backend import storage
+
+    return storage
+
+
+# Store the documents through the views' storage layer, so they are tagged
+# and land in the collection the fetch views read (backend/ingest.py);
+# returns the number of documents inserted by collection name
+def write_mongo(storage, module_num, schema, columns, batch_size=10000):
+    inserted = {}
+
+    def store(batch):
+        for name, count in storage.store_many(batch).items():
+            inserted[name] = inserted.get(name, 0) + count
+
+    batch = []
+    for document in to_documents(schema, columns):
+        batch.append((module_num, document))
+        if len(batch) == batch_size:
+            store(batch)
+            batch = []
+    if batch:
+        store(batch)
+    return inserted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic housekeeping history in bulk"
+    )
+    parser.add_argument(
+        "subsystems", nargs="+", choices=sorted(hk_schema.SCHEMAS_BY_SUBSYSTEM)
+    )
+    parser.add_argument("--count", type=int, default=7 * 24 * 3600)
+    parser.add_argument("--interval", type=int, default=1, help="seconds per frame")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--out", help="directory for <subsystem>_hk.bin files")
+    parser.add_argument("--mongo-uri", help="write into the telemetry collections")
+    parser.add_argument("--database", default="myDatabase")
+    args = parser.parse_args()
+
+    if not args.out and not args.mongo_uri:
+        parser.error("give --out and/or --mongo-uri")
+
+    storage = None
+    if args.mongo_uri:
+        storage = setup_backend(args.mongo_uri, args.database)
+
+    for subsystem in args.subsystems:
+        schema = hk_schema.SCHEMAS_BY_SUBSYSTEM[subsystem]
+        start = time.perf_counter()
+        columns = generate(schema, args.count, args.interval, seed=args.seed)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{subsystem}: {args.count} frames in {elapsed:.2f}s "
+            f"({args.count / elapsed:,.0f} frames/s)"
+        )
+
+        if args.out:
+            path = os.path.join(args.out, f"{subsystem}_hk.bin")
+            write_frames(path, schema, columns)
+            print(f"  wrote {path}")
+        if storage is not None:
+            inserted = write_mongo(storage, MODULE_NUMBERS[subsystem], schema, columns)
+            for name, count in inserted.items():
+                print(f"  inserted {count} into {name}")
@@ -0,0 +1,103 @@
+import datetime
+import json
+
+import framing
+
+try:
+    import orjson
+except ImportError:  # stdlib json is the fallback
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    from bson import ObjectId
+except ImportError:  # pymongo is only installed on the Django side
+    ObjectId = None
+
+# Serialization of replies and API responses, shared by the server, the relay
+# and the Django views.
+#
+# JSON goes through orjson when it is installed and through the stdlib json
+# module otherwise; both produce the same compact JSON. msgpack is available
+# as a binary alternative for framed replies (FLAG_MSGPACK). Every codec
+# encodes datetimes as ISO 8601 strings and Mongo ObjectIds as their hex
+# string, so documents straight from the database can be returned as is.
+
+DecodeError = json.JSONDecodeError  # orjson's decode error subclasses it
+
+
+# Types the underlying libraries do not know
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if ObjectId is not None and isinstance(value, ObjectId):
+        return str(value)
+    # NumPy scalars (e.g. from the bulk telemetry generator)
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Type is not serializable: {type(value).__name__}")
+
+
+class StdlibJsonCodec:
+    name = "json"
+
+    def dumps(self, value):
+        return json.dumps(value, default=_default, separators=(",", ":")).encode(
+            "utf-8"
+        )
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec:
+    name = "orjson"
+    options = orjson.OPT_SERIALIZE_NUMPY if orjson else 0
+
+    def dumps(self, value):
+        return orjson.dumps(value, default=_default, option=self.options)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    def dumps(self, value):
+        return msgpack.packb(value, default=_default)
+
+    def loads(self, data):
+        try:
+            return msgpack.unpackb(data)
+        except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+            raise ValueError(f"Malformed msgpack payload: {e}") from e
+
+
+STDLIB_JSON = StdlibJsonCodec()
+JSON = OrjsonCodec() if orjson else STDLIB_JSON
+MSGPACK = MsgpackCodec() if msgpack else None
+
+dumps = JSON.dumps
+loads = JSON.loads
+
+
+# Codec of a framed reply from its flags
+def for_flags(flags):
+    if flags & framing.FLAG_MSGPACK:
+        if MSGPACK is None:
+            raise ValueError("msgpack reply but msgpack is not installed")
+        return MSGPACK
+    return JSON
+
+
+# Codec and reply flags for a request: msgpack when the client accepts it and
+# it is installed here, JSON otherwise
+def for_request(flags):
+    if flags & framing.FLAG_MSGPACK and MSGPACK is not None:
+        return MSGPACK, framing.FLAG_MSGPACK
+    return JSON, framing.FLAG_NONE
@@ -0,0 +1,343 @@
+import asyncio
+import itertools
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+# Framed wire protocol shared by the server, the relay and the Django views.
+#
+# Every frame is a fixed header followed by the payload:
+#   magic (2 bytes) | flags (1 byte) | pad | request id (uint32) | length (uint32)
+# Requests carry the usual "station,module,command" text, replies the JSON
+# acknowledgment. Replies echo the request id, so a client can pipeline many
+# requests over one connection and match replies that arrive out of order.
+#
+# The magic bytes can never start a legacy CSV request (those begin with the
+# station number), which lets a server accept both protocols on one port.
+MAGIC = b"\xa5\x5a"
+HEADER = struct.Struct("!2sBxII")
+MAX_PAYLOAD = 16 * 1024 * 1024
+
+FLAG_NONE = 0x00
+# Request: the client accepts binary housekeeping replies (see hk_schema.py).
+# Reply: the payload is a binary housekeeping frame rather than JSON.
+FLAG_BINARY_HK = 0x01
+# Request: the client accepts msgpack replies (see codec.py).
+# Reply: the payload is msgpack rather than JSON.
+FLAG_MSGPACK = 0x02
+# Request: health check, answered at once with an empty reply carrying the
+# same flag and never forwarded upstream.
+FLAG_PING = 0x04
+
+
+class FramingError(ConnectionError):
+    pass
+
+
+def encode_frame(request_id, payload, flags=FLAG_NONE):
+    if len(payload) > MAX_PAYLOAD:
+        raise FramingError(f"Payload too large: {len(payload)} bytes")
+    return HEADER.pack(MAGIC, flags, request_id, len(payload)) + payload
+
+
+def decode_header(header):
+    magic, flags, request_id, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise FramingError("Bad frame magic")
+    if length > MAX_PAYLOAD:
+        raise FramingError(f"Payload too large: {length} bytes")
+    return flags, request_id, length
+
+
+def is_framed(prefix):
+    return prefix[: len(MAGIC)] == MAGIC
+
+
+# Read exactly size bytes; b"" on a clean EOF before the first byte
+def recv_exact(sock, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            if remaining == size:
+                return b""
+            raise FramingError("Connection closed mid-frame")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+# Read until the peer closes the connection (legacy one-shot replies)
+def recv_all(sock, chunk_size=65536):
+    chunks = []
+    while True:
+        chunk = sock.recv(chunk_size)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+# Peek at the first bytes of a new connection without consuming them
+def peek_framed(sock):
+    prefix = sock.recv(len(MAGIC), socket.MSG_PEEK | socket.MSG_WAITALL)
+    return is_framed(prefix)
+
+
+# TCP keep-alive probes on an idle connection, so that a peer that went away
+# without closing it (crash, network loss) is noticed within about
+# idle + interval * count seconds
+def set_keepalive(sock, idle=30, interval=10, count=3):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (
+        ("TCP_KEEPIDLE", idle),
+        ("TCP_KEEPINTVL", interval),
+        ("TCP_KEEPCNT", count),
+    ):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+def send_frame(sock, request_id, payload, flags=FLAG_NONE):
+    sock.sendall(encode_frame(request_id, payload, flags))
+
+
+# Returns (request_id, flags, payload), or None when the peer closed cleanly
+def recv_frame(sock):
+    header = recv_exact(sock, HEADER.size)
+    if not header:
+        return None
+    flags, request_id, length = decode_header(header)
+    payload = recv_exact(sock, length) if length else b""
+    if length and not payload:
+        raise FramingError("Connection closed mid-frame")
+    return request_id, flags, payload
+
+
+# prefix: header bytes the caller already consumed while sniffing the protocol
+async def read_frame(reader, prefix=b""):
+    try:
+        header = prefix + await reader.readexactly(HEADER.size - len(prefix))
+    except asyncio.IncompleteReadError as e:
+        if not prefix and not e.partial:
+            return None
+        raise FramingError("Connection closed mid-frame") from e
+    flags, request_id, length = decode_header(header)
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError as e:
+        raise FramingError("Connection closed mid-frame") from e
+    return request_id, flags, payload
+
+
+def write_frame(writer, request_id, payload, flags=FLAG_NONE):
+    writer.write(encode_frame(request_id, payload, flags))
+
+
+# Client side of a long-lived framed connection. Requests from any thread are
+# pipelined over the one socket and a reader thread resolves each pending
+# Future when the reply carrying its request id comes back.
+class FramedConnection:
+    def __init__(self, address, connect_timeout=5.0):
+        self.address = address
+        self.sock = socket.create_connection(address, timeout=connect_timeout)
+        self.sock.settimeout(None)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        set_keepalive(self.sock)
+        self.last_reply = time.monotonic()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self.closed = False
+        self._reader = threading.Thread(target=self._read_replies, daemon=True)
+        self._reader.start()
+
+    def submit(self, payload, flags=FLAG_NONE):
+        future = Future()
+        with self._lock:
+            if self.closed:
+                raise FramingError("Connection is closed")
+            request_id = next(self._ids) & 0xFFFFFFFF
+            self._pending[request_id] = future
+        try:
+            with self._send_lock:
+                send_frame(self.sock, request_id, payload, flags)
+        except OSError as e:
+            self._fail_pending(e)
+            raise
+        return future
+
+    # Blocking request; returns (flags, payload) of the reply. On a timeout
+    # the request is forgotten and a late reply dropped.
+    def request(self, payload, flags=FLAG_NONE, timeout=None):
+        future = self.submit(payload, flags)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            self.discard(future)
+            raise
+
+    # Stop waiting for the reply to a submitted request
+    def discard(self, future):
+        with self._lock:
+            for request_id, pending in self._pending.items():
+                if pending is future:
+                    del self._pending[request_id]
+                    break
+
+    # Round trip of a FLAG_PING frame; raises on a dead or stalled peer
+    def ping(self, timeout=None):
+        self.request(b"", FLAG_PING, timeout)
+
+    # Requests waiting for their reply
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def _read_replies(self):
+        error = FramingError("Connection closed by peer")
+        try:
+            while True:
+                frame = recv_frame(self.sock)
+                if frame is None:
+                    break
+                request_id, flags, payload = frame
+                self.last_reply = time.monotonic()
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result((flags, payload))
+        except OSError as e:
+            error = e
+        self._fail_pending(error)
+
+    def _fail_pending(self, error):
+        with self._lock:
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self._fail_pending(FramingError("Connection is closed"))
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# asyncio counterpart of FramedConnection over streams, for one event loop.
+# Requests from any task are pipelined over the connection and a reader task
+# resolves each pending future when its reply comes back.
+class AsyncFramedConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_reply = time.monotonic()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self.closed = False
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_replies())
+
+    @classmethod
+    async def open(cls, address, connect_timeout=5.0):
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(*address), connect_timeout
+        )
+        sock = writer.get_extra_info("socket")
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        set_keepalive(sock)
+        return cls(reader, writer)
+
+    # Future of the (flags, payload) reply
+    def submit(self, payload, flags=FLAG_NONE):
+        if self.closed:
+            raise FramingError("Connection is closed")
+        request_id = next(self._ids) & 0xFFFFFFFF
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        write_frame(self.writer, request_id, payload, flags)
+        return future
+
+    # Returns (flags, payload) of the reply; on a timeout the request is
+    # forgotten and a late reply dropped
+    async def request(self, payload, flags=FLAG_NONE, timeout=None):
+        future = self.submit(payload, flags)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except TimeoutError:
+            self.discard(future)
+            raise
+
+    def discard(self, future):
+        for request_id, pending in self._pending.items():
+            if pending is future:
+                del self._pending[request_id]
+                break
+
+    async def ping(self, timeout=None):
+        await self.request(b"", FLAG_PING, timeout)
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    async def _read_replies(self):
+        error = FramingError("Connection closed by peer")
+        try:
+            while True:
+                frame = await read_frame(self.reader)
+                if frame is None:
+                    break
+                request_id, flags, payload = frame
+                self.last_reply = time.monotonic()
+                future = self._pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result((flags, payload))
+        except OSError as e:
+            error = e
+        self._fail_pending(error)
+
+    def _fail_pending(self, error):
+        self.closed = True
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.writer.close()
+
+    def close(self):
+        self._fail_pending(FramingError("Connection is closed"))
+        self._reader_task.cancel()
+
+
+# Incremental decoder for callback-style readers (asyncio protocols): feed it
+# whatever bytes arrived and get back the frames they completed
+class FrameParser:
+    def __init__(self):
+        self._buffer = bytearray()
+
+    # Returns [(request_id, flags, payload), ...]; raises FramingError
+    def feed(self, data):
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        while len(buffer) >= HEADER.size:
+            flags, request_id, length = decode_header(bytes(buffer[: HEADER.size]))
+            end = HEADER.size + length
+            if len(buffer) < end:
+                break
+            frames.append((request_id, flags, bytes(buffer[HEADER.size : end])))
+            del buffer[:end]
+        return frames
@@ -0,0 +1,275 @@
+import calendar
+import struct
+import time
+from collections import namedtuple
+
+import codec
+import framing
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for decode_numpy
+    np = None
+
+# Struct-packed binary encoding of housekeeping frames.
+#
+# A schema lists the fields of one housekeeping reply in wire order. Every
+# binary frame starts with the schema id and version, followed by the fields
+# packed little-endian without padding, so a run of frames can also be viewed
+# directly as a NumPy structured array.
+#
+# Field kinds:
+#   value      plain number(s) of the given struct code
+#   timestamp  "%Y-%m-%dT%H:%M:%SZ" string sent as uint32 epoch seconds
+#   bits       list of 0/1 flags packed into one unsigned integer
+#   text       short string padded with NULs ("4s")
+#
+# low/high give the range the simulator draws the field from (inclusive for
+# integers), so bulk generators can produce realistic frames from the schema.
+HkField = namedtuple("HkField", "name code count kind low high")
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+PREFIX = struct.Struct("<BB")
+
+
+def field(name, code, count=1, kind="value", low=None, high=None):
+    return HkField(name, code, count, kind, low, high)
+
+
+class HkSchema:
+    def __init__(
+        self,
+        schema_id,
+        command,
+        fields,
+        root=None,
+        version=1,
+        subsystem=None,
+        error_code=None,
+    ):
+        self.schema_id = schema_id
+        self.command = command
+        self.fields = fields
+        # Key the fields are nested under in the reply (e.g. "housekeeping_data")
+        self.root = root
+        self.version = version
+        self.subsystem = subsystem
+        # Code reported in the "error_code" field when "error" is set
+        self.error_code = error_code
+        self.struct = struct.Struct("<" + "".join(self._struct_code(f) for f in fields))
+        self.size = PREFIX.size + self.struct.size
+        self._prefix = PREFIX.pack(schema_id, version)
+        self._layout = [(f.name, f.kind, f.count) for f in fields]
+
+    @staticmethod
+    def _struct_code(f):
+        if f.kind == "bits" or f.count == 1:
+            return f.code
+        return f"{f.count}{f.code}"
+
+    def encode(self, frame):
+        values = frame[self.root] if self.root else frame
+        packed = []
+        for name, kind, count in self._layout:
+            value = values[name]
+            if kind == "value":
+                if count == 1:
+                    packed.append(value)
+                else:
+                    packed.extend(value)
+            elif kind == "timestamp":
+                packed.append(_timestamp_to_epoch(value))
+            elif kind == "bits":
+                packed.append(sum(1 << i for i, bit in enumerate(value) if bit))
+            else:
+                packed.append(value.encode("ascii"))
+        return self._prefix + self.struct.pack(*packed)
+
+    def decode(self, data):
+        raw = self.struct.unpack_from(data, PREFIX.size)
+        values = {}
+        index = 0
+        for name, kind, count in self._layout:
+            if kind == "value":
+                if count == 1:
+                    values[name] = raw[index]
+                else:
+                    values[name] = list(raw[index : index + count])
+                    index += count
+                    continue
+            elif kind == "timestamp":
+                values[name] = _epoch_to_timestamp(raw[index])
+            elif kind == "bits":
+                bits = raw[index]
+                values[name] = [(bits >> i) & 1 for i in range(count)]
+            else:
+                values[name] = raw[index].rstrip(b"\0").decode("ascii")
+            index += 1
+        return {self.root: values} if self.root else values
+
+    # NumPy structured dtype of one frame, prefix included
+    @property
+    def dtype(self):
+        _require_numpy()
+        fields = [("schema_id", "u1"), ("version", "u1")]
+        for f in self.fields:
+            code = "S" + f.code[:-1] if f.kind == "text" else "<" + f.code
+            if f.kind == "bits" or f.count == 1:
+                fields.append((f.name, code))
+            else:
+                fields.append((f.name, code, (f.count,)))
+        return np.dtype(fields)
+
+    # Decode a concatenation of frames into a dict of NumPy column arrays
+    def decode_numpy(self, data):
+        records = np.frombuffer(data, dtype=self.dtype)
+        columns = {}
+        for f in self.fields:
+            column = records[f.name]
+            if f.kind == "timestamp":
+                column = column.astype("datetime64[s]")
+            elif f.kind == "bits":
+                column = (
+                    (column[:, None] >> np.arange(f.count, dtype=column.dtype)) & 1
+                ).astype(np.uint8)
+            elif f.kind == "text":
+                column = column.astype(f"U{column.dtype.itemsize}")
+            columns[f.name] = column
+        return columns
+
+
+# Fixed-position parse of TIMESTAMP_FORMAT; strptime is the slowest part of
+# encoding a frame otherwise
+def _timestamp_to_epoch(value):
+    return calendar.timegm(
+        (
+            int(value[0:4]),
+            int(value[5:7]),
+            int(value[8:10]),
+            int(value[11:13]),
+            int(value[14:16]),
+            int(value[17:19]),
+        )
+    )
+
+
+def _epoch_to_timestamp(value):
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(value))
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("NumPy is required to decode frames into arrays")
+
+
+# EPS housekeeping (eps_telem_hk_get_cb)
+EPS_HK = HkSchema(
+    schema_id=1,
+    command="eps_telem_hk_get_cb",
+    subsystem="eps",
+    error_code="E01",
+    fields=[
+        field("timestamp", "I", kind="timestamp"),
+        field("vboost", "H", 3, low=3000, high=4000),
+        field("vbatt", "H", low=6000, high=9000),
+        field("curout", "H", 6, low=100, high=500),
+        field("curin", "H", 3, low=100, high=500),
+        field("cursun", "H", low=100, high=500),
+        field("cursys", "H", low=100, high=500),
+        field("temp", "b", 6, low=-40, high=80),
+        field("output", "B", 8, kind="bits"),
+        field("output_on_delta", "H", 8, low=0, high=1000),
+        field("output_off_delta", "H", 8, low=0, high=1000),
+        field("wdt_i2c_time_left", "H", low=0, high=10000),
+        field("wdt_gnd_time_left", "H", low=0, high=10000),
+        field("counter_boot", "H", low=0, high=100),
+        field("counter_wdt_i2c", "H", low=0, high=100),
+        field("counter_wdt_gnd", "H", low=0, high=100),
+        field("counter_wdt_csp", "H", 2, low=0, high=100),
+        field("wdt_csp_pings_left", "B", 2, low=0, high=10),
+        field("bootcause", "B", low=0, high=2),
+        field("latchup", "H", 6, low=0, high=10),
+        field("battmode", "B", low=0, high=2),
+        field("pptmode", "B", low=0, high=2),
+        field("error", "?"),
+        field("error_code", "4s", kind="text"),
+    ],
+)
+
+# COM housekeeping (com_telem_hk_get_cb)
+COM_HK = HkSchema(
+    schema_id=2,
+    command="com_telem_hk_get_cb",
+    root="housekeeping_data",
+    subsystem="com",
+    error_code="E03",
+    fields=[
+        field("timestamp", "I", kind="timestamp"),
+        field("board_temp", "b", low=-10, high=50),
+        field("pa_temp", "b", low=-10, high=60),
+        field("last_rssi", "h", low=-120, high=0),
+        field("signal_quality", "B", low=0, high=100),
+        field("uptime", "I", low=0, high=10000),
+        field("error", "?"),
+        field("error_code", "4s", kind="text"),
+    ],
+)
+
+# ADCS housekeeping (adcs_telem_hk_get_cb); angles and rates as float32
+ADCS_HK = HkSchema(
+    schema_id=3,
+    command="adcs_telem_hk_get_cb",
+    root="housekeeping_data",
+    subsystem="adcs",
+    error_code="E07",
+    fields=[
+        field("timestamp", "I", kind="timestamp"),
+        field("temperature", "b", low=-40, high=80),
+        field("power_usage", "B", low=10, high=100),
+        field("orientation", "f", 3, low=-180.0, high=180.0),
+        field("angular_velocity", "f", 3, low=-1.0, high=1.0),
+        field("error", "?"),
+        field("error_code", "4s", kind="text"),
+    ],
+)
+
+SCHEMAS = [EPS_HK, COM_HK, ADCS_HK]
+SCHEMAS_BY_SUBSYSTEM = {schema.subsystem: schema for schema in SCHEMAS}
+SCHEMAS_BY_ID = {schema.schema_id: schema for schema in SCHEMAS}
+SCHEMAS_BY_COMMAND = {schema.command: schema for schema in SCHEMAS}
+
+
+def encode(command, frame):
+    return SCHEMAS_BY_COMMAND[command].encode(frame)
+
+
+def schema_of(data):
+    schema_id, version = PREFIX.unpack_from(data)
+    schema = SCHEMAS_BY_ID.get(schema_id)
+    if schema is None or schema.version != version:
+        raise ValueError(f"Unknown housekeeping schema {schema_id} v{version}")
+    return schema
+
+
+def decode(data):
+    try:
+        return schema_of(data).decode(data)
+    except struct.error as e:
+        raise ValueError(f"Malformed housekeeping frame: {e}") from e
+
+
+# Frames of one schema, as bytes objects, straight into NumPy columns
+def decode_numpy(frames):
+    _require_numpy()
+    frames = list(frames)
+    if not frames:
+        return {}
+    return schema_of(frames[0]).decode_numpy(b"".join(frames))
+
+
+# Decode a framed reply: binary housekeeping when flagged, otherwise msgpack
+# or JSON as the flags say
+def decode_reply(flags, payload):
+    if flags & framing.FLAG_BINARY_HK:
+        return decode(payload)
+    return codec.for_flags(flags).loads(payload)
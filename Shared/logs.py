@@ -0,0 +1,277 @@
+import datetime
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+import codec
+
+# Logging pipeline shared by the server, the relay and the Django backend.
+#
+# Request threads only put records on a bounded queue. A background writer
+# thread formats them and writes them to the console and, optionally, to a
+# JSON-lines file that it also rotates, so slow stdout or disk writes never
+# hold up a request. When the queue is full new records are dropped and
+# counted instead of blocking. Per-request records go to a "<tier>.requests"
+# logger whose level and sample rate are set apart from the rest.
+#
+# Messages are formatted by the writer thread: pass immutable values as
+# %-style arguments (and raw payloads wrapped in text()) instead of building
+# the string in the request thread.
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+
+CONSOLE_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+# Attributes of every LogRecord; the others came in through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+# Payload bytes decoded only when the record is written
+class text:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return self.data.decode("utf-8", "replace")
+
+
+# One JSON object per line: time, level, logger, message and the extra= fields
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        try:
+            return codec.dumps(entry).decode("utf-8")
+        except TypeError:
+            return codec.dumps(
+                {key: str(value) for key, value in entry.items()}
+            ).decode("utf-8")
+
+
+# Keep a fraction of the records below WARNING; warnings and errors always pass
+class SampleFilter(logging.Filter):
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return (
+            self.rate >= 1.0
+            or record.levelno >= logging.WARNING
+            or random.random() < self.rate
+        )
+
+
+# Handler the loggers write to: puts records on the writer's queue and never
+# blocks, dropping records when the queue is full
+class QueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue, pipeline):
+        super().__init__(log_queue)
+        self.pipeline = pipeline
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    # Unlike the stdlib handler the message is left unformatted; only a
+    # traceback has to be rendered before its frames go away
+    def prepare(self, record):
+        if record.exc_info:
+            record = logging.makeLogRecord(vars(record))
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    # Called by logging.shutdown() at exit: write out what is still queued
+    def close(self):
+        self.pipeline.stop()
+        super().close()
+
+
+class _Listener(logging.handlers.QueueListener):
+    # The stdlib listener gives up on a full queue; wait for room instead
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    def __init__(
+        self,
+        path=None,
+        max_bytes=DEFAULT_MAX_BYTES,
+        backups=DEFAULT_BACKUPS,
+        console=True,
+        queue_size=DEFAULT_QUEUE_SIZE,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.console = console
+        self.queue_size = queue_size
+        self.handler = QueueHandler(queue.Queue(queue_size), self)
+        self._listener = None
+        self.start()
+
+    def _sinks(self, path):
+        sinks = []
+        if self.console:
+            console = logging.StreamHandler(sys.stdout)
+            console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            sinks.append(console)
+        if path:
+            # Rotation runs on the writer thread, like every other write
+            lines = logging.handlers.RotatingFileHandler(
+                path, maxBytes=self.max_bytes, backupCount=self.backups
+            )
+            lines.setFormatter(JsonLinesFormatter())
+            sinks.append(lines)
+        return sinks
+
+    def start(self, path=None):
+        self._listener = _Listener(
+            self.handler.queue,
+            *self._sinks(path or self.path),
+            respect_handler_level=True,
+        )
+        self._listener.start()
+
+    def stop(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+            for sink in listener.handlers:
+                sink.close()
+
+    # A forked child has the queue but not the writer thread: start over with
+    # a fresh queue, and a file of its own so the processes do not race to
+    # rotate the same one
+    def restart_after_fork(self):
+        self._listener = None
+        self.handler.queue = queue.Queue(self.queue_size)
+        path = None
+        if self.path:
+            root, ext = os.path.splitext(self.path)
+            path = f"{root}.{os.getpid()}{ext}"
+        self.start(path)
+
+    def stats(self):
+        return {
+            "log_queue_depth": self.handler.queue.qsize(),
+            "log_dropped": self.handler.dropped,
+        }
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+# The process-wide queue handler, starting the writer thread on first use.
+# Also usable as a logging.config "()" factory (see the Django LOGGING setting).
+def queue_handler(
+    path=None,
+    max_bytes=DEFAULT_MAX_BYTES,
+    backups=DEFAULT_BACKUPS,
+    console=True,
+    queue_size=DEFAULT_QUEUE_SIZE,
+):
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = LogPipeline(path, max_bytes, backups, console, queue_size)
+        return _pipeline.handler
+
+
+def _after_fork():
+    if _pipeline is not None:
+        _pipeline.restart_after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+# Pipeline counters for a metrics gauge
+def stats():
+    if _pipeline is None:
+        return {}
+    return _pipeline.stats()
+
+
+# Route the root logger through the pipeline; returns the "<name>" logger and
+# the "<name>.requests" logger for per-request records
+def setup(
+    name,
+    level="INFO",
+    request_level=None,
+    sample_rate=1.0,
+    path=None,
+    max_bytes=DEFAULT_MAX_BYTES,
+    backups=DEFAULT_BACKUPS,
+):
+    root = logging.getLogger()
+    root.addHandler(queue_handler(path, max_bytes, backups))
+    root.setLevel(level)
+    requests = logging.getLogger(f"{name}.requests")
+    requests.setLevel(request_level or level)
+    if sample_rate < 1.0:
+        requests.addFilter(SampleFilter(sample_rate))
+    return logging.getLogger(name), requests
+
+
+# Command line options shared by the server and the relay
+def add_arguments(parser):
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument(
+        "--request-log-level",
+        help="level of the per-request records (default: --log-level)",
+    )
+    parser.add_argument(
+        "--log-sample",
+        type=float,
+        default=1.0,
+        help="fraction of the per-request records kept (warnings always are)",
+    )
+    parser.add_argument(
+        "--log-file",
+        default=os.environ.get("LOG_FILE"),
+        help="JSON-lines log file, rotated in the background",
+    )
+    parser.add_argument("--log-max-bytes", type=int, default=DEFAULT_MAX_BYTES)
+    parser.add_argument("--log-backups", type=int, default=DEFAULT_BACKUPS)
+
+
+def setup_from_args(name, args):
+    return setup(
+        name,
+        args.log_level.upper(),
+        args.request_log_level and args.request_log_level.upper(),
+        args.log_sample,
+        args.log_file,
+        args.log_max_bytes,
+        args.log_backups,
+    )
@@ -0,0 +1,234 @@
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Request counters and latency histograms shared by the server, the relay and
+# the Django views.
+#
+# Every series is keyed by a tuple of labels (e.g. module and command) and
+# holds a request count, an error count and a fixed-bucket latency histogram.
+# Recording one request is a dict lookup and a bisect under a lock, cheap
+# enough to leave on all the time.
+
+# Histogram bucket upper bounds in seconds, from 50us to 10s
+BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Series:
+    __slots__ = ("count", "errors", "total", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        # One extra bucket for everything above the last bound
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds, error):
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    # Upper bound of the bucket holding the q-th quantile (an estimate)
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "sum_s": self.total,
+            "mean_ms": round(1000 * self.total / self.count, 3) if self.count else 0,
+            "p50_ms": 1000 * self.quantile(0.5),
+            "p90_ms": 1000 * self.quantile(0.9),
+            "p99_ms": 1000 * self.quantile(0.99),
+            "buckets": self.buckets,
+        }
+
+
+class Metrics:
+    # max_series caps the label combinations kept; later ones share an
+    # "other" series, so labels taken from client input cannot grow the table
+    def __init__(self, name, labels, max_series=1000):
+        self.name = name
+        self.labels = labels
+        self.max_series = max_series
+        self._overflow = ("other",) * len(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+        # Callables returning extra {name: number} gauges (e.g. pool stats)
+        self._gauges = []
+
+    def record(self, key, seconds, error=False):
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                if len(self._series) >= self.max_series:
+                    key = self._overflow
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = Series()
+            series.observe(seconds, error)
+
+    # Time the block under key; an exception counts as an error. The block can
+    # also flag an error itself through the yielded list: outcome[0] = True
+    def timed(self, key):
+        return _Timer(self, key)
+
+    def add_gauges(self, source):
+        self._gauges.append(source)
+
+    def gauges(self):
+        values = {}
+        for source in self._gauges:
+            values.update(source())
+        return values
+
+    def snapshot(self):
+        with self._lock:
+            series = [(key, s.to_dict()) for key, s in self._series.items()]
+        return {
+            "name": self.name,
+            "uptime_s": round(time.time() - self.started, 1),
+            "labels": list(self.labels),
+            "series": [dict(zip(self.labels, key), **s) for key, s in sorted(series)],
+            "gauges": self.gauges(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    # Prometheus text exposition format
+    def to_text(self):
+        snapshot = self.snapshot()
+        name = self.name
+        lines = [
+            f"# TYPE {name}_requests_total counter",
+            f"# TYPE {name}_errors_total counter",
+            f"# TYPE {name}_latency_seconds histogram",
+        ]
+        for series in snapshot["series"]:
+            labels = ",".join(
+                f'{label}="{_escape(series[label])}"' for label in self.labels
+            )
+            lines.append(f"{name}_requests_total{{{labels}}} {series['count']}")
+            lines.append(f"{name}_errors_total{{{labels}}} {series['errors']}")
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), series["buckets"]):
+                cumulative += count
+                lines.append(
+                    f'{name}_latency_seconds_bucket{{{labels},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            lines.append(
+                f"{name}_latency_seconds_sum{{{labels}}} {series['sum_s']:.6f}"
+            )
+            lines.append(f"{name}_latency_seconds_count{{{labels}}} {series['count']}")
+        for gauge, value in snapshot["gauges"].items():
+            lines.append(f"{name}_{gauge} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class _Timer:
+    __slots__ = ("metrics", "key", "start", "outcome")
+
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.outcome = [False]
+        self.start = time.perf_counter()
+        return self.outcome
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(
+            self.key,
+            time.perf_counter() - self.start,
+            exc_type is not None or self.outcome[0],
+        )
+
+
+# True when a command reply reports a simulated fault: an "error"/"Error"
+# flag at the top level or one level down (e.g. under "housekeeping_data")
+def reply_has_error(reply):
+    if not isinstance(reply, dict):
+        return False
+    if reply.get("error") is True or reply.get("Error") is True:
+        return True
+    for value in reply.values():
+        if isinstance(value, dict) and (
+            value.get("error") is True or value.get("Error") is True
+        ):
+            return True
+    return False
+
+
+# Serve GET /metrics (text) and /metrics.json from a daemon thread. metrics
+# may also be a list, served one after the other (a JSON list of snapshots).
+def serve_metrics(metrics, host="localhost", port=9100):
+    sources = metrics if isinstance(metrics, (list, tuple)) else [metrics]
+
+    def to_json():
+        if len(sources) == 1:
+            return sources[0].to_json()
+        return json.dumps([source.snapshot() for source in sources])
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = "".join(source.to_text() for source in sources)
+                content_type = "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = to_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            body = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,64 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import random
+import signal
+import socket
+import sys
+
+# Multi-process launch shared by the server and the relay: count worker
+# processes are forked from the parent, each opens its own listening socket on
+# the same port with SO_REUSEPORT and the kernel spreads new connections
+# across them, so request handling is no longer bound to a single GIL.
+
+log = logging.getLogger(__name__)
+
+
+def reuse_port_supported():
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+# Listening socket for one of several processes sharing host:port
+def set_reuse_port(sock):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
+def _run_worker(index, target, args):
+    # Forked children inherit the parent's random state
+    random.seed()
+    try:
+        target(index, *args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Children skip the interpreter's exit hooks: flush the log queue here
+        logging.shutdown()
+
+
+# Fork count processes running target(index, *args) and wait for them; on
+# Ctrl-C or when one dies the others are terminated too. State the workers
+# share (shared-memory values, process locks) must exist before this call.
+def run_processes(count, target, *args):
+    if not reuse_port_supported():
+        sys.exit("Multi-process mode needs SO_REUSEPORT (Linux, BSD, macOS)")
+
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_run_worker, args=(index, target, args), daemon=True)
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+    log.info("Started %d worker processes", count)
+    # A plain kill of the parent must not leave the workers holding the port
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        multiprocessing.connection.wait([process.sentinel for process in processes])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
@@ -0,0 +1,114 @@
+import ctypes
+import multiprocessing.sharedctypes
+import threading
+import time
+
+# Cache of replies to read-only configuration commands.
+#
+# Entries are keyed by (station, module, command, frame flags) and live for a
+# per-command TTL. Every cached command has a generation counter: a set or
+# reset command bumps the generation of the commands it affects, which makes
+# their entries stale at once without scanning the cache, and also keeps a
+# reply that was in flight during the set from being stored afterwards.
+# After share() the generations live in shared memory, so a set going through
+# one relay process also invalidates the entries cached by the others.
+
+# Seconds each cacheable (module, command) reply may be reused
+TTLS = {
+    ("4", "eps_cmd_get_config1_cb"): 30.0,
+    ("4", "eps_cmd_get_config2_cb"): 30.0,
+    ("4", "eps_cmd_get_config3_cb"): 30.0,
+    ("3", "com_cmd_get_config_sys_cb"): 30.0,
+    ("3", "com_cmd_get_config_tx_cb"): 30.0,
+    ("3", "com_cmd_get_config_rx_cb"): 30.0,
+    ("1", "obc_cmd_boot_count_get_cb"): 10.0,
+}
+
+# Cached commands whose replies a set/reset command changes
+INVALIDATES = {
+    ("4", "eps_cmd_set_config1_cb"): [("4", "eps_cmd_get_config1_cb")],
+    ("4", "eps_cmd_set_vboost_cb"): [("4", "eps_cmd_get_config1_cb")],
+    ("4", "eps_cmd_set_config2_cb"): [("4", "eps_cmd_get_config2_cb")],
+    ("4", "eps_cmd_set_config3_cb"): [("4", "eps_cmd_get_config3_cb")],
+    ("3", "com_cmd_set_config_sys_cb"): [("3", "com_cmd_get_config_sys_cb")],
+    ("3", "com_cmd_set_config_tx_cb"): [("3", "com_cmd_get_config_tx_cb")],
+    ("3", "com_cmd_set_config_rx_cb"): [("3", "com_cmd_get_config_rx_cb")],
+    ("1", "obc_cmd_boot_count_reset_cb"): [("1", "obc_cmd_boot_count_get_cb")],
+}
+
+
+class ResponseCache:
+    def __init__(self, ttls=TTLS, invalidates=INVALIDATES):
+        self.ttls = dict(ttls)
+        self.invalidates = dict(invalidates)
+        self._slots = {command: slot for slot, command in enumerate(self.ttls)}
+        self._generations = [0] * len(self._slots)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # key: (station, module, command, flags). Returns (reply, None) on a hit,
+    # (None, token) on a miss to pass to store() with the reply, and
+    # (None, None) for commands that are not cached.
+    def lookup(self, key):
+        command = key[1:3]
+        ttl = self.ttls.get(command)
+        if ttl is None:
+            return None, None
+        with self._lock:
+            generation = self._generations[self._slots[command]]
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and entry[0] == generation
+                and entry[1] > time.monotonic()
+            ):
+                self.hits += 1
+                return entry[2], None
+            self.misses += 1
+            return None, (key, generation)
+
+    def store(self, token, reply):
+        key, generation = token
+        command = key[1:3]
+        with self._lock:
+            if self._generations[self._slots[command]] == generation:
+                expires = time.monotonic() + self.ttls[command]
+                self._entries[key] = (generation, expires, reply)
+
+    # Call for every command passing through; set/reset commands drop the
+    # cached replies they affect
+    def invalidate(self, module_num, command):
+        affected = [
+            cached
+            for cached in self.invalidates.get((module_num, command), ())
+            if cached in self._slots
+        ]
+        if not affected:
+            return
+        with self._lock:
+            self.invalidations += 1
+            for cached in affected:
+                self._generations[self._slots[cached]] += 1
+            self._entries = {
+                key: entry
+                for key, entry in self._entries.items()
+                if key[1:3] not in affected
+            }
+
+    # Move the generation counters into shared memory (before forking)
+    def share(self):
+        self._generations = multiprocessing.sharedctypes.RawArray(
+            ctypes.c_uint64, self._generations
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "cache_invalidations": self.invalidations,
+                "cache_entries": len(self._entries),
+            }
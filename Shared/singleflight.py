@@ -0,0 +1,124 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+# Coalescing of identical concurrent requests ("singleflight").
+#
+# While a read-only request is on its way upstream, identical requests
+# arriving in the meantime wait for its reply instead of sending their own.
+# Once the reply is in, the next request starts a new call, so nobody gets a
+# reply older than their own request. Group serves threads (futures),
+# CallbackGroup the callback-style asyncio relay and AsyncGroup coroutines.
+
+
+class Group:
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.calls = 0
+
+    # Future of the call in flight under key, or of a new one: start() sends
+    # the request and returns its Future
+    def submit(self, key, start):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.hits += 1
+                return future
+            future = self._calls[key] = Future()
+            self.calls += 1
+
+        try:
+            upstream = start()
+        except BaseException as e:
+            self._finish(key, future, e)
+            raise
+        upstream.add_done_callback(lambda done: self._finish(key, future, done))
+        return future
+
+    def _finish(self, key, future, done):
+        with self._lock:
+            del self._calls[key]
+        if isinstance(done, BaseException):
+            future.set_exception(done)
+        elif done.exception() is not None:
+            future.set_exception(done.exception())
+        else:
+            future.set_result(done.result())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "coalesce_hits": self.hits,
+                "coalesce_calls": self.calls,
+                "coalesce_in_flight": len(self._calls),
+            }
+
+
+# Single-threaded (event loop) variant for callback-style code
+class CallbackGroup:
+    def __init__(self):
+        self._calls = {}
+        self.hits = 0
+        self.calls = 0
+
+    # True when the caller leads a new call and must pass its result to
+    # finish(key, ...); False when a call is already in flight, in which case
+    # callback(*result) is called with that call's result
+    def join(self, key, callback):
+        followers = self._calls.get(key)
+        if followers is not None:
+            followers.append(callback)
+            self.hits += 1
+            return False
+        self._calls[key] = []
+        self.calls += 1
+        return True
+
+    def finish(self, key, *result):
+        for callback in self._calls.pop(key, ()):
+            callback(*result)
+
+    def stats(self):
+        return {
+            "coalesce_hits": self.hits,
+            "coalesce_calls": self.calls,
+            "coalesce_in_flight": len(self._calls),
+        }
+
+
+# Coroutine variant for the tasks of one event loop
+class AsyncGroup:
+    def __init__(self):
+        self._calls = {}
+        self.hits = 0
+        self.calls = 0
+
+    # Result of the call in flight under key, or of a new start() coroutine.
+    # A caller giving up (e.g. on a timeout) does not cancel the call for the
+    # others.
+    async def run(self, key, start):
+        call = self._calls.get(key)
+        if call is None:
+            call = self._calls[key] = asyncio.ensure_future(start())
+            call.add_done_callback(lambda done: self._finish(key, done))
+            self.calls += 1
+        else:
+            self.hits += 1
+        return await asyncio.shield(call)
+
+    def _finish(self, key, done):
+        if self._calls.get(key) is done:
+            del self._calls[key]
+        # Retrieved here so that a call nobody waits on any more is not
+        # reported as an unhandled error
+        if not done.cancelled():
+            done.exception()
+
+    def stats(self):
+        return {
+            "coalesce_hits": self.hits,
+            "coalesce_calls": self.calls,
+            "coalesce_in_flight": len(self._calls),
+        }
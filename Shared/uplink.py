@@ -0,0 +1,211 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# Uplink scheduling for the asyncio relay.
+#
+# Requests waiting for the uplink are kept in a priority queue: operator
+# telecommands go first, then housekeeping polls, then bulk history sync
+# (persisted housekeeping); a batch goes in the class of its most urgent
+# command. Classes come from the READ_ONLY table: any command missing from it
+# is treated as a telecommand, so a new command is never shed or coalesced
+# as a poll until it is listed there. A token bucket paces what leaves the queue at the rate of the COM
+# receive link, so when dashboards saturate the link the backlog builds up in
+# the low-priority classes and a telecommand waits for at most one frame's
+# worth of tokens.
+#
+# The queue holds at most max_depth requests: past that, the least urgent
+# request is shed (answered at once with an overload error), so a burst of
+# polls cannot buffer without limit or push out a telecommand. Relay
+# processes sharing a port each pace their own queue at an equal share of
+# the link rate.
+
+TELECOMMAND = 0
+HOUSEKEEPING = 1
+HISTORY = 2
+PRIORITY_NAMES = ("telecommand", "housekeeping", "history")
+
+# Seconds of link time the bucket can save up
+BURST_SECONDS = 0.5
+
+# Requests waiting for the uplink before the least urgent is shed
+DEFAULT_MAX_DEPTH = 1000
+
+# Class of each (module, command) that only reads satellite state
+READ_ONLY = {
+    ("1", "obc_cmd_boot_count_get_cb"): HOUSEKEEPING,
+    ("1", "obc_cmd_get_masat_state_cb"): HOUSEKEEPING,
+    ("1", "obc_telem_hk_get_cb"): HOUSEKEEPING,
+    ("1", "obc_telem_hk_cmd_get_cb"): HOUSEKEEPING,
+    ("1", "obc_telem_hk_persist_get_cb"): HISTORY,
+    ("2", "cam_cmd_img_list_cb"): HOUSEKEEPING,
+    ("2", "cam_telem_hk_get_cb"): HOUSEKEEPING,
+    ("2", "cam_telem_hk_cmd_get_cb"): HOUSEKEEPING,
+    ("3", "com_cmd_get_config_sys_cb"): HOUSEKEEPING,
+    ("3", "com_cmd_get_config_tx_cb"): HOUSEKEEPING,
+    ("3", "com_cmd_get_config_rx_cb"): HOUSEKEEPING,
+    ("3", "com_telem_hk_get_cb"): HOUSEKEEPING,
+    ("3", "com_telem_hk_cmd_get_cb"): HOUSEKEEPING,
+    ("4", "eps_cmd_get_config1_cb"): HOUSEKEEPING,
+    ("4", "eps_cmd_get_config2_cb"): HOUSEKEEPING,
+    ("4", "eps_cmd_get_config3_cb"): HOUSEKEEPING,
+    ("4", "eps_telem_hk_get_cb"): HOUSEKEEPING,
+    ("4", "eps_telem_hk_persist_get_cb"): HISTORY,
+    ("5", "adcs_cmd_get_state_cb"): HOUSEKEEPING,
+    ("5", "adcs_telem_hk_get_cb"): HOUSEKEEPING,
+    ("5", "adcs_telem_hk_cmd_get_cb"): HOUSEKEEPING,
+}
+
+
+# Priority class of a (station, module, command) request (None when malformed)
+def classify(request):
+    if request is None:
+        return HOUSEKEEPING
+    station, module_num, command = request
+    if module_num == "batch":
+        return min(READ_ONLY.get(item, TELECOMMAND) for item in _batch_items(command))
+    return READ_ONLY.get((module_num, command), TELECOMMAND)
+
+
+# (module, command) pairs of a batch's "module:command;..." list
+def _batch_items(command):
+    return [tuple(item.partition(":")[::2]) for item in command.split(";")]
+
+
+# True for requests that only read satellite state (telemetry and get/list
+# commands, or a batch made of them), which can share one reply
+def is_read_only(request):
+    if request is None:
+        return False
+    station, module_num, command = request
+    if module_num == "batch":
+        return all(item in READ_ONLY for item in _batch_items(command))
+    return (module_num, command) in READ_ONLY
+
+
+# Uplink bytes per second of a COM receive configuration (the "receive_config"
+# reply of com_cmd_get_config_rx_cb): the baudrate, capped by Data_Rate_Mbps
+def link_rate(receive_config):
+    bits_per_second = [
+        value
+        for value in (
+            receive_config.get("Baudrate"),
+            (receive_config.get("Data_Rate_Mbps") or 0) * 1_000_000,
+        )
+        if value
+    ]
+    if not bits_per_second:
+        return None
+    return min(bits_per_second) / 8
+
+
+class TokenBucket:
+    # link_rate in bytes per second (0: unlimited), paced at 1/shares of it
+    def __init__(self, link_rate=0.0, burst_seconds=BURST_SECONDS, shares=1):
+        self.burst_seconds = burst_seconds
+        self.shares = shares
+        self.link_rate = 0.0
+        self.rate = 0.0
+        self.burst = 0.0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.set_rate(link_rate)
+
+    # A bucket that was unlimited starts full
+    def set_rate(self, link_rate):
+        self._refill()
+        limited = bool(self.rate)
+        self.link_rate = link_rate
+        rate = link_rate / self.shares
+        self.rate = rate
+        self.burst = rate * self.burst_seconds
+        self.tokens = min(self.tokens, self.burst) if limited else self.burst
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    # Seconds until size bytes may be sent. A frame larger than the burst goes
+    # once the bucket is full and leaves it in debt.
+    def wait_time(self, size):
+        if not self.rate:
+            return 0.0
+        self._refill()
+        needed = min(size, self.burst)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, size):
+        if self.rate:
+            self.tokens -= size
+
+
+# Strict-priority queue in front of the uplink, driven by the event loop.
+# submit() calls send(queued_seconds) right away when the link is free, or
+# later from a loop timer once the bucket has refilled. A request shed from a
+# full queue gets shed() instead.
+class PriorityScheduler:
+    def __init__(self, bucket, max_depth=DEFAULT_MAX_DEPTH):
+        self.bucket = bucket
+        self.max_depth = max_depth
+        self._queue = []
+        self._order = itertools.count()
+        self._timer = None
+        self.depths = [0] * len(PRIORITY_NAMES)
+        self.shed = 0
+
+    def submit(self, priority, size, send, shed):
+        entry = (priority, next(self._order), size, time.perf_counter(), send, shed)
+        if len(self._queue) >= self.max_depth:
+            # The least urgent, most recent request goes: the new one unless
+            # something less urgent than it is waiting
+            victim = max(self._queue)
+            if victim[0] <= priority:
+                self.shed += 1
+                shed()
+                return
+            self._queue.remove(victim)
+            heapq.heapify(self._queue)
+            self.depths[victim[0]] -= 1
+            self.shed += 1
+            victim[5]()
+        heapq.heappush(self._queue, entry)
+        self.depths[priority] += 1
+        if self._timer is None:
+            self._drain()
+
+    def set_rate(self, rate):
+        self.bucket.set_rate(rate)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._drain()
+
+    def _drain(self):
+        self._timer = None
+        while self._queue:
+            priority, order, size, queued, send, _ = self._queue[0]
+            wait = self.bucket.wait_time(size)
+            if wait > 0:
+                # Re-checked then, so that anything more urgent queued in the
+                # meantime goes first
+                self._timer = asyncio.get_running_loop().call_later(wait, self._drain)
+                return
+            heapq.heappop(self._queue)
+            self.depths[priority] -= 1
+            self.bucket.consume(size)
+            send(time.perf_counter() - queued)
+
+    def stats(self):
+        stats = {
+            f"uplink_queue_{name}": depth
+            for name, depth in zip(PRIORITY_NAMES, self.depths)
+        }
+        stats["uplink_shed"] = self.shed
+        stats["uplink_rate_bytes"] = self.bucket.rate
+        return stats
@@ -0,0 +1,90 @@
+import logging
+import queue
+import threading
+import time
+
+# Fixed set of worker threads fed from a bounded queue, shared by the server
+# and the relay. submit() never blocks: when every worker is busy and the
+# queue is full the task is refused, and the caller answers with an overload
+# reply instead of piling up threads.
+DEFAULT_WORKERS = 32
+DEFAULT_QUEUE_DEPTH = 256
+
+OVERLOAD_ERROR = "Server overloaded"
+
+log = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    def __init__(
+        self, workers=DEFAULT_WORKERS, queue_depth=DEFAULT_QUEUE_DEPTH, name="worker"
+    ):
+        self.workers = workers
+        self.queue_capacity = queue_depth
+        self._tasks = queue.Queue(maxsize=queue_depth)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{name}-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # Queue fn(*args); False when the pool is saturated
+    def submit(self, fn, *args):
+        try:
+            self._tasks.put_nowait((fn, args))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+    def _work(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            fn, args = task
+            with self._lock:
+                self.active += 1
+            try:
+                fn(*args)
+            except Exception as e:
+                log.error("An error occurred: %s", e)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "active_workers": self.active,
+                "queue_depth": self._tasks.qsize(),
+                "queue_capacity": self.queue_capacity,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    # Finish the queued tasks, then stop the workers
+    def shutdown(self):
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+# Print the pool stats every interval seconds from a daemon thread
+def report_stats(pool, interval, label="Worker pool"):
+    def report():
+        while True:
+            time.sleep(interval)
+            stats = pool.stats()
+            log.info("%s: %s", label, stats, extra=stats)
+
+    threading.Thread(target=report, daemon=True).start()